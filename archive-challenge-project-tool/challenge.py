@@ -15,6 +15,8 @@
 #
 ###############################################################################
 
+from __future__ import print_function
+
 import synapseclient
 import synapseclient.utils as utils
 from synapseclient.exceptions import *
@@ -30,13 +32,16 @@ except ImportError:
     from io import StringIO
 
 import argparse
+import hashlib
 import json
 import os
 import re
 import sys
+import threading
 import time
 import traceback
 import uuid
+from multiprocessing.pool import ThreadPool
 
 #Python scripts that are part of the challenge
 import lock
@@ -48,6 +53,12 @@ except Exception as ex1:
 
 import messages
 
+## the REST calls are rate limited and retried when challengeutils is installed
+try:
+    from challengeutils import throttle
+except ImportError:
+    throttle = None
+
 
 # the batch size can be bigger, we do this just to demonstrate batching
 BATCH_SIZE = 20
@@ -55,6 +66,22 @@ BATCH_SIZE = 20
 # how many times to we retry batch uploads of submission annotations
 BATCH_UPLOAD_RETRY_COUNT = 5
 
+# how many submissions are validated at once
+VALIDATE_WORKERS = 4
+
+# how many submissions are archived at once
+ARCHIVE_WORKERS = 4
+
+# team that is given admin access to the archived projects
+ARCHIVE_ADMIN_TEAM = "3324230"
+ARCHIVE_ADMIN_PRIVILEGES = ['DELETE','DOWNLOAD','CREATE','READ','CHANGE_PERMISSIONS','UPDATE','MODERATE','CHANGE_SETTINGS']
+
+# entity types that are walked and fingerprinted in a submitted project
+ARCHIVE_TREE_TYPES = ['folder', 'file', 'table', 'link']
+
+# a queue lock whose holder has not sent a heartbeat for this long is broken
+QUEUE_LOCK_MAX_AGE = timedelta(hours=4)
+
 UUID_REGEX = re.compile('[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
 
 # A module level variable to hold the Synapse connection
@@ -122,67 +149,62 @@ def update_single_submission_status(status, add_annotations, force=False):
     return(status)
 
 
-def validate(evaluation, public=False, admin=None, dry_run=False):
+def get_team_name(teamId):
+    team = syn.restGET('/team/{id}'.format(id=teamId))
+    return team.get('name', teamId)
 
-    if type(evaluation) != Evaluation:
-        evaluation = syn.getEvaluation(evaluation)
 
-    print("\n\nValidating", evaluation.id, evaluation.name)
-    print("-" * 60)
-    sys.stdout.flush()
-    if admin is not None:
-        try:
-            admin = syn.getUserProfile(admin)['userName']
-        except Exception as ex1:
-            admin = syn.getTeam(admin)['name']
-    for submission, status in syn.getSubmissionBundles(evaluation, status='RECEIVED'):
-        ex1 = None #Must define ex1 in case there is no error
-        print("validating", submission.id, submission.name)
-        try:
-            is_valid, validation_message = conf.validate_submission(syn, evaluation, submission, public=public, admin=admin)
-        except Exception as ex1:
-            is_valid = False
-            print("Exception during validation:", type(ex1), ex1, str(ex1))
-            traceback.print_exc()
-            validation_error = ex1
-            validation_message = str(ex1)
+def get_submitter_names(submissions, pool):
+    """
+    Looks up the name of every team and user that submitted, once per team or user
+
+    :returns: dicts mapping team ids to team names and user ids to user names
+    """
+    teamIds = sorted(set(submission.teamId for submission in submissions if 'teamId' in submission))
+    userIds = sorted(set(submission.userId for submission in submissions if 'userId' in submission))
+    teamNames = dict(zip(teamIds, pool.map(get_team_name, teamIds)))
+    userNames = dict(zip(userIds, pool.map(lambda userId: get_user_name(syn.getUserProfile(userId)), userIds)))
+    return teamNames, userNames
+
 
+def store_validated(evaluation, validated, teamNames, userNames, dry_run=False):
+    """
+    Stores the statuses of a batch of validated submissions and sends their messages
+
+    :param validated: list of (submission, status, is_valid, validation_message, validation_error)
+    """
+    updates = []
+    for submission, status, is_valid, validation_message, validation_error in validated:
         addannotations = {}
         #Add team name
         if 'teamId' in submission:
-            team = syn.restGET('/team/{id}'.format(id=submission.teamId))
-            if 'name' in team:
-                addannotations['team'] = team['name']
-            else:
-                addannotations['team'] = submission.teamId
+            addannotations['team'] = teamNames[submission.teamId]
         elif 'userId' in submission:
-            profile = syn.getUserProfile(submission.userId)
-            addannotations['team'] = get_user_name(profile)
+            addannotations['team'] = userNames[submission.userId]
         else:
             addannotations['team'] = '?'
-        status.status = "VALIDATED" if is_valid else "INVALID"
         if not is_valid:
             addannotations["FAILURE_REASON"] = validation_message
         else:
             addannotations["FAILURE_REASON"] = ''
         add_annotations = synapseclient.annotations.to_submission_status_annotations(addannotations,is_private=True)
-        status = update_single_submission_status(status, add_annotations)
+        updates.append((status, add_annotations, "VALIDATED" if is_valid else "INVALID"))
 
-        if not dry_run:
-            status = syn.store(status)
-        ## send message AFTER storing status to ensure we don't get repeat messages
-        profile = syn.getUserProfile(submission.userId)
+    if not dry_run and updates:
+        update_submissions_status_batch(evaluation, updates)
+    ## send messages AFTER storing statuses to ensure we don't get repeat messages
+    for submission, status, is_valid, validation_message, validation_error in validated:
         if is_valid:
             messages.validation_passed(
                 userIds=[submission.userId],
-                username=get_user_name(profile),
+                username=userNames[submission.userId],
                 queue_name=evaluation.name,
                 submission_id=submission.id,
                 submission_name=submission.name)
         else:
-            if isinstance(validation_error, AssertionError):
+            if validation_error is None or isinstance(validation_error, AssertionError):
                 sendTo = [submission.userId]
-                username = get_user_name(profile)
+                username = userNames[submission.userId]
             else:
                 sendTo = conf.ADMIN_USER_IDS
                 username = "Challenge Administrator"
@@ -195,13 +217,291 @@ def validate(evaluation, public=False, admin=None, dry_run=False):
                 submission_name=submission.name,
                 message=validation_message)
 
-def archive(evaluation, stat="VALIDATED", reArchive=False):
+
+def validate(evaluation, public=False, admin=None, dry_run=False, workers=VALIDATE_WORKERS):
+    """
+    Validates the RECEIVED submissions of an evaluation queue.  Submissions are validated
+    by a pool of workers, their statuses are stored in batches and messages are sent in
+    the background by a messages.MessageDispatcher.
+
+    :param evaluation: a synapse evaluation queue or its ID
+    :param public:     submitted projects must be public
+    :param admin:      user or team that submitted projects must be shared with
+    :param dry_run:    don't store statuses
+    :param workers:    how many submissions are validated at once
+    """
+    if type(evaluation) != Evaluation:
+        evaluation = syn.getEvaluation(evaluation)
+
+    print("\n\nValidating", evaluation.id, evaluation.name)
+    print("-" * 60)
+    sys.stdout.flush()
+    if admin is not None:
+        try:
+            admin = syn.getUserProfile(admin)['userName']
+        except Exception as ex1:
+            admin = syn.getTeam(admin)['name']
+
+    def validate_bundle(bundle):
+        submission, status = bundle
+        print("validating", submission.id, submission.name)
+        validation_error = None
+        try:
+            is_valid, validation_message = conf.validate_submission(syn, evaluation, submission, public=public, admin=admin)
+        except Exception as ex1:
+            is_valid = False
+            print("Exception during validation:", type(ex1), ex1, str(ex1))
+            traceback.print_exc()
+            validation_error = ex1
+            validation_message = str(ex1)
+        return submission, status, is_valid, validation_message, validation_error
+
+    bundles = list(syn.getSubmissionBundles(evaluation, status='RECEIVED'))
+    pool = ThreadPool(workers)
+    try:
+        teamNames, userNames = get_submitter_names([submission for submission, status in bundles], pool)
+        ## messages are coalesced and sent in the background
+        with messages.dispatching():
+            validated = []
+            for result in pool.imap(validate_bundle, bundles):
+                validated.append(result)
+                if len(validated) == BATCH_SIZE:
+                    store_validated(evaluation, validated, teamNames, userNames, dry_run)
+                    validated = []
+            store_validated(evaluation, validated, teamNames, userNames, dry_run)
+    finally:
+        pool.close()
+        pool.join()
+
+def apply_status_update(status, add_annotations, newStatus=None):
+    """
+    Sets the status of a submission status and adds annotations to it
+
+    :param newStatus: new status, or None to keep the status
+    """
+    if newStatus is not None:
+        status.status = newStatus
+    return update_single_submission_status(status, add_annotations)
+
+
+def update_submissions_status_batch(evaluation, updates):
+    """
+    Update statuses in batch. This can be much faster than individual updates.
+    When a status changed since it was fetched (412), the statuses are fetched
+    again and the updates applied to them before the batch is retried.
+
+    :param evaluation: a synapse evaluation queue
+    :param updates:    a list of (submission status, annotations to add, new status or None)
+    """
+    statuses = [apply_status_update(*update) for update in updates]
+    for retry in range(BATCH_UPLOAD_RETRY_COUNT):
+        try:
+            token = None
+            offset = 0
+            while offset < len(statuses):
+                batch = {"statuses"     : statuses[offset:offset+BATCH_SIZE],
+                         "isFirstBatch" : (offset==0),
+                         "isLastBatch"  : (offset+BATCH_SIZE>=len(statuses)),
+                         "batchToken"   : token}
+                response = syn.restPUT("/evaluation/%s/statusBatch" % evaluation.id, json.dumps(batch))
+                token = response.get('nextUploadToken', None)
+                offset += BATCH_SIZE
+            return
+        except SynapseHTTPError as err:
+            # on 412 ConflictingUpdateException we want to retry
+            if err.response.status_code == 412 and retry < BATCH_UPLOAD_RETRY_COUNT - 1:
+                sys.stderr.write('%s, fetching the statuses again and retrying...\n' % str(err))
+                time.sleep(2)
+                ## the etags of the statuses are out of date
+                statuses = [apply_status_update(syn.getSubmissionStatus(status.id), add_annotations, newStatus)
+                            for status, add_annotations, newStatus in updates]
+            else:
+                raise
+
+
+class ArchiveProgress(object):
+    """
+    Records the archive project of every submission when it is created and
+    when the copy is done, so that an interrupted archive resumes where it stopped
+    instead of creating new projects.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.submissions = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as progress_file:
+                self.submissions = json.load(progress_file)
+
+    def get(self, submissionId):
+        return self.submissions.get(submissionId)
+
+    def record(self, submissionId, projectId, copied, fingerprint=None):
+        with self._lock:
+            self.submissions[submissionId] = {"project":projectId, "copied":copied, "fingerprint":fingerprint}
+            self._save()
+
+    def remove(self, submissionIds):
+        with self._lock:
+            for submissionId in submissionIds:
+                self.submissions.pop(submissionId, None)
+            if self.submissions:
+                self._save()
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as progress_file:
+            json.dump(self.submissions, progress_file)
+        os.rename(temp_path, self.path)
+
+
+def get_archive_progress_path(evaluation):
+    evaluationId = evaluation.id if isinstance(evaluation, Evaluation) else evaluation
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive_progress_%s.json" % evaluationId)
+
+
+def get_status_annotation(status, key):
+    for annotation in status.get("annotations", dict()).get("stringAnnos", []):
+        if annotation.get("key") == key:
+            return annotation.get("value")
+    return None
+
+
+def get_entity_tree(entityId):
+    """
+    Lists the folders, files, tables and links below an entity
+
+    :param entityId: synapse id of a project or folder
+
+    :returns: dict mapping the path of every entity, relative to entityId, to its
+              id, type, version and md5 (of files only)
+    """
+    tree = {}
+    parents = [(entityId, "")]
+    while parents:
+        parentId, parentPath = parents.pop()
+        for child in syn.getChildren(parentId, includeTypes=ARCHIVE_TREE_TYPES):
+            path = parentPath + "/" + child['name'] if parentPath else child['name']
+            ## org.sagebionetworks.repo.model.FileEntity -> FileEntity
+            entityType = child['type'].split(".")[-1]
+            tree[path] = {"id":child['id'], "type":entityType, "version":child.get('versionNumber'), "md5":None}
+            if entityType == "Folder":
+                parents.append((child['id'], path))
+    for path in tree:
+        if tree[path]["type"] == "FileEntity":
+            tree[path]["md5"] = syn.get(tree[path]["id"], downloadFile=False).md5
+    return tree
+
+
+def get_tree_fingerprint(tree):
+    """
+    Content fingerprint of an entity tree, which changes whenever an entity
+    is added, removed, renamed or gets a new version or file
+    """
+    lines = ["\t".join([path, tree[path]["id"], str(tree[path]["version"]), str(tree[path]["md5"])]) for path in sorted(tree)]
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def sync_archive(sourceTree, archiveId):
+    """
+    Copies the entities of a submitted project that are new or changed since it
+    was archived into the existing archive project, and deletes the archived
+    entities that were removed.  Files are compared by md5, tables and links
+    are only copied when they are missing.
+
+    :param sourceTree: get_entity_tree of the submitted project
+    :param archiveId:  synapse id of the archive project
+
+    :returns: number of entities copied and deleted
+    """
+    archiveTree = get_entity_tree(archiveId)
+    folderIds = {"": archiveId}
+    copied = 0
+    ## parents are sorted before their children
+    for path in sorted(sourceTree, key=lambda path: (path.count("/"), path)):
+        source = sourceTree[path]
+        archived = archiveTree.get(path)
+        parentPath = os.path.dirname(path)
+        if archived is not None and archived["type"] != source["type"]:
+            syn.delete(archived["id"])
+            archived = None
+        if source["type"] == "Folder":
+            if archived is None:
+                archived = {"id":syn.store(synapseclient.Folder(os.path.basename(path), parent=folderIds[parentPath])).id}
+            folderIds[path] = archived["id"]
+        elif archived is None or (source["type"] == "FileEntity" and archived["md5"] != source["md5"]):
+            synu.copy(syn, source["id"], folderIds[parentPath], updateExisting=True, skipCopyWikiPage=True)
+            copied += 1
+    ## removing a folder removes everything in it
+    deleted = 0
+    for path in sorted(archiveTree):
+        if path not in sourceTree and os.path.dirname(path) in folderIds:
+            syn.delete(archiveTree[path]["id"])
+            deleted += 1
+    return copied, deleted
+
+
+def archive_submission(submission, status, progress, reArchive=False):
+    """
+    Copies a submitted project into an archive project.  A submission that was
+    already archived is only copied again when its tree fingerprint changed, and
+    then only its changed entities are copied into the existing archive project.
+
+    :param submission: a synapse submission
+    :param status:     the status of the submission
+    :param progress:   ArchiveProgress of the evaluation queue
+    :param reArchive:  update archives of submissions that are already archived
+
+    :returns: synapse id of the archive project and fingerprint of the submitted
+              tree, or None if the archive is up to date
+    """
+    recorded = progress.get(submission.id)
+    if recorded is not None and recorded["copied"] and recorded.get("fingerprint") is not None:
+        return recorded["project"], recorded["fingerprint"]
+    sourceTree = get_entity_tree(submission.entityId)
+    fingerprint = get_tree_fingerprint(sourceTree)
+    archivedId = get_status_annotation(status, "archived")
+    if recorded is None and reArchive and archivedId is not None:
+        if get_status_annotation(status, "archivedFingerprint") == fingerprint:
+            print(submission.id, "is unchanged since it was archived into", archivedId)
+            return None
+        try:
+            copied, deleted = sync_archive(sourceTree, archivedId)
+            print("Updated archive of %s in %s: %d copied, %d deleted" % (submission.id, archivedId, copied, deleted))
+            progress.record(submission.id, archivedId, copied=True, fingerprint=fingerprint)
+            return archivedId, fingerprint
+        except SynapseHTTPError as err:
+            if err.response is None or err.response.status_code not in (403, 404):
+                raise
+            print("Can't update archive", archivedId, "of", submission.id, "archiving it again:", str(err))
+    if recorded is not None and recorded["copied"]:
+        return recorded["project"], fingerprint
+    if recorded is None:
+        projectEntity = synapseclient.Project('Archived %s %d %s %s' % (submission.name.replace("&","+").replace("'",""),int(round(time.time() * 1000)),submission.id,submission.entityId))
+        entity = syn.store(projectEntity)
+        syn.setPermissions(entity, ARCHIVE_ADMIN_TEAM, ARCHIVE_ADMIN_PRIVILEGES)
+        projectId = entity.id
+        progress.record(submission.id, projectId, copied=False)
+    else:
+        projectId = recorded["project"]
+        print("Resuming archive of", submission.id, "into", projectId)
+    ## updateExisting lets a copy that was interrupted be completed
+    synu.copy(syn, submission.entityId, projectId, updateExisting=True)
+    progress.record(submission.id, projectId, copied=True, fingerprint=fingerprint)
+    return projectId, fingerprint
+
+
+def archive(evaluation, stat="VALIDATED", reArchive=False, workers=ARCHIVE_WORKERS):
     """
     Archive the submissions for the given evaluation queue and store them in the destination synapse folder.
+    Submissions are archived by a pool of workers and the archived annotations are stored in batches.
 
     :param evaluation: a synapse evaluation queue or its ID
-    :param query: a query that will return the desired submissions. At least the ID must be returned.
-                  defaults to _select * from evaluation_[EVAL_ID] where status=="SCORED"_.
+    :param stat:       status of the submissions to archive
+    :param reArchive:  update archives of submissions that changed since they were archived
+    :param workers:    how many submissions are archived at once
     """
     if type(evaluation) != Evaluation:
         evaluation = syn.getEvaluation(evaluation)
@@ -210,36 +510,105 @@ def archive(evaluation, stat="VALIDATED", reArchive=False):
     print("-" * 60)
     sys.stdout.flush()
 
-    for submission, status in syn.getSubmissionBundles(evaluation, status=stat):
-        ## retrieve file into cache and copy it to destination
-        checkIfArchived = filter(lambda x: x.get("key") == "archived", status.annotations['stringAnnos'])
-        if len(list(checkIfArchived))==0 or reArchive:
-            projectEntity = synapseclient.Project('Archived %s %d %s %s' % (submission.name.replace("&","+").replace("'",""),int(round(time.time() * 1000)),submission.id,submission.entityId))
-            entity = syn.store(projectEntity)
-            adminPriv = ['DELETE','DOWNLOAD','CREATE','READ','CHANGE_PERMISSIONS','UPDATE','MODERATE','CHANGE_SETTINGS']
-            syn.setPermissions(entity,"3324230",adminPriv)
-            copied = synu.copy(syn, submission.entityId, entity.id)
-            archived = {"archived":entity.id}
-            status = update_single_submission_status(status, archived)
-            syn.store(status)
+    progress = ArchiveProgress(get_archive_progress_path(evaluation))
+    toArchive = [(submission, status) for submission, status in syn.getSubmissionBundles(evaluation, status=stat)
+                 if reArchive or submission.id in progress.submissions or get_status_annotation(status, "archived") is None]
+    print("Archiving %d submissions" % len(toArchive))
+
+    def archive_bundle(bundle):
+        submission, status = bundle
+        try:
+            return True, archive_submission(submission, status, progress, reArchive)
+        except Exception as ex1:
+            sys.stderr.write("Error archiving %s: %s\n" % (submission.id, str(ex1)))
+            traceback.print_exc()
+            return False, None
+
+    pool = ThreadPool(workers)
+    try:
+        results = pool.map(archive_bundle, toArchive)
+    finally:
+        pool.close()
+        pool.join()
+
+    updates = [(status, {"archived":archived[0], "archivedFingerprint":archived[1]}, None)
+               for (submission, status), (ok, archived) in zip(toArchive, results)
+               if ok and archived is not None]
+    if updates:
+        update_submissions_status_batch(evaluation, updates)
+        progress.remove([status.id for status, add_annotations, newStatus in updates])
+    unchanged = sum(1 for ok, archived in results if ok and archived is None)
+    if unchanged > 0:
+        print("%d submissions are unchanged since they were archived" % unchanged)
+    failed = sum(1 for ok, archived in results if not ok)
+    if failed > 0:
+        raise Exception("%d of %d submissions could not be archived, rerun archive to resume" % (failed, len(toArchive)))
 
 ## ==================================================
 ##  Handlers for commands
 ## ==================================================
+def lock_queue(evaluation):
+    """
+    Acquires the lock of an evaluation queue, so that queues are validated and
+    archived by separate processes at once but no queue by two of them
+
+    :raises lock.LockedException: if another process holds the lock
+    """
+    return lock.acquire_lock_or_fail('challenge_%s' % evaluation, max_age=QUEUE_LOCK_MAX_AGE)
+
+def run_locked(evaluations, func):
+    """
+    Calls func on every evaluation queue whose lock is acquired and skips the others
+
+    :returns: 75, a temporary error according to /usr/include/sysexits.h, if a queue was locked
+    """
+    exitCode = None
+    for evaluation in evaluations:
+        try:
+            queueLock = lock_queue(evaluation)
+        except lock.LockedException as ex1:
+            print("Is the scoring script already running on %s? Can't acquire lock: %s" % (evaluation, str(ex1)))
+            exitCode = 75
+            continue
+        with queueLock:
+            func(evaluation)
+    return exitCode
+
 def command_validate(args):
     # try:
-    for evaluation in args.evaluation:
-        validate(evaluation, public=args.public, admin=args.admin, dry_run=args.dry_run)
+    return run_locked(args.evaluation, lambda evaluation: validate(evaluation, public=args.public, admin=args.admin, dry_run=args.dry_run, workers=args.workers))
     # except:
     #     sys.stderr.write("\nValidate command requires either an evaluation ID or --all to validate all queues in the challenge")
 
 def command_archive(args):
-    archive(args.evaluation, args.status, args.reArchive)
+    return run_locked([args.evaluation], lambda evaluation: archive(evaluation, args.status, args.reArchive, workers=args.workers))
 
 ## ==================================================
 ##  main method
 ## ==================================================
 
+def throttled(synapse):
+    """
+    Rate limits and retries the REST calls of a Synapse connection with the
+    rate shared by all challengeutils processes, if challengeutils is installed
+    """
+    if throttle is None:
+        sys.stderr.write("challengeutils is not installed, REST calls are not rate limited\n")
+        return synapse
+    return throttle.throttled(synapse)
+
+def init_messages(synapse, dry_run=False, send_messages=False, notifications=False, acknowledge_receipt=False):
+    """
+    Sets the Synapse connection of this module and of the messages module
+    """
+    global syn
+    syn = synapse
+    messages.syn = synapse
+    messages.dry_run = dry_run
+    messages.send_messages = send_messages
+    messages.send_notifications = notifications
+    messages.acknowledge_receipt = acknowledge_receipt
+
 def main():
 
     global syn
@@ -261,12 +630,14 @@ def main():
     parser_validate.add_argument("evaluation", metavar="EVALUATION-IDs", nargs='*', default=None)
     parser_validate.add_argument("--admin", metavar="ADMIN", default=None)
     parser_validate.add_argument("--public", action="store_true", default=False)
+    parser_validate.add_argument("--workers", type=int, default=VALIDATE_WORKERS, help="Number of submissions validated at once")
     parser_validate.set_defaults(func=command_validate)
 
     parser_archive = subparsers.add_parser('archive', help="Archive submissions to a challenge")
     parser_archive.add_argument("evaluation", metavar="EVALUATION-ID", default=None)
     parser_archive.add_argument("--status",metavar="STATUS", default="VALIDATED")
     parser_archive.add_argument("--reArchive", action="store_true", default=False)
+    parser_archive.add_argument("--workers", type=int, default=ARCHIVE_WORKERS, help="Number of submissions archived at once")
     parser_archive.set_defaults(func=command_archive)
 
     args = parser.parse_args()
@@ -274,15 +645,9 @@ def main():
     print("\n" * 2, "=" * 75)
     print(datetime.utcnow().isoformat())
 
-    ## Acquire lock, don't run two scoring scripts at once
-    try:
-        update_lock = lock.acquire_lock_or_fail('challenge', max_age=timedelta(hours=4))
-    except lock.LockedException:
-        print("Is the scoring script already running? Can't acquire lock.")
-        # can't acquire lock, so return error code 75 which is a
-        # temporary error according to /usr/include/sysexits.h
-        return 75
-
+    ## Every queue is locked while it is processed, so scripts working on
+    ## different queues run at once
+    exitCode = None
     try:
         syn = synapseclient.Synapse(debug=args.debug)
         if not args.user:
@@ -290,15 +655,11 @@ def main():
         if not args.password:
             args.password = os.environ.get('SYNAPSE_PASSWORD', None)
         syn.login(email=args.user, password=args.password)
+        throttled(syn)
 
-        ## initialize messages
-        messages.syn = syn
-        messages.dry_run = args.dry_run
-        messages.send_messages = args.send_messages
-        messages.send_notifications = args.notifications
-        messages.acknowledge_receipt = args.acknowledge_receipt
+        init_messages(syn, dry_run=args.dry_run, send_messages=args.send_messages, notifications=args.notifications, acknowledge_receipt=args.acknowledge_receipt)
 
-        args.func(args)
+        exitCode = args.func(args)
 
     except Exception as ex1:
         sys.stderr.write('Error in scoring script:\n')
@@ -310,13 +671,11 @@ def main():
         if conf.ADMIN_USER_IDS:
             messages.error_notification(userIds=conf.ADMIN_USER_IDS, message=st.getvalue(), queue_name=args.challengeName)
 
-    finally:
-        update_lock.release()
-
     print("\ndone: ", datetime.utcnow().isoformat())
     print("=" * 75, "\n" * 2)
+    return exitCode
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
 
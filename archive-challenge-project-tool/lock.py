@@ -1,14 +1,20 @@
+from __future__ import print_function
+
 import argparse
 import errno
+import fcntl
 import inspect
 import os
-import shutil
 import sys
+import threading
 import time
 from datetime import timedelta
 
 LOCK_DEFAULT_MAX_AGE = timedelta(hours=2)
 
+# the longest time between two heartbeats of a held lock
+LOCK_MAX_HEARTBEAT_INTERVAL = 60
+
 
 class LockedException(Exception):
     pass
@@ -17,12 +23,26 @@ def acquire_lock_or_fail(name, max_age=LOCK_DEFAULT_MAX_AGE):
     lock = Lock(name, max_age=max_age)
     if lock.acquire():
         return lock
-    raise LockedException("A lock exists named %s who's age is: %s" % (name, unicode(lock.get_age())))
+    raise LockedException("A lock exists named %s held by pid %s whose last heartbeat was %s ago" % (name, lock.get_pid(), str(lock.get_age())))
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        ## EPERM means the process exists but belongs to another user
+        return err.errno == errno.EPERM
+    return True
 
 
 class Lock(object):
     """
-    Implements a lock by making a directory named [lockname].lock
+    Implements a lock by holding an exclusive flock on a file named [lockname].lock
+
+    The kernel releases the flock when the process holding it exits, however it
+    dies.  The file records the pid of the holder and a heartbeat thread touches
+    it while the lock is held, so a lock is broken when its holder is gone or has
+    hung for longer than max_age.
     """
     SUFFIX = 'lock'
 
@@ -30,43 +50,127 @@ class Lock(object):
         self.name = name
         self.held = False
         self.dir = dir if dir else os.path.dirname(os.path.abspath(__file__))
-        self.lock_dir_path = os.path.join(self.dir, ".".join([name, Lock.SUFFIX]))
+        self.lock_file_path = os.path.join(self.dir, ".".join([name, Lock.SUFFIX]))
         self.max_age = max_age
+        self.heartbeat_interval = min(LOCK_MAX_HEARTBEAT_INTERVAL, max_age.total_seconds() / 4.0)
+        self._fd = None
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat = None
 
-    def get_age(self):
-        return timedelta(seconds=time.time() - os.path.getmtime(self.lock_dir_path))
+    def __enter__(self):
+        return self
 
-    def acquire(self, break_old_locks=True):
-        """Try to acquire lock. Return True on success or False otherwise"""
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def get_age(self):
+        """Time since the last heartbeat of the holder of the lock"""
         try:
-            os.makedirs(self.lock_dir_path)
-            self.held = True
-            # Make sure the modification times are correct
-            # On some machines, the modification time could be seconds off
-            os.utime(self.lock_dir_path, (0, time.time()))
+            return timedelta(seconds=time.time() - os.path.getmtime(self.lock_file_path))
         except OSError as err:
-            if err.errno != errno.EEXIST and err.errno != errno.EACCES:
+            if err.errno != errno.ENOENT:
                 raise
-            # already locked...
-            if break_old_locks and self.get_age() > self.max_age:
-                sys.stderr.write("Breaking lock who's age is: %s\n" % self.get_age())
-                self.held = True
-                # Make sure the modification times are correct
-                # On some machines, the modification time could be seconds off
-                os.utime(self.lock_dir_path, (0, time.time()))
-            else:
-                self.held = False
-        return self.held
+            return timedelta(0)
 
-    def release(self):
-        """Release lock or do nothing if lock is not held"""
+    def get_pid(self):
+        """Pid of the holder of the lock or None if it isn't known"""
+        try:
+            with open(self.lock_file_path) as lock_file:
+                return int(lock_file.read().strip())
+        except (IOError, OSError, ValueError):
+            return None
+
+    def is_stale(self):
+        pid = self.get_pid()
+        if pid is not None and not is_process_alive(pid):
+            return True
+        return self.get_age() > self.max_age
+
+    def _try_flock(self):
+        """Try to flock the lock file. Return True on success or False otherwise"""
+        while True:
+            fd = os.open(self.lock_file_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError) as err:
+                os.close(fd)
+                if err.errno not in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                    raise
+                return False
+            ## the file was broken and removed between the open and the flock
+            try:
+                if os.fstat(fd).st_ino == os.stat(self.lock_file_path).st_ino:
+                    break
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+            os.close(fd)
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        os.fsync(fd)
+        self._fd = fd
+        return True
+
+    def _break(self):
+        """Remove the lock file of a stale lock, so the next flock is on a new file"""
+        ## only one process breaks a lock at a time, and checks again that it is stale
+        guard = Lock(self.name + ".break", dir=self.dir, max_age=self.max_age)
+        if not guard._try_flock():
+            return
+        try:
+            if self.is_stale():
+                sys.stderr.write("Breaking lock %s of pid %s whose last heartbeat was %s ago\n" % (self.name, self.get_pid(), str(self.get_age())))
+                try:
+                    os.remove(self.lock_file_path)
+                except OSError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+        finally:
+            guard._unlock(remove=True)
+
+    def _beat(self):
+        while not self._stop_heartbeat.wait(self.heartbeat_interval):
+            try:
+                os.utime(self.lock_file_path, None)
+            except OSError:
+                pass
+
+    def acquire(self, break_old_locks=True):
+        """Try to acquire lock. Return True on success or False otherwise"""
+        if self.held:
+            return True
+        self.held = self._try_flock()
+        if not self.held and break_old_locks and self.is_stale():
+            self._break()
+            self.held = self._try_flock()
         if self.held:
+            os.utime(self.lock_file_path, None)
+            self._stop_heartbeat.clear()
+            self._heartbeat = threading.Thread(target=self._beat, name="heartbeat-%s" % self.name)
+            self._heartbeat.daemon = True
+            self._heartbeat.start()
+        return self.held
+
+    def _unlock(self, remove):
+        if remove:
             try:
-                shutil.rmtree(self.lock_dir_path)
-                self.held = False
+                os.remove(self.lock_file_path)
             except OSError as err:
                 if err.errno != errno.ENOENT:
                     raise
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def release(self):
+        """Release lock or do nothing if lock is not held"""
+        if self.held:
+            self._stop_heartbeat.set()
+            self._heartbeat.join()
+            ## the file is removed while it is still locked, so a process
+            ## waiting to lock it retries on a new file
+            self._unlock(remove=True)
+            self.held = False
 
 
 
@@ -93,7 +197,7 @@ if __name__ == "__main__":
         args = parser.parse_args()
 
         ## get a subset of the dictionary containing just the arguments of func
-        arg_spec = inspect.getargspec(args.func)
+        arg_spec = (getattr(inspect, "getfullargspec", None) or inspect.getargspec)(args.func)
         args_for_func = {k:getattr(args, k) for k in arg_spec.args}
 
         args.func(**args_for_func)
@@ -1,8 +1,16 @@
 ## Messages for challenge scoring script.
 
+from __future__ import print_function
+
 import string
 import sys
+import threading
+import time
 import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from synapseclient.exceptions import SynapseHTTPError
 
 
 ## Module level state. You'll need to set a synapse object at least
@@ -13,6 +21,14 @@ send_notifications = True
 acknowledge_receipt = False
 dry_run = False
 
+## While dispatching, messages to the same recipient within this many
+## seconds are sent as one message
+COALESCE_WINDOW = 30
+## At least this many seconds between two calls to sendMessage
+MESSAGE_INTERVAL = 1.0
+## How many times a throttled or failed sendMessage is retried
+MESSAGE_RETRY_COUNT = 5
+
 
 ## Edit these URLs to point to your challenge and its support forum
 defaults = dict(
@@ -136,11 +152,143 @@ def error_notification(userIds, **kwargs):
                             message_template=error_notification_template,
                             kwargs=kwargs)
 
+class CompiledTemplate(object):
+    """
+    A template parsed once into its literal text and fields, which fills in
+    fields the same way as DefaultingFormatter
+    """
+    def __init__(self, template):
+        self.pieces = list(formatter.parse(template))
+
+    def render(self, kwargs):
+        parts = []
+        for literal, field, format_spec, conversion in self.pieces:
+            parts.append(literal)
+            if field is None:
+                continue
+            value = kwargs.get(field, defaults.get(field, None))
+            if value is None:
+                value = "{{{0}}}".format(field)
+                warnings.warn("Missing template variable %s" % value)
+            parts.append(formatter.format_field(formatter.convert_field(value, conversion), format_spec or ""))
+        return "".join(parts)
+
+_compiled_templates = {}
+
+def compile_template(template):
+    compiled = _compiled_templates.get(template)
+    if compiled is None:
+        compiled = _compiled_templates[template] = CompiledTemplate(template)
+    return compiled
+
+
+class MessageDispatcher(object):
+    """
+    Sends messages from a background thread.  The messages to a recipient in a
+    window of COALESCE_WINDOW seconds are joined into one, and recipients of
+    identical messages get them in a single call to sendMessage.  Calls are
+    spaced by MESSAGE_INTERVAL and retried when Synapse throttles them.
+    """
+    def __init__(self, window=COALESCE_WINDOW):
+        self.window = window
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_sent = 0
+        self._thread = threading.Thread(target=self._run, name="message-dispatcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, userIds, subject, message):
+        with self._lock:
+            for userId in userIds:
+                self._pending.setdefault(userId, []).append((subject, message))
+
+    def _run(self):
+        while not self._stop.wait(self.window):
+            self.flush()
+
+    def close(self):
+        """Sends the pending messages and stops the dispatcher"""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, OrderedDict()
+        recipients = OrderedDict()
+        for userId, queued in pending.items():
+            recipients.setdefault(coalesce(queued), []).append(userId)
+        for (subject, message), userIds in recipients.items():
+            try:
+                self._send(userIds, subject, message)
+            except Exception as ex1:
+                sys.stderr.write("Can't send message to %s: %s\n" % (userIds, str(ex1)))
+
+    def _send(self, userIds, subject, message):
+        for retry in range(MESSAGE_RETRY_COUNT):
+            wait = self._last_sent + MESSAGE_INTERVAL - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_sent = time.time()
+            try:
+                return deliver(userIds, subject, message)
+            except SynapseHTTPError as err:
+                ## retry when throttled (429) or when Synapse is unavailable
+                status_code = err.response.status_code if err.response is not None else None
+                if retry + 1 == MESSAGE_RETRY_COUNT or (status_code is not None and status_code != 429 and status_code < 500):
+                    raise
+                sys.stderr.write('%s, retrying...\n' % str(err))
+                time.sleep(2 ** retry)
+
+
+def coalesce(queued):
+    """
+    Joins the (subject, message) pairs queued for a recipient into one message
+    """
+    if len(queued) == 1:
+        return queued[0]
+    subjects = set(subject for subject, message in queued)
+    if len(subjects) == 1:
+        subject = "%s (%d messages)" % (queued[0][0], len(queued))
+    else:
+        subject = "%d messages from %s" % (len(queued), defaults["scoring_script"])
+    return subject, "\n<hr>\n".join(message for subject, message in queued)
+
+
+dispatcher = None
+
+@contextmanager
+def dispatching(window=COALESCE_WINDOW):
+    """
+    Messages sent in this context are dispatched by a MessageDispatcher, and
+    all of them are sent when it exits.  Nested contexts share the dispatcher.
+    """
+    global dispatcher
+    if dispatcher is not None:
+        yield dispatcher
+        return
+    dispatcher = MessageDispatcher(window)
+    try:
+        yield dispatcher
+    finally:
+        current, dispatcher = dispatcher, None
+        current.close()
+
+
 def send_message(userIds, subject_template, message_template, kwargs):
-    subject = formatter.format(subject_template, **kwargs)
-    message = formatter.format(message_template, **kwargs)
+    subject = compile_template(subject_template).render(kwargs)
+    message = compile_template(message_template).render(kwargs)
+    if dispatcher is not None:
+        dispatcher.put(userIds, subject, message)
+        return None
+    return deliver(userIds, subject, message)
+
+
+def deliver(userIds, subject, message):
     if dry_run:
-        print("\nDry Run: would have sent:")
+        print("\nDry Run: would have sent to %s:" % ", ".join(str(userId) for userId in userIds))
         print(subject)
         print("-" * 60)
         print(message)
@@ -155,6 +303,3 @@ def send_message(userIds, subject_template, message_template, kwargs):
         return response
     else:
         sys.stderr.write("Can't send message. No Synapse object configured\n")
-
-
-
@@ -1,31 +1,150 @@
+from __future__ import print_function
+
 import signal
 import time
 import os
-import subprocess
+import sys
+import json
+import threading
+import traceback
+from datetime import datetime
+
+import synapseclient
+
+import challenge
+import lock
+import messages
+
+# the queue is polled this often while submissions keep coming in
+MIN_POLL_INTERVAL = 60
+# and the interval doubles after every empty poll up to this, so a new
+# submission never waits more than a few minutes to be validated
+MAX_POLL_INTERVAL = 300
+
+# VALIDATED submissions that were not archived, because an archive run failed
+# or was interrupted, are archived again at least this often
+ARCHIVE_INTERVAL = 3600
+
+# every cycle appends a line of latency metrics to this file
+METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scheduler_metrics.jsonl")
 
 class GracefulKiller:
     kill_now = False
     def __init__(self):
+        self.killed = threading.Event()
         signal.signal(signal.SIGINT, self.exit_gracefully)
         signal.signal(signal.SIGTERM, self.exit_gracefully)
 
     def exit_gracefully(self,signum, frame):
         self.kill_now = True
+        self.killed.set()
+
+    def sleep(self, seconds):
+        """Sleeps until the timeout or until the program is killed"""
+        self.killed.wait(seconds)
+
+
+def count_received(syn, evaluationId):
+    """
+    Counts the RECEIVED submissions of a queue with a single cheap request
+    """
+    response = syn.restGET("/evaluation/%s/submission/status/all?status=RECEIVED&limit=1&offset=0" % evaluationId)
+    return response.get("totalNumberOfResults", len(response.get("results", [])))
+
+
+def next_poll_interval(interval, received):
+    """Polls again soon after work was found and backs off while the queue is empty"""
+    if received > 0:
+        return MIN_POLL_INTERVAL
+    return min(MAX_POLL_INTERVAL, interval * 2)
+
+
+def archive_due(evaluationId, received, lastArchive):
+    """
+    Archives after new submissions were validated, when an interrupted archive
+    left its progress file behind and otherwise every ARCHIVE_INTERVAL seconds
+    so that VALIDATED submissions that failed to archive are retried
+    """
+    if received > 0 or lastArchive is None:
+        return True
+    if os.path.exists(challenge.get_archive_progress_path(evaluationId)):
+        return True
+    return time.time() - lastArchive >= ARCHIVE_INTERVAL
+
+
+def write_metrics(metrics, path=METRICS_PATH):
+    print("cycle metrics:", json.dumps(metrics, sort_keys=True))
+    with open(path, "a") as metrics_file:
+        metrics_file.write(json.dumps(metrics, sort_keys=True) + "\n")
+
+
+def run_cycle(syn, evaluationId, admin, lastArchive=None):
+    """
+    Validates the submissions of a queue if it has new submissions and archives
+    them when archive_due
+
+    :param lastArchive: time of the last archive run, None if there was none
+
+    :returns: dict of the number of received submissions, whether they were
+              archived and the seconds spent polling, validating and archiving
+    """
+    metrics = {"start": datetime.utcnow().isoformat(), "evaluation": evaluationId,
+               "received": 0, "archived": False, "poll_seconds": 0, "validate_seconds": 0, "archive_seconds": 0}
+    started = time.time()
+    metrics["received"] = count_received(syn, evaluationId)
+    metrics["poll_seconds"] = time.time() - started
+    if archive_due(evaluationId, metrics["received"], lastArchive):
+        try:
+            queueLock = challenge.lock_queue(evaluationId)
+        except lock.LockedException as ex1:
+            print("Queue %s is locked, skipping this cycle: %s" % (evaluationId, str(ex1)))
+            metrics["locked"] = True
+            return metrics
+        with queueLock:
+            if metrics["received"] > 0:
+                started = time.time()
+                challenge.validate(evaluationId, admin=admin)
+                metrics["validate_seconds"] = time.time() - started
+            started = time.time()
+            ## a failed archive is retried by the next cycle because its progress file is kept
+            metrics["archived"] = True
+            challenge.archive(evaluationId)
+            metrics["archive_seconds"] = time.time() - started
+    return metrics
+
 
 if __name__ == '__main__':
     killer = GracefulKiller()
-    while True:
-        synUser = os.environ['SYNAPSE_USERNAME']
-        synPass = os.environ['SYNAPSE_PASSWORD']
-        chalName = os.environ['CHALLENGE_NAME']
-
-        validateSub = ['python','challenge.py','--challengeName',chalName,'-u',synUser,'-p',synPass,'--send-messages','--notifications','--acknowledge-receipt','validate','9603284','--admin','3336298']
-        archiveSub = ['python','challenge.py','--challengeName',chalName,'-u',synUser,'-p',synPass,'--notifications','archive','9603284']
+    synUser = os.environ['SYNAPSE_USERNAME']
+    synPass = os.environ['SYNAPSE_PASSWORD']
+    chalName = os.environ['CHALLENGE_NAME']
+    evaluationId = os.environ.get('EVALUATION_ID', '9603284')
+    admin = os.environ.get('VALIDATION_ADMIN', '3336298')
 
-        subprocess.call(validateSub, stderr=subprocess.STDOUT)
-        subprocess.call(archiveSub, stderr=subprocess.STDOUT)
+    ## one session is kept for the life of the scheduler
+    syn = synapseclient.Synapse()
+    syn.login(email=synUser, password=synPass)
+    challenge.throttled(syn)
+    challenge.init_messages(syn, send_messages=True, notifications=True, acknowledge_receipt=True)
 
-        time.sleep(43200)
-        if killer.kill_now:
-            break
-    print("End of the program. I was killed gracefully :)")
\ No newline at end of file
+    interval = MIN_POLL_INTERVAL
+    lastArchive = None
+    while not killer.kill_now:
+        started = time.time()
+        try:
+            metrics = run_cycle(syn, evaluationId, admin, lastArchive)
+            if metrics["archived"]:
+                lastArchive = started
+        except Exception as ex1:
+            sys.stderr.write('Error in scheduler cycle:\n')
+            traceback.print_exc()
+            if challenge.conf.ADMIN_USER_IDS:
+                messages.error_notification(userIds=challenge.conf.ADMIN_USER_IDS, message=traceback.format_exc(), queue_name=chalName)
+            metrics = {"start": datetime.utcfromtimestamp(started).isoformat(), "evaluation": evaluationId, "received": 0, "error": str(ex1)}
+        interval = next_poll_interval(interval, metrics["received"])
+        metrics["cycle_seconds"] = time.time() - started
+        metrics["next_poll_seconds"] = interval
+        write_metrics(metrics)
+        sys.stdout.flush()
+        killer.sleep(interval)
+    print("End of the program. I was killed gracefully :)")
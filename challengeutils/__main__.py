@@ -1,24 +1,59 @@
+'''
+Command line interface.  Command modules, pandas and synapseclient are
+imported by the commands that use them, so that a command only pays for
+its own imports.
+'''
 import argparse
-import pandas as pd
-import synapseclient
-from . import createchallenge
-from . import mirrorwiki
-from . import utils
-from . import writeup_attacher
-from . import permissions
-from . import download_current_lead_submission as dl_cur
+import json
+import logging
+import math
+import time
+from . import throttle
+from .submission_cache import SUBMISSION_CACHE_DIR
+logger = logging.getLogger(__name__)
+
+# Metrics of bootstrap.METRICS, listed here so the parser doesn't
+# import numpy and pandas
+BOOTSTRAP_METRICS = ['mae', 'pearson', 'rmse', 'spearman']
 
 
 def command_mirrorwiki(syn, args):
-    mirrorwiki.mirrorwiki(
-        syn, args.entityid, args.destinationid, args.forceupdate)
+    from . import mirrorwiki
+    if len(args.destinationid) == 1:
+        mirrorwiki.mirrorwiki(
+            syn, args.entityid, args.destinationid[0], args.forceupdate,
+            manifest_path=args.manifest)
+    else:
+        if args.manifest is not None:
+            raise ValueError(
+                "--manifest can only be used with one destinationid")
+        report = mirrorwiki.mirrorwiki_to_destinations(
+            syn, args.entityid, args.destinationid, args.forceupdate)
+        for destination in args.destinationid:
+            result = report[destination]
+            if result['status'] == 'success':
+                print("{}: success ({} pages)".format(
+                    destination, len(result['updated'])))
+            else:
+                print("{}: failure ({})".format(
+                    destination, result['error']))
+        if any(result['status'] != 'success'
+               for result in report.values()):
+            raise ValueError("Mirroring failed for some destinations")
 
 
 def command_createchallenge(syn, args):
-    createchallenge.createchallenge(syn, args.challengename, args.livesiteid)
+    from . import createchallenge
+    report = createchallenge.createchallenge(
+        syn, args.challengename, args.livesiteid)
+    if args.report is not None:
+        with open(args.report, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
 
 
 def command_query(syn, args):
+    import pandas as pd
+    from . import utils
     querydf = pd.DataFrame(list(utils.evaluation_queue_query(
         syn, args.uri, args.limit, args.offset)))
     if args.outputfile is not None:
@@ -28,15 +63,21 @@ def command_query(syn, args):
 
 
 def command_change_status(syn, args):
+    from . import utils
     print(utils.change_submission_status(syn, args.submissionid, args.status))
 
 
 def command_writeup_attach(syn, args):
-    writeup_attacher.attach_writeup(
+    from . import writeup_attacher
+    summary = writeup_attacher.attach_writeup(
         syn, args.writeupqueue, args.submissionqueue)
+    print("attached: {}, unchanged: {}, no writeup: {}".format(
+        len(summary['attached']), len(summary['unchanged']),
+        len(summary['no_writeup'])))
 
 
 def command_set_entity_acl(syn, args):
+    from . import permissions
     permissions.set_entity_permissions(
         syn, args.entityid,
         principalid=args.principalid,
@@ -44,19 +85,142 @@ def command_set_entity_acl(syn, args):
 
 
 def command_set_evaluation_acl(syn, args):
+    from . import permissions
     permissions.set_evaluation_permissions(
         syn, args.evaluationid,
         principalid=args.principalid,
         permission_level=args.permission_level)
 
 
+def command_set_bulk_acl(syn, args):
+    from . import permissions
+    with open(args.aclfile, 'r') as acl_file:
+        object_permissions = json.load(acl_file)
+    results = permissions.set_bulk_permissions(
+        syn, object_permissions, dry_run=args.dry_run,
+        max_workers=args.max_workers)
+    for objectid in sorted(results):
+        if results[objectid]['error'] is not None:
+            print("{}: failure ({})".format(
+                objectid, results[objectid]['error']))
+        for change in results[objectid]['diff']:
+            print("{} {}: {} -> {}".format(
+                objectid, change['principalId'],
+                ",".join(change['before']) or "-",
+                ",".join(change['after']) or "-"))
+
+
+def command_acl_snapshot(syn, args):
+    from . import acl_snapshot
+    snapshot = acl_snapshot.export_acl_snapshot(syn, args.projectids)
+    snapshot.save(args.outputfile)
+
+
+def command_acl_audit(syn, args):
+    import pandas as pd
+    from . import acl_snapshot
+    snapshot = acl_snapshot.AclSnapshot.load(args.snapshot)
+    reportdf = pd.DataFrame(snapshot.audit())
+    if args.outputfile is not None:
+        reportdf.to_csv(args.outputfile, index=False)
+    else:
+        print(reportdf.to_csv(index=False))
+
+
+def command_acl_check(syn, args):
+    import pandas as pd
+    from . import acl_snapshot
+    snapshot = acl_snapshot.AclSnapshot.load(args.snapshot)
+    checks = snapshot.check_permissions(
+        args.userids, args.objectids, args.access_type)
+    checkdf = pd.DataFrame(checks)
+    checkdf.index.name = 'userId'
+    print(checkdf.to_csv())
+
+
 def command_dl_cur_lead_sub(syn, args):
-    dl_cur.download_current_lead_sub(
-        syn,
-        args.submissionid,
-        args.status,
-        args.cutoff_annotation,
-        verbose=args.verbose)
+    import pandas as pd
+    from . import download_current_lead_submission as dl_cur
+    if args.evaluationid is not None:
+        leads = dl_cur.get_current_lead_subs(
+            syn,
+            args.evaluationid,
+            args.cutoff_annotation,
+            status=args.status,
+            index_path=args.index)
+        leadsdf = pd.DataFrame(
+            leads, columns=['submissionId', 'submitterId', 'leadSubmissionId'])
+        print(leadsdf.to_csv(index=False))
+    else:
+        path = dl_cur.download_current_lead_sub(
+            syn,
+            args.submissionid,
+            args.status,
+            args.cutoff_annotation,
+            verbose=args.verbose,
+            index_path=args.index,
+            cache_dir=args.cache_dir,
+            overwrite=args.overwrite)
+        # An existing previous_submission.csv is kept without --overwrite,
+        # so the file is printed for the next step of a pipeline
+        if path is not None:
+            print(path)
+
+
+def command_compare_lead_sub(syn, args):
+    from . import bootstrap
+    result = bootstrap.compare_to_lead_submission(
+        args.currentfile,
+        args.previousfile,
+        args.goldstandard,
+        args.id_col,
+        args.pred_col,
+        args.gold_col,
+        metric=args.metric,
+        num_bootstraps=args.num_bootstraps,
+        bayes_cutoff=args.bayes_cutoff,
+        seed=args.seed)
+    # inf and nan aren't valid json, they are printed as "inf" and "nan"
+    print(json.dumps({key: str(value) if isinstance(value, float) and
+                      not math.isfinite(value) else value
+                      for key, value in result.items()}, allow_nan=False))
+
+
+def command_docker_stats(syn, args):
+    from . import docker_stats
+    config = docker_stats.load_config(args.config)
+    submissionsdf = docker_stats.get_docker_submission_stats(
+        syn, config, max_workers=args.max_workers)
+    statsdf = docker_stats.summarize_docker_stats(submissionsdf)
+    if args.submissions_file is not None:
+        submissionsdf.to_csv(args.submissions_file, index=False,
+                             encoding='utf-8')
+    if args.outputfile is not None:
+        statsdf.to_csv(args.outputfile, index=False)
+    else:
+        print(statsdf.to_csv(index=False))
+
+
+def command_landscape_stats(syn, args):
+    from . import landscape_stats
+    tableid = args.tableid
+    if tableid is None:
+        tableid = landscape_stats.LANDSCAPE_TABLE
+    statsdf = landscape_stats.get_landscape_table_stats(
+        syn, tableid, max_workers=args.max_workers)
+    statsdf.to_csv(args.outputfile, index=False, sep='\t', encoding='utf-8')
+
+
+def command_batch(syn, args):
+    from . import batch
+    commands = batch.load_manifest(args.manifest)
+    results = batch.run_batch(syn, commands, build_parser(),
+                              max_workers=args.max_workers)
+    failed = [result['line'] for result in results
+              if result['status'] != 'success']
+    if failed:
+        raise ValueError("{} of {} commands failed, lines: {}".format(
+            len(failed), len(results), ",".join(map(str, failed))))
 
 
 def build_parser():
@@ -72,8 +236,44 @@ def build_parser():
     '''
     parser.add_argument(
         "-c", "--synapse_config",
-        default=synapseclient.client.CONFIG_FILE,
-        help="credentials file")
+        default=None,
+        help="credentials file. Default is ~/.synapseConfig")
+    parser.add_argument(
+        "--profile",
+        action='store_true',
+        help=("Log the calls, retried responses, latency and bytes "
+              "transferred of every REST endpoint after the command"))
+    parser.add_argument(
+        "--profile_file",
+        default=None,
+        help=("Json file to write the REST profile, with latency "
+              "histograms, to. Implies --profile"))
+    parser.add_argument(
+        "--profile_cpu",
+        action='store_true',
+        help=("Log the functions that took the most CPU time with cProfile. "
+              "Implies --profile"))
+    parser.add_argument(
+        "--profile_memory",
+        action='store_true',
+        help=("Log the lines that allocated the most memory with "
+              "tracemalloc. Implies --profile"))
+    parser.add_argument(
+        "--rate_limit",
+        type=float,
+        default=throttle.DEFAULT_RATE,
+        help=("Maximum REST calls per second, shared by all the commands "
+              "that use the same --rate_limit_file. 0 for no limit. "
+              "Default is %(default)s"))
+    parser.add_argument(
+        "--rate_limit_file",
+        default=throttle.RATE_LIMIT_FILE,
+        help="Default is %(default)s")
+    parser.add_argument(
+        "--force_login",
+        action='store_true',
+        help=("Log in with the credentials file instead of the session "
+              "cached by the last login"))
 
     subparsers = parser.add_subparsers(
         title='commands',
@@ -90,6 +290,10 @@ def build_parser():
         "--livesiteid",
         help=("Option to specify the live site synapse Id"
               " there is already a live site"))
+    parser_createChallenge.add_argument(
+        "--report",
+        help=("Json file to write the provisioning report with the created"
+              " ids and the timing of each step to"))
     parser_createChallenge.set_defaults(func=command_createchallenge)
 
     parser_mirrorWiki = subparsers.add_parser(
@@ -106,12 +310,21 @@ def build_parser():
     parser_mirrorWiki.add_argument(
         "destinationid",
         type=str,
+        nargs='+',
         help=('Synapse Id of project whose wiki you want to update'
-              ' with the entityid'))
+              ' with the entityid. Specify several ids to mirror the'
+              ' wiki to many projects at once'))
     parser_mirrorWiki.add_argument(
         "--forceupdate",
         action='store_true',
         help='Update the wikipages even if they are the same')
+    parser_mirrorWiki.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help=('Json file recording the state of each page from the last '
+              'successful mirror. Only pages that changed since then are '
+              'downloaded and updated'))
     parser_mirrorWiki.set_defaults(func=command_mirrorwiki)
 
     parser_query = subparsers.add_parser(
@@ -210,15 +423,117 @@ def build_parser():
 
     parser_set_evaluation_acl.set_defaults(func=command_set_evaluation_acl)
 
+    parser_set_bulk_acl = subparsers.add_parser(
+        'setbulkacl',
+        help=('Sets the permissions of many users or teams on many Synapse '
+              'Entities and Evaluation Queues'))
+
+    parser_set_bulk_acl.add_argument(
+        "aclfile",
+        type=str,
+        help=('Json file mapping Synapse ids or evaluation ids to a mapping '
+              'of user or team name/id to permission level. '
+              'ie. {"syn123": {"3324230": "admin"}}'))
+
+    parser_set_bulk_acl.add_argument(
+        "--dry_run",
+        action='store_true',
+        help='Print the permission changes without storing them')
+
+    parser_set_bulk_acl.add_argument(
+        "--max_workers",
+        type=int,
+        default=5,
+        help='Maximum number of ACLs updated at once')
+
+    parser_set_bulk_acl.set_defaults(func=command_set_bulk_acl)
+
+    parser_acl_snapshot = subparsers.add_parser(
+        'aclsnapshot',
+        help=("Exports the ACLs of a challenge's projects, folders and "
+              "evaluation queues and the members of the teams in them"))
+
+    parser_acl_snapshot.add_argument(
+        "projectids",
+        type=str,
+        nargs='+',
+        help='Synapse project ids of the challenge')
+
+    parser_acl_snapshot.add_argument(
+        "--outputfile",
+        type=str,
+        default="acl_snapshot.json",
+        help='File to write the ACL snapshot to')
+
+    parser_acl_snapshot.set_defaults(func=command_acl_snapshot)
+
+    parser_acl_audit = subparsers.add_parser(
+        'aclaudit',
+        help='Reports who has access to every object of an ACL snapshot')
+
+    parser_acl_audit.add_argument(
+        "snapshot",
+        type=str,
+        help='ACL snapshot file created by aclsnapshot')
+
+    parser_acl_audit.add_argument(
+        "--outputfile",
+        type=str,
+        default=None,
+        help="File that you want the report to be written to."
+             "If not specified, it is written as stdout.")
+
+    parser_acl_audit.set_defaults(func=command_acl_audit)
+
+    parser_acl_check = subparsers.add_parser(
+        'aclcheck',
+        help=('Checks whether users have an access type on objects of an '
+              'ACL snapshot'))
+
+    parser_acl_check.add_argument(
+        "snapshot",
+        type=str,
+        help='ACL snapshot file created by aclsnapshot')
+
+    parser_acl_check.add_argument(
+        "--userids",
+        type=str,
+        nargs='+',
+        required=True,
+        help='Synapse user ids')
+
+    parser_acl_check.add_argument(
+        "--objectids",
+        type=str,
+        nargs='+',
+        required=True,
+        help='Synapse ids or evaluation ids')
+
+    parser_acl_check.add_argument(
+        "--access_type",
+        type=str,
+        default='DOWNLOAD',
+        help='Access type such as READ or DOWNLOAD')
+
+    parser_acl_check.set_defaults(func=command_acl_check)
+
     parser_dl_cur_lead_sub = subparsers.add_parser(
         'download_current_lead_submission',
         help='Downloads current leading submission for participant')
 
-    parser_dl_cur_lead_sub.add_argument(
+    dl_cur_lead_sub_group = \
+        parser_dl_cur_lead_sub.add_mutually_exclusive_group(required=True)
+
+    dl_cur_lead_sub_group.add_argument(
         "-i", "--submissionid",
-        required=True,
         help="Int, or str(int) for submissionid, of current submission.")
 
+    dl_cur_lead_sub_group.add_argument(
+        "-e", "--evaluationid",
+        help=("Evaluation queue id. Prints the lead submission of the "
+              "submitter of every submission with --status instead of "
+              "downloading one"))
+
     parser_dl_cur_lead_sub.add_argument(
         "-s", "--status",
         required=True,
@@ -232,8 +547,158 @@ def build_parser():
         "-v", "--verbose",
         action='store_false')
 
+    parser_dl_cur_lead_sub.add_argument(
+        "--index",
+        default=None,
+        help=("Json file to keep the lead submission of each submitter of "
+              "the queue in. Only submissions modified since the last run "
+              "are queried"))
+
+    parser_dl_cur_lead_sub.add_argument(
+        "--cache_dir",
+        default=SUBMISSION_CACHE_DIR,
+        help=("Directory of the submission file cache. Submission files "
+              "are downloaded once and served from the cache afterwards. "
+              "Default is %(default)s"))
+
+    parser_dl_cur_lead_sub.add_argument(
+        "--overwrite",
+        action="store_true",
+        help=("Overwrite an existing previous_submission.csv instead of "
+              "writing previous_submission(1).csv... The path of the "
+              "downloaded file is printed either way"))
+
     parser_dl_cur_lead_sub.set_defaults(func=command_dl_cur_lead_sub)
 
+    parser_compare_lead_sub = subparsers.add_parser(
+        'compare_lead_submission',
+        help=('Bootstraps a submission and the lead submission of the '
+              'submitter and prints the Bayes factor and met_cutoff'))
+
+    parser_compare_lead_sub.add_argument(
+        "currentfile",
+        help="Prediction file of the current submission")
+
+    parser_compare_lead_sub.add_argument(
+        "goldstandard",
+        help="Gold standard file")
+
+    parser_compare_lead_sub.add_argument(
+        "--previousfile",
+        default=None,
+        help=("Prediction file of the lead submission, such as the "
+              "previous_submission.csv of download_current_lead_submission. "
+              "met_cutoff is true without it"))
+
+    parser_compare_lead_sub.add_argument(
+        "--id_col",
+        required=True,
+        help="Column that identifies a row in all the files")
+
+    parser_compare_lead_sub.add_argument(
+        "--pred_col",
+        required=True,
+        help="Prediction column of the submissions")
+
+    parser_compare_lead_sub.add_argument(
+        "--gold_col",
+        required=True,
+        help="Gold standard column")
+
+    parser_compare_lead_sub.add_argument(
+        "--metric",
+        default="spearman",
+        choices=BOOTSTRAP_METRICS)
+
+    parser_compare_lead_sub.add_argument(
+        "--num_bootstraps",
+        type=int,
+        default=1000)
+
+    parser_compare_lead_sub.add_argument(
+        "--bayes_cutoff",
+        type=float,
+        default=3,
+        help="Bayes factor needed to become the lead submission")
+
+    parser_compare_lead_sub.add_argument(
+        "--seed",
+        type=int,
+        default=None)
+
+    parser_compare_lead_sub.set_defaults(func=command_compare_lead_sub)
+
+    parser_docker_stats = subparsers.add_parser(
+        'dockerstats',
+        help=('Gets the runtime statistics of docker challenge submissions '
+              'per challenge, sub challenge and round'))
+
+    parser_docker_stats.add_argument(
+        "config",
+        help=("YAML or JSON file of the challenges, their queues and "
+              "round windows"))
+
+    parser_docker_stats.add_argument(
+        "--submissions_file",
+        default=None,
+        help="CSV file to write the runtime of every submission to")
+
+    parser_docker_stats.add_argument(
+        "--outputfile",
+        default=None,
+        help="CSV file to write the statistics to. Default prints them")
+
+    parser_docker_stats.add_argument(
+        "--max_workers",
+        type=int,
+        default=4,
+        help="Maximum number of queues fetched at once")
+
+    parser_docker_stats.set_defaults(func=command_docker_stats)
+
+    parser_landscape_stats = subparsers.add_parser(
+        'landscapestats',
+        help=('Gets the teams, users and user locations of the challenges '
+              'in the challenge landscape table'))
+
+    parser_landscape_stats.add_argument(
+        "--tableid",
+        default=None,
+        help=("Table with the challenge, participants, preregistrants and "
+              "year columns. Default is the challenge landscape table"))
+
+    parser_landscape_stats.add_argument(
+        "--outputfile",
+        default="challenge_stats.tsv",
+        help="Default is %(default)s")
+
+    parser_landscape_stats.add_argument(
+        "--max_workers",
+        type=int,
+        default=8,
+        help="Maximum number of teams fetched at once")
+
+    parser_landscape_stats.set_defaults(func=command_landscape_stats)
+
+    parser_batch = subparsers.add_parser(
+        'batch',
+        help=('Runs the commands of a manifest in one session, in parallel '
+              'when they change different objects'))
+
+    parser_batch.add_argument(
+        "manifest",
+        help=("JSONL or YAML (.yaml, .yml) file of commands, each a list of "
+              "arguments such as [\"changestatus\", \"9612345\", "
+              "\"SCORED\"]"))
+
+    parser_batch.add_argument(
+        "--max_workers",
+        type=int,
+        default=4,
+        help="Maximum number of commands run at once")
+
+    parser_batch.set_defaults(func=command_batch)
+
     return parser
 
 
@@ -245,19 +710,55 @@ def perform_main(syn, args):
             raise
 
 
-def synapse_login(synapse_config):
-    try:
-        syn = synapseclient.login(silent=True)
-    except Exception:
-        syn = synapseclient.Synapse(configPath=synapse_config, silent=True)
-        syn.login()
-    return(syn)
+def synapse_login(synapse_config=None, force=False):
+    '''
+    Logs in with the cached session or the Synapse config file
+
+    Returns:
+        tuple of the Synapse object and whether the cached session was used
+    '''
+    from . import login_cache
+    return(login_cache.cached_login(synapse_config, force=force))
 
 
 def main():
+    logging.basicConfig(level=logging.INFO)
     args = build_parser().parse_args()
-    syn = synapse_login(args.synapse_config)
-    perform_main(syn, args)
+    start = time.time()
+    syn, cached = synapse_login(args.synapse_config,
+                                force=args.force_login)
+    login_time = time.time() - start
+    profiler = None
+    if args.profile or args.profile_file is not None or \
+            args.profile_cpu or args.profile_memory:
+        from . import profiling
+        profiler = profiling.RestProfiler()
+        profiler.install(syn)
+    # Installed after the profiler, which then records every retry
+    throttle.throttled(syn, rate=args.rate_limit, path=args.rate_limit_file)
+    start = time.time()
+    try:
+        if profiler is None:
+            perform_main(syn, args)
+        else:
+            with profiling.profile_command(cpu=args.profile_cpu,
+                                           memory=args.profile_memory):
+                perform_main(syn, args)
+    except Exception as err:
+        # The cached credentials were revoked
+        response = getattr(err, 'response', None)
+        if cached and getattr(response, 'status_code', None) == 401:
+            from . import login_cache
+            login_cache.clear_session()
+        raise
+    finally:
+        logger.info("login: {:.2f}s ({}), command: {:.2f}s".format(
+            login_time, "cached session" if cached else "full login",
+            time.time() - start))
+        if profiler is not None:
+            logger.info("REST calls:\n{}".format(profiler.format_table()))
+            if args.profile_file is not None:
+                profiler.write_json(args.profile_file)
 
 
 if __name__ == "__main__":
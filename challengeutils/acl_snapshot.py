@@ -0,0 +1,325 @@
+'''
+Exports the ACLs of a challenge's projects, folders and evaluation queues
+along with the memberships of the teams in them into a local snapshot.
+Effective permissions are then evaluated locally instead of calling
+syn.getPermissions once per user.
+'''
+import concurrent.futures
+import json
+import logging
+import time
+import synapseclient
+from . import permissions
+logger = logging.getLogger(__name__)
+
+# Principals that grant access to everybody (PUBLIC) or every logged in user
+EVERYONE_PRINCIPALS = [str(synapseclient.PUBLIC),
+                       str(synapseclient.AUTHENTICATED_USERS)]
+
+
+def _get_folders(syn, projectid):
+    '''
+    Helper function to get all the folders of a project
+
+    Args:
+        syn: Synapse object
+        projectid: Synapse project id
+
+    Returns:
+        List of folder entity headers
+    '''
+    folders = []
+    parents = [projectid]
+    while parents:
+        children = [
+            child for parent in parents
+            for child in syn.getChildren(parent, includeTypes=['folder'])]
+        folders.extend(children)
+        parents = [child['id'] for child in children]
+    return(folders)
+
+
+def _get_entity_benefactor(syn, header):
+    '''
+    Helper function to get the benefactor of an entity.  The benefactor is
+    part of the entity header when Synapse returns it.
+    '''
+    if header.get('benefactorId') is not None:
+        return("syn%s" % header['benefactorId']
+               if str(header['benefactorId']).isdigit()
+               else header['benefactorId'])
+    return(syn.restGET('/entity/%s/benefactor' % header['id'])['id'])
+
+
+def _get_acl(syn, objectid):
+    '''
+    Helper function to get the ACL of an entity or evaluation as a dict
+    mapping principal id to access types
+    '''
+    if synapseclient.utils.is_synapse_id(objectid):
+        acl = syn.restGET('/entity/%s/acl' % objectid)
+    else:
+        acl = syn.restGET('/evaluation/%s/acl' % objectid)
+    return({str(resource['principalId']): sorted(resource['accessType'])
+            for resource in acl['resourceAccess']})
+
+
+def _get_principals(syn, principalids):
+    '''
+    Helper function to get the name of users and teams and whether
+    they are individuals
+    '''
+    principals = {}
+    principalids = list(principalids)
+    # The batch endpoint accepts at most 100 ids
+    for start in range(0, len(principalids), 100):
+        batch = principalids[start:start + 100]
+        headers = syn.restGET(
+            '/userGroupHeaders/batch?ids=%s' % ",".join(batch))
+        for header in headers['children']:
+            principals[str(header['ownerId'])] = {
+                'name': header.get('userName'),
+                'isIndividual': header.get('isIndividual', True)}
+    return(principals)
+
+
+def _get_team_memberids(syn, teamid):
+    return([str(member['member']['ownerId'])
+            for member in syn.getTeamMembers(teamid)])
+
+
+class AclSnapshot(object):
+    '''
+    Local index of the ACLs of Synapse objects and the members of the
+    teams in them.
+
+    Args:
+        objects: dict mapping object id to its type, name and benefactor
+        acls: dict mapping benefactor id to a dict of principal id
+              to access types
+        principals: dict mapping principal id to its name and whether
+                    it is an individual
+        teams: dict mapping team id to a list of member ids
+        created: Epoch time of the snapshot
+    '''
+    def __init__(self, objects, acls, principals, teams, created=None):
+        self.objects = objects
+        self.acls = acls
+        self.principals = principals
+        self.teams = teams
+        self.created = created if created is not None else time.time()
+        # Inverted index of user to the teams they are a member of
+        self.user_teams = {}
+        for teamid, memberids in teams.items():
+            for memberid in memberids:
+                self.user_teams.setdefault(memberid, set()).add(teamid)
+
+    def save(self, path):
+        '''Saves the snapshot as json'''
+        with open(path, 'w') as snapshot_file:
+            json.dump({'created': self.created,
+                       'objects': self.objects,
+                       'acls': self.acls,
+                       'principals': self.principals,
+                       'teams': self.teams}, snapshot_file)
+
+    @classmethod
+    def load(cls, path):
+        '''Loads a snapshot saved as json'''
+        with open(path, 'r') as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        return(cls(snapshot['objects'], snapshot['acls'],
+                   snapshot['principals'], snapshot['teams'],
+                   created=snapshot['created']))
+
+    def _get_object_acl(self, objectid):
+        objectid = str(objectid)
+        if objectid not in self.objects:
+            raise ValueError("{} is not in the ACL snapshot".format(objectid))
+        return(self.acls[self.objects[objectid]['benefactor']])
+
+    def effective_permissions(self, userid, objectid):
+        '''
+        Gets the permissions a user has on an object directly, through the
+        teams they are a member of or because the object is public
+
+        Args:
+            userid: Synapse user id
+            objectid: Synapse id or evaluation id
+
+        Returns:
+            Sorted list of access types
+        '''
+        userid = str(userid)
+        acl = self._get_object_acl(objectid)
+        principalids = self.user_teams.get(userid, set()).union(
+            [userid], EVERYONE_PRINCIPALS)
+        access_types = set()
+        for principalid in principalids.intersection(acl):
+            access_types.update(acl[principalid])
+        return(sorted(access_types))
+
+    def check_permissions(self, userids, objectids, access_type):
+        '''
+        Checks whether many users have an access type on many objects
+
+        Args:
+            userids: List of Synapse user ids
+            objectids: List of Synapse ids or evaluation ids
+            access_type: Access type such as READ or DOWNLOAD
+
+        Returns:
+            dict mapping object id to a dict of user id to True or False
+        '''
+        return({str(objectid): {
+                    str(userid): access_type in self.effective_permissions(
+                        userid, objectid)
+                    for userid in userids}
+                for objectid in objectids})
+
+    def has_permission_level(self, userid, objectid, permission_level):
+        '''
+        Checks whether a user has all the access types of a permission
+        level (view, download...) on an object
+
+        Args:
+            userid: Synapse user id
+            objectid: Synapse id or evaluation id
+            permission_level: evaluation permissions: ["view", "submit",
+                              "score", "admin"]
+                              entity permissions: ["view","download","edit",
+                              "edit_and_delete", "admin"]
+
+        Returns:
+            True if the user has the permission level
+        '''
+        mapping = permissions._get_permission_level_mapping(objectid)
+        if permission_level not in mapping or permission_level == 'remove':
+            raise ValueError(
+                "permission_level must be one of these: {0}".format(
+                    ', '.join(level for level in mapping
+                              if level != 'remove')))
+        access_types = self.effective_permissions(userid, objectid)
+        return(set(mapping[permission_level]).issubset(access_types))
+
+    def users_with_access(self, objectid, access_type):
+        '''
+        Gets the users that have an access type on an object
+
+        Args:
+            objectid: Synapse id or evaluation id
+            access_type: Access type such as READ or DOWNLOAD
+
+        Returns:
+            Set of user ids, True if everybody has access
+        '''
+        acl = self._get_object_acl(objectid)
+        userids = set()
+        for principalid, access_types in acl.items():
+            if access_type not in access_types:
+                continue
+            if principalid in EVERYONE_PRINCIPALS:
+                return(True)
+            if principalid in self.teams:
+                userids.update(self.teams[principalid])
+            else:
+                userids.add(principalid)
+        return(userids)
+
+    def audit(self):
+        '''
+        Creates an audit report of who has access to every object
+
+        Returns:
+            List of dicts with the objectId, objectName, objectType,
+            benefactorId, principalId, principalName, isTeam, accessType
+            and numberOfUsers
+        '''
+        report = []
+        for objectid in sorted(self.objects):
+            obj = self.objects[objectid]
+            acl = self.acls[obj['benefactor']]
+            for principalid in sorted(acl):
+                principal = self.principals.get(principalid, {})
+                is_team = principalid in self.teams
+                if principalid in EVERYONE_PRINCIPALS:
+                    number_of_users = None
+                elif is_team:
+                    number_of_users = len(self.teams[principalid])
+                else:
+                    number_of_users = 1
+                report.append({
+                    'objectId': objectid,
+                    'objectName': obj['name'],
+                    'objectType': obj['type'],
+                    'benefactorId': obj['benefactor'],
+                    'principalId': principalid,
+                    'principalName': principal.get('name'),
+                    'isTeam': is_team,
+                    'accessType': ",".join(acl[principalid]),
+                    'numberOfUsers': number_of_users})
+        return(report)
+
+
+def export_acl_snapshot(syn, projectids, max_workers=8):
+    '''
+    Exports the ACLs of projects, their folders and their evaluation queues
+    and the memberships of the teams in the ACLs
+
+    Args:
+        syn: Synapse object
+        projectids: List of Synapse project ids of the challenge
+        max_workers: Maximum number of concurrent requests. Default is 8.
+
+    Returns:
+        AclSnapshot
+    '''
+    objects = {}
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers) as executor:
+        projects = list(executor.map(
+            lambda projectid: syn.get(projectid, downloadFile=False),
+            projectids))
+        folders = [folder for project_folders in executor.map(
+            lambda project: _get_folders(syn, project.id), projects)
+            for folder in project_folders]
+        evaluations = [evaluation for project_evaluations in executor.map(
+            lambda project: list(syn.getEvaluationByContentSource(project)),
+            projects) for evaluation in project_evaluations]
+
+        headers = [{'id': project.id, 'name': project.name,
+                    'type': 'project'} for project in projects]
+        headers.extend({'id': folder['id'], 'name': folder['name'],
+                        'type': 'folder'} for folder in folders)
+        benefactors = executor.map(
+            lambda header: _get_entity_benefactor(syn, header),
+            projects + folders)
+        for header, benefactor in zip(headers, benefactors):
+            objects[header['id']] = {'type': header['type'],
+                                     'name': header['name'],
+                                     'benefactor': benefactor}
+        for evaluation in evaluations:
+            objects[evaluation.id] = {'type': 'evaluation',
+                                      'name': evaluation.name,
+                                      'benefactor': evaluation.id}
+
+        # Only benefactors have ACLs
+        benefactorids = sorted(set(
+            obj['benefactor'] for obj in objects.values()))
+        acls = dict(zip(benefactorids, executor.map(
+            lambda benefactorid: _get_acl(syn, benefactorid),
+            benefactorids)))
+
+        principalids = set(principalid for acl in acls.values()
+                           for principalid in acl)
+        principals = _get_principals(syn, principalids)
+        teamids = [principalid for principalid in principalids
+                   if principalid not in EVERYONE_PRINCIPALS and
+                   not principals.get(principalid, {}).get(
+                       'isIndividual', True)]
+        teams = dict(zip(teamids, executor.map(
+            lambda teamid: _get_team_memberids(syn, teamid), teamids)))
+    logger.info("Exported ACLs of {} objects and members of {} teams".format(
+        len(objects), len(teams)))
+    return(AclSnapshot(objects, acls, principals, teams))
+
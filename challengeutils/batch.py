@@ -0,0 +1,226 @@
+'''
+Runs many challengeutils commands in one session.  A manifest lists the
+commands as they would be typed after challengeutils, either one JSON
+value per line (JSONL) or a YAML list:
+
+    ["changestatus", "9612345", "SCORED"]
+    "setentityacl syn123 3324230 view"
+    {"args": ["setevaluationacl", "9612345", "3324230", "score"]}
+
+Commands on different objects (the first argument after the command) run
+in parallel, commands on the same object run in manifest order.  The
+result of every command, with what it printed and logged, is printed as
+a JSON line when it finishes.
+'''
+import concurrent.futures
+import contextlib
+import io
+import json
+import logging
+import shlex
+import sys
+import threading
+logger = logging.getLogger(__name__)
+
+
+def _entry_args(entry):
+    if isinstance(entry, dict):
+        entry = entry.get('args')
+    if isinstance(entry, str):
+        return(shlex.split(entry))
+    if isinstance(entry, list) and entry:
+        return([str(arg) for arg in entry])
+    raise ValueError("A command must be a list of arguments, a string "
+                     "or a dict with args: {}".format(entry))
+
+
+def load_manifest(path):
+    '''
+    Loads the commands of a JSONL or YAML (.yaml, .yml) manifest
+
+    Args:
+        path: Path to the manifest
+
+    Returns:
+        list of the arguments of every command
+    '''
+    with open(path, 'r') as manifest_file:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML must be installed to read {}, "
+                                 "use a JSONL manifest instead".format(path))
+            entries = yaml.safe_load(manifest_file) or []
+            if not isinstance(entries, list):
+                raise ValueError("{} must be a list of commands".format(path))
+        else:
+            entries = [json.loads(line) for line in manifest_file
+                       if line.strip()]
+    return([_entry_args(entry) for entry in entries])
+
+
+def independent_groups(commands):
+    '''
+    Groups commands by the object they change, the first argument after
+    the command name
+
+    Args:
+        commands: list of the arguments of every command
+
+    Returns:
+        list of lists of (index, arguments) in manifest order
+    '''
+    groups = {}
+    for index, args in enumerate(commands):
+        key = args[1] if len(args) > 1 else None
+        groups.setdefault(key, []).append((index, args))
+    return(sorted(groups.values(), key=lambda group: group[0][0]))
+
+
+class _ThreadStream(object):
+    '''
+    Stands in for sys.stdout or sys.stderr and sends what a thread writes
+    to the buffer it captures into, if it captures
+    '''
+    def __init__(self, stream, local, name):
+        self.stream = stream
+        self.local = local
+        self.name = name
+
+    def write(self, text):
+        buffer = getattr(self.local, self.name, None)
+        if buffer is not None:
+            return(buffer.write(text))
+        return(self.stream.write(text))
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return(getattr(self.stream, name))
+
+
+class _ThreadLogHandler(logging.Handler):
+    '''
+    Writes the log records of a capturing thread to its stdout buffer
+    '''
+    def __init__(self, local):
+        logging.Handler.__init__(self)
+        self.local = local
+        self.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    def emit(self, record):
+        buffer = getattr(self.local, 'stdout', None)
+        if buffer is not None:
+            buffer.write(self.format(record) + "\n")
+
+
+@contextlib.contextmanager
+def _capture_output(local):
+    '''
+    Sends what a thread writes to stdout and stderr and logs to the
+    stdout and stderr buffers set in local, while in the context.
+    Threads started by a capturing thread capture into the same buffers.
+    '''
+    stdout, stderr = sys.stdout, sys.stderr
+    start = threading.Thread.start
+    root = logging.getLogger()
+    handler = _ThreadLogHandler(local)
+
+    def not_captured(record):
+        return(getattr(local, 'stdout', None) is None)
+
+    def start_capturing(thread):
+        buffers = (getattr(local, 'stdout', None),
+                   getattr(local, 'stderr', None))
+        run = thread.run
+
+        def run_capturing():
+            local.stdout, local.stderr = buffers
+            run()
+        thread.run = run_capturing
+        return(start(thread))
+
+    handlers = list(root.handlers)
+    for root_handler in handlers:
+        root_handler.addFilter(not_captured)
+    root.addHandler(handler)
+    sys.stdout = _ThreadStream(stdout, local, 'stdout')
+    sys.stderr = _ThreadStream(stderr, local, 'stderr')
+    threading.Thread.start = start_capturing
+    try:
+        yield
+    finally:
+        threading.Thread.start = start
+        sys.stdout, sys.stderr = stdout, stderr
+        root.removeHandler(handler)
+        for root_handler in handlers:
+            root_handler.removeFilter(not_captured)
+
+
+def run_batch(syn, commands, parser, max_workers=4, output=None):
+    '''
+    Runs commands with a shared Synapse session and writes the result of
+    every command as a JSON line when it finishes
+
+    Args:
+        syn: Synapse object
+        commands: list of the arguments of every command
+        parser: Parser of the command line client
+        max_workers: Maximum number of commands run at once. Default is 4.
+        output: File the results are written to. Default is stdout.
+
+    Returns:
+        list of dicts with the line, args, status (success or failure),
+        the output (stdout, stderr and log records of the command and the
+        threads it started) and the error of every command
+    '''
+    results = [None] * len(commands)
+    write_lock = threading.Lock()
+    local = threading.local()
+    if output is None:
+        output = sys.stdout
+
+    def run_command(index, args):
+        result = {'line': index + 1, 'args': args, 'status': 'success',
+                  'output': '', 'error': None}
+        local.stdout = io.StringIO()
+        # Argparse writes its usage and error to stderr before it exits
+        local.stderr = parse_errors = io.StringIO()
+        try:
+            parsed = parser.parse_args(args)
+            local.stderr = local.stdout
+            if getattr(parsed, 'func', None) is None:
+                raise ValueError("No command given")
+            if args[0] == 'batch':
+                raise ValueError("batch can't be run in a batch")
+            parsed.func(syn, parsed)
+        except SystemExit as err:
+            result['status'] = 'failure'
+            result['error'] = parse_errors.getvalue().strip() or \
+                "Exited with {}".format(err.code)
+        except Exception as err:
+            result['status'] = 'failure'
+            result['error'] = str(err)
+        finally:
+            result['output'] = local.stdout.getvalue()
+            local.stdout = local.stderr = None
+        results[index] = result
+        with write_lock:
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+
+    def run_group(group):
+        for index, args in group:
+            run_command(index, args)
+
+    with _capture_output(local):
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers) as executor:
+            for future in [executor.submit(run_group, group)
+                           for group in independent_groups(commands)]:
+                future.result()
+    failed = sum(result['status'] != 'success' for result in results)
+    logger.info("Ran {} commands, {} failed".format(len(results), failed))
+    return(results)
@@ -0,0 +1,206 @@
+'''
+Paired bootstrap comparison of a submission against the submitter's
+lead submission.  Bootstrap samples are drawn as matrices of row indices
+and scored a chunk at a time, so memory stays bounded however many
+bootstraps are requested.
+
+Metrics are functions of two 2D arrays (bootstraps x rows), the gold
+standard and the predictions, that return one score per bootstrap.
+'''
+import logging
+import numpy as np
+import pandas as pd
+logger = logging.getLogger(__name__)
+
+# Memory used by the bootstrap matrices of one chunk: 256 MB
+MAX_CHUNK_BYTES = 256 * 1024 ** 2
+
+
+def rmse(gold, pred):
+    '''Root mean squared error of each bootstrap'''
+    return(np.sqrt(np.mean((gold - pred) ** 2, axis=1)))
+
+
+def mae(gold, pred):
+    '''Mean absolute error of each bootstrap'''
+    return(np.mean(np.abs(gold - pred), axis=1))
+
+
+def pearson(gold, pred):
+    '''Pearson correlation of each bootstrap'''
+    gold = gold - gold.mean(axis=1, keepdims=True)
+    pred = pred - pred.mean(axis=1, keepdims=True)
+    denominator = np.sqrt((gold ** 2).sum(axis=1) * (pred ** 2).sum(axis=1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return((gold * pred).sum(axis=1) / denominator)
+
+
+def _rank(values):
+    # Resampling with replacement creates ties, which get their average rank
+    return(pd.DataFrame(values).rank(axis=1).values)
+
+
+def spearman(gold, pred):
+    '''Spearman correlation of each bootstrap'''
+    return(pearson(_rank(gold), _rank(pred)))
+
+
+# Metric name: (function, True if a larger score is better)
+METRICS = {'rmse': (rmse, False),
+           'mae': (mae, False),
+           'pearson': (pearson, True),
+           'spearman': (spearman, True)}
+
+
+def _get_metric(metric):
+    if metric not in METRICS:
+        raise ValueError("metric must be one of these: {}".format(
+            ', '.join(sorted(METRICS))))
+    return(METRICS[metric])
+
+
+def _read_predictions(goldstandard_path, current_path, previous_path,
+                      id_col, pred_col, gold_col):
+    '''
+    Helper function to align the predictions of the current and previous
+    submission with the gold standard by id
+    '''
+    gold = pd.read_csv(goldstandard_path)[[id_col, gold_col]]
+    current = pd.read_csv(current_path)[[id_col, pred_col]]
+    merged = gold.merge(current.rename(columns={pred_col: '_current'}),
+                        on=id_col, how='left')
+    if previous_path is not None:
+        previous = pd.read_csv(previous_path)[[id_col, pred_col]]
+        merged = merged.merge(
+            previous.rename(columns={pred_col: '_previous'}),
+            on=id_col, how='left')
+    if merged.isnull().values.any():
+        raise ValueError("Every {} of the gold standard must have a "
+                         "prediction".format(id_col))
+    return(merged)
+
+
+def bootstrap_scores(gold, predictions, metric, num_bootstraps=1000,
+                     seed=None, max_chunk_bytes=MAX_CHUNK_BYTES):
+    '''
+    Scores paired bootstrap samples of several predictions.  Every
+    prediction is scored on the same bootstrap samples.
+
+    Args:
+        gold: 1D array of the gold standard
+        predictions: List of 1D arrays of predictions aligned with gold
+        metric: Function of (gold, pred) 2D arrays returning a 1D array
+        num_bootstraps: Number of bootstrap samples. Default is 1000.
+        seed: Seed of the random number generator. Default is None.
+        max_chunk_bytes: Maximum memory of the bootstrap matrices of one
+                         chunk. Default is MAX_CHUNK_BYTES
+
+    Returns:
+        2D array of scores (num_bootstraps x predictions)
+    '''
+    gold = np.asarray(gold, dtype=np.float64)
+    predictions = [np.asarray(pred, dtype=np.float64)
+                   for pred in predictions]
+    nrows = len(gold)
+    # Index matrix plus the gold standard and each prediction gathered
+    row_bytes = nrows * (8 + 8 * (len(predictions) + 1))
+    chunk_size = max(1, min(num_bootstraps, max_chunk_bytes // row_bytes))
+    random_state = np.random.RandomState(seed)
+    scores = np.empty((num_bootstraps, len(predictions)))
+    for start in range(0, num_bootstraps, chunk_size):
+        size = min(chunk_size, num_bootstraps - start)
+        indices = random_state.randint(0, nrows, size=(size, nrows))
+        gold_sample = gold[indices]
+        for column, pred in enumerate(predictions):
+            scores[start:start + size, column] = metric(
+                gold_sample, pred[indices])
+    return(scores)
+
+
+def compute_bayes_factor(current_scores, previous_scores,
+                         larger_is_better=True):
+    '''
+    Bayes factor of the current submission being better than the
+    previous submission: the number of bootstraps the current submission
+    is better over the number it is not
+
+    Args:
+        current_scores: 1D array of bootstrapped scores
+        previous_scores: 1D array of bootstrapped scores on the same samples
+        larger_is_better: True if a larger score is better. Default is True.
+
+    Returns:
+        Bayes factor, inf if the current submission is always better
+    '''
+    difference = np.asarray(current_scores) - np.asarray(previous_scores)
+    if not larger_is_better:
+        difference = -difference
+    better = np.count_nonzero(difference > 0)
+    not_better = len(difference) - better
+    if not_better == 0:
+        return(float('inf'))
+    return(better / float(not_better))
+
+
+def compare_to_lead_submission(current_path, previous_path,
+                               goldstandard_path, id_col, pred_col,
+                               gold_col, metric='spearman',
+                               larger_is_better=None, num_bootstraps=1000,
+                               bayes_cutoff=3, seed=None):
+    '''
+    Compares a submission to the lead submission of the submitter by
+    bootstrapping both on the same samples of the gold standard
+
+    Args:
+        current_path: Prediction file of the current submission
+        previous_path: Prediction file of the lead submission or None
+                       if the submitter has no lead submission
+        goldstandard_path: Gold standard file
+        id_col: Column that identifies a row in all the files
+        pred_col: Prediction column of the submissions
+        gold_col: Gold standard column
+        metric: Name of a metric in METRICS or a function of
+                (gold, pred) 2D arrays. Default is spearman.
+        larger_is_better: True if a larger score is better.  Required when
+                          metric is a function.
+        num_bootstraps: Number of bootstrap samples. Default is 1000.
+        bayes_cutoff: Bayes factor the current submission needs to meet
+                      to become the lead submission. Default is 3.
+        seed: Seed of the random number generator. Default is None.
+
+    Returns:
+        dict with the current_score, previous_score, bayes_factor and
+        met_cutoff
+    '''
+    if callable(metric):
+        if larger_is_better is None:
+            raise ValueError(
+                "larger_is_better must be set when metric is a function")
+        metric_func = metric
+    else:
+        metric_func, default_larger_is_better = _get_metric(metric)
+        if larger_is_better is None:
+            larger_is_better = default_larger_is_better
+    merged = _read_predictions(goldstandard_path, current_path,
+                               previous_path, id_col, pred_col, gold_col)
+    gold = merged[gold_col].values.astype(np.float64)
+    current = merged['_current'].values.astype(np.float64)
+    current_score = float(metric_func(gold[np.newaxis],
+                                      current[np.newaxis])[0])
+    if previous_path is None:
+        # The first submission that is scored is the lead submission
+        return({'current_score': current_score, 'previous_score': None,
+                'bayes_factor': None, 'met_cutoff': True})
+    previous = merged['_previous'].values.astype(np.float64)
+    previous_score = float(metric_func(gold[np.newaxis],
+                                       previous[np.newaxis])[0])
+    scores = bootstrap_scores(gold, [current, previous], metric_func,
+                              num_bootstraps=num_bootstraps, seed=seed)
+    bayes_factor = compute_bayes_factor(scores[:, 0], scores[:, 1],
+                                        larger_is_better)
+    logger.info("Bayes factor of {} against {}: {}".format(
+        current_path, previous_path, bayes_factor))
+    return({'current_score': current_score,
+            'previous_score': previous_score,
+            'bayes_factor': bayes_factor,
+            'met_cutoff': bayes_factor >= bayes_cutoff})
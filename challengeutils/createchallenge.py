@@ -14,20 +14,34 @@ Code - Status: in progress
 
 Unit Testing:
 '''
+import concurrent.futures
 import json
+import os
+import re
 import synapseutils
 import synapseclient
 import logging
 import sys
-logging.basicConfig(level=logging.INFO)
+import threading
+import time
 logger = logging.getLogger(__name__)
 '''
 A pre-defined wiki project is used as initial template for challenge sites.
-To copy over the template synapseutils.copyWiki() function is used with
-template id as source and new challenge project entity synId as destination.
+The template's page tree, markdown and attachment file handles are cached
+locally and pages are only downloaded again when their etag changes.
+The new challenge wiki is created from the cache with the placeholders
+filled in before the upload.
 '''
 # DREAM_CHALLENGE_TEMPLATE_SYNID = "syn2769515"  # Template 1.0
 DREAM_CHALLENGE_TEMPLATE_SYNID = "syn18058986"  # Template 2.0
+# Steps run concurrently, so only one of them may prompt the user at a time
+_INPUT_LOCK = threading.Lock()
+TEMPLATE_CACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.challengeutils', 'templates')
+# Increment when the layout of the cached template changes
+TEMPLATE_CACHE_VERSION = 1
+# Maximum number of file handles copied per request
+COPY_FILEHANDLES_BATCH_SIZE = 100
 
 
 def create_project(syn, project_name):
@@ -65,9 +79,10 @@ def create_team(syn, team_name, desc, can_public_join=False):
     try:
         # raises a ValueError if a team does not exist
         team = syn.getTeam(team_name)
-        logger.info('The team %s already exists.' % team_name)
-        logger.info(team)
-        user_input = input('Do you want to use this team? (Y/n) ') or 'y'
+        with _INPUT_LOCK:
+            logger.info('The team %s already exists.' % team_name)
+            logger.info(team)
+            user_input = input('Do you want to use this team? (Y/n) ') or 'y'
         if user_input.lower() not in ('y', 'yes'):
             logger.info('Please specify another team. Exiting.')
             sys.exit(1)
@@ -181,47 +196,299 @@ def update_wikipage_string(
     return(wikipage_string)
 
 
-def createchallenge(syn, challenge_name, live_site=None):
+def _get_template_page(syn, template, header, cached_page=None):
     '''
-    Create two project entity for challenge sites.
-    1) live (public) and 2) staging (private until launch)
-    Allow for users to set up the live site themselves
+    Gets a wiki page of the template.  The markdown and attachments are
+    only downloaded if the page changed since it was cached.
 
     Args:
         syn: Synapse object
-        challenge_name: Name of the challenge
-        live_site: If there is already a live site, specify live site Synapse
-                   id. (Default is None)
+        template: Synapse template Entity
+        header: Wiki header of the page
+        cached_page: Cached page or None
+
+    Returns:
+        Page dict with id, title, parentWikiId, etag, markdown and
+        attachments
     '''
-    if live_site is None:
-        project_live = create_project(syn, challenge_name)
-    else:
-        project_live = syn.get(live_site)
+    metadata = syn.restGET(
+        '/entity/{}/wiki2/{}'.format(template.id, header['id']))
+    if cached_page is not None and \
+            cached_page['etag'] == metadata['etag']:
+        return(cached_page)
+    wiki = syn.getWiki(template, header['id'])
+    attachments = [
+        syn._getFileHandleDownload(filehandleid, wiki.id,
+                                   objectType='WikiAttachment')['fileHandle']
+        for filehandleid in wiki.get('attachmentFileHandleIds', [])]
+    # Remove preview attachments
+    attachments = [
+        attachment for attachment in attachments
+        if attachment['concreteType'] !=
+        "org.sagebionetworks.repo.model.file.PreviewFileHandle"]
+    return({'id': wiki.id,
+            'title': wiki.get('title', ''),
+            'parentWikiId': wiki.get('parentWikiId'),
+            'etag': metadata['etag'],
+            'markdown': wiki.markdown,
+            'attachments': attachments})
+
+
+def _sort_parents_first(pages):
+    '''
+    Sorts wiki pages so that every page comes after its parent.  Siblings
+    keep their order.
 
-    staging = challenge_name + ' - staging'
-    project_staging = create_project(syn, staging)
+    Args:
+        pages: Template pages
 
-    '''Create teams for challenge sites'''
-    team_part = challenge_name + ' Participants'
-    team_admin = challenge_name + ' Admin'
-    team_preReg = challenge_name + ' Preregistrants'
+    Returns:
+        Template pages, parents before their children
+    '''
+    pageids = set(page['id'] for page in pages)
+    children = {}
+    for page in pages:
+        parentid = page['parentWikiId']
+        if parentid is not None and parentid not in pageids:
+            raise ValueError(
+                "Parent wiki {} of wiki page {} is not in the "
+                "template".format(parentid, page['id']))
+        children.setdefault(parentid, []).append(page)
+    ordered = list(children.get(None, []))
+    for page in ordered:
+        ordered.extend(children.get(page['id'], []))
+    if len(ordered) != len(pages):
+        raise ValueError("The parents of the template wiki pages form a cycle")
+    return(ordered)
+
+
+def get_template_pages(syn, templateid=DREAM_CHALLENGE_TEMPLATE_SYNID,
+                       cache_dir=TEMPLATE_CACHE_DIR):
+    '''
+    Gets the wiki pages of the challenge template from the local cache.
+    The cache is discarded when the template's etag changes and a page is
+    downloaded again when its etag changes.
 
-    team_part_id = create_team(
-        syn, team_part, 'Challenge Particpant Team', can_public_join=True)
-    team_admin_id = create_team(
-        syn, team_admin, 'Challenge Admin Team', can_public_join=False)
-    team_prereg_id = create_team(
-        syn, team_preReg, 'Challenge Pre-registration Team',
-        can_public_join=True)
+    Args:
+        syn: Synapse object
+        templateid: Synapse id of the template.
+                    Default is DREAM_CHALLENGE_TEMPLATE_SYNID
+        cache_dir: Directory of the template cache.
+                   Default is TEMPLATE_CACHE_DIR
 
-    admin_perms = ['DOWNLOAD', 'DELETE', 'READ', 'CHANGE_PERMISSIONS',
-                   'CHANGE_SETTINGS', 'CREATE', 'MODERATE', 'UPDATE']
-    syn.setPermissions(project_staging, team_admin_id, admin_perms)
-    syn.setPermissions(project_live, team_admin_id, admin_perms)
+    Returns:
+        Template pages, parents before their children
+    '''
+    template = syn.get(templateid, downloadFile=False)
+    cache_path = os.path.join(cache_dir, '{}.json'.format(template.id))
+    cached = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r') as cache_file:
+            cached = json.load(cache_file)
+    if cached.get('version') != TEMPLATE_CACHE_VERSION or \
+            cached.get('etag') != template.etag:
+        cached = {}
+    cached_pages = {page['id']: page for page in cached.get('pages', [])}
+
+    headers = syn.getWikiHeaders(template)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        pages = list(executor.map(
+            lambda header: _get_template_page(
+                syn, template, header, cached_pages.get(header['id'])),
+            headers))
+    pages = _sort_parents_first(pages)
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'w') as cache_file:
+        json.dump({'version': TEMPLATE_CACHE_VERSION,
+                   'etag': template.etag,
+                   'pages': pages}, cache_file)
+    os.replace(temp_path, cache_path)
+    return(pages)
+
+
+def _copy_template_attachments(syn, pages):
+    '''
+    Copies the attachments of all template pages in batches
 
-    if live_site is None:
-        create_live_page(syn, project_live, team_prereg_id)
+    Args:
+        syn: Synapse object
+        pages: Template pages
+
+    Returns:
+        dict mapping template wiki id to new attachment file handle ids
+    '''
+    to_copy = [(page['id'], attachment) for page in pages
+               for attachment in page['attachments']]
+    new_attachments = {page['id']: [] for page in pages}
+    for start in range(0, len(to_copy), COPY_FILEHANDLES_BATCH_SIZE):
+        batch = to_copy[start:start + COPY_FILEHANDLES_BATCH_SIZE]
+        copied = synapseutils.copyFileHandles(
+            syn, [attachment for _, attachment in batch],
+            ["WikiAttachment"] * len(batch),
+            [wikiid for wikiid, _ in batch],
+            [attachment['contentType'] for _, attachment in batch],
+            [attachment['fileName'] for _, attachment in batch])
+        for (wikiid, attachment), result in zip(batch,
+                                                 copied['copyResults']):
+            if result.get("failureCode") is not None:
+                raise ValueError("%s dataFileHandleId: %s" % (
+                    result["failureCode"], result['originalFileHandleId']))
+            new_attachments[wikiid].append(result['newFileHandle']['id'])
+    return(new_attachments)
+
+
+def _fill_template_markdown(markdown, templateid, project, wiki_mapping,
+                            challengeid, teamid, challenge_name, synid):
+    '''
+    Rewrites the template's wiki links and fills in the placeholders
+
+    Args:
+        markdown: Template markdown
+        templateid: Synapse id of the template
+        project: Synapse project the wiki is created in
+        wiki_mapping: dict mapping template wiki ids to new wiki ids
+        challengeid: New challenge id
+        teamid: Synapse Team id
+        challenge_name: challenge name
+        synid: Synapse id of project
+
+    Returns:
+        Markdown of the new wiki page
+    '''
+    for template_wikiid in wiki_mapping:
+        markdown = re.sub(
+            "%s/wiki/%s\\b" % (templateid, template_wikiid),
+            "%s/wiki/%s" % (project.id, wiki_mapping[template_wikiid]),
+            markdown)
+    markdown = re.sub(templateid, project.id, markdown)
+    return(update_wikipage_string(
+        markdown, challengeid, teamid, challenge_name, synid))
+
+
+def create_wiki_from_template(syn, pages, project, challengeid, teamid,
+                              challenge_name, synid,
+                              templateid=DREAM_CHALLENGE_TEMPLATE_SYNID):
+    '''
+    Creates the challenge wiki from the cached template pages.  The
+    placeholders are filled in before the upload, so each page is
+    written once.  Only pages that link to pages created after them are
+    stored a second time to fix the links.
+
+    Args:
+        syn: Synapse object
+        pages: Template pages from get_template_pages
+        project: Synapse project to create the wiki in
+        challengeid: New challenge id
+        teamid: Synapse Team id
+        challenge_name: challenge name
+        synid: Synapse id of project
+        templateid: Synapse id of the template.
+                    Default is DREAM_CHALLENGE_TEMPLATE_SYNID
+
+    Returns:
+        List of created wiki pages
+    '''
+    pages = _sort_parents_first(pages)
+    new_attachments = _copy_template_attachments(syn, pages)
+    template_wikiids = set(page['id'] for page in pages)
+    wiki_mapping = {}
+    new_wikis = []
+    unresolved = []
+    for page in pages:
+        # Links to this page or to pages not created yet can't be
+        # rewritten until the page is stored
+        unmapped_links = set(re.findall(
+            "%s/wiki/(\\d+)" % templateid, page['markdown'] or '')
+        ).intersection(template_wikiids).difference(wiki_mapping)
+        wiki = synapseclient.Wiki(
+            owner=project, title=page['title'],
+            markdown=_fill_template_markdown(
+                page['markdown'] or '', templateid, project, wiki_mapping,
+                challengeid, teamid, challenge_name, synid),
+            fileHandles=new_attachments[page['id']],
+            parentWikiId=wiki_mapping.get(page['parentWikiId']))
+        wiki = syn.store(wiki)
+        wiki_mapping[page['id']] = wiki['id']
+        new_wikis.append(wiki)
+        if unmapped_links:
+            unresolved.append((page, len(new_wikis) - 1))
+    for page, index in unresolved:
+        wiki = new_wikis[index]
+        wiki.markdown = _fill_template_markdown(
+            page['markdown'] or '', templateid, project, wiki_mapping,
+            challengeid, teamid, challenge_name, synid)
+        new_wikis[index] = syn.store(wiki)
+    logger.info('Created %d wiki pages in %s' % (len(new_wikis), project.id))
+    return(new_wikis)
+
+
+def _run_pipeline(steps, max_workers=None):
+    '''
+    Runs provisioning steps as soon as the steps they depend on are done.
+    Steps that do not depend on each other run concurrently.
+
+    Args:
+        steps: List of (name, dependencies, function) tuples.  The function
+               is called with a dict of the results of the finished steps.
+        max_workers: Maximum number of steps run at once.
+                     Default is None (number of steps).
 
+    Returns:
+        dict of step name to result, list of step timings
+    '''
+    pending = {name: (dependencies, func)
+               for name, dependencies, func in steps}
+    results = {}
+    timings = []
+    running = {}
+
+    def timed(name, dependencies, func):
+        start = time.time()
+        try:
+            return(func(results))
+        finally:
+            timings.append({'step': name,
+                            'dependencies': list(dependencies),
+                            'start': start,
+                            'seconds': round(time.time() - start, 3)})
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or len(steps)) as executor:
+        while pending or running:
+            for name in list(pending):
+                dependencies, func = pending[name]
+                if all(dependency in results for dependency in dependencies):
+                    del pending[name]
+                    running[executor.submit(
+                        timed, name, dependencies, func)] = name
+            if not running:
+                raise ValueError("Unresolvable step dependencies: {}".format(
+                    ", ".join(pending)))
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except BaseException:
+                    for other in running:
+                        other.cancel()
+                    raise
+    timings.sort(key=lambda timing: timing['start'])
+    return(results, timings)
+
+
+def _delete_staging_wiki(syn, project_staging):
+    '''
+    Asks the user to delete the wiki of the staging project if it exists
+
+    Args:
+        syn: Synapse object
+        project_staging: Synapse staging project
+    '''
     project_staging_wiki = None
     try:
         project_staging_wiki = syn.getWiki(project_staging.id)
@@ -229,10 +496,12 @@ def createchallenge(syn, challenge_name, live_site=None):
         pass
 
     if project_staging_wiki:
-        logger.info('The staging project has already a wiki.')
-        logger.info(project_staging_wiki)
-        user_input = input(
-            'Do you agree to delete the wiki before continuing? (y/N) ') or 'n'
+        with _INPUT_LOCK:
+            logger.info('The staging project has already a wiki.')
+            logger.info(project_staging_wiki)
+            user_input = input(
+                'Do you agree to delete the wiki before continuing? (y/N) '
+            ) or 'n'
         if user_input.lower() not in ('y', 'yes'):
             logger.info('Exiting')
             sys.exit(1)
@@ -241,18 +510,100 @@ def createchallenge(syn, challenge_name, live_site=None):
                         % project_staging_wiki.id)
             syn.delete(project_staging_wiki)
 
-    logger.info('Copying wiki template to %s' % project_staging.name)
-    new_wikiids = synapseutils.copyWiki(
-        syn, DREAM_CHALLENGE_TEMPLATE_SYNID, project_staging.id)
-
-    challenge = create_challenge_widget(syn, project_live, team_part_id)
-
-    create_evaluation_queue(
-        syn, '%s Final Write-Up' % challenge_name, 'Final Write-Up Submission',
-        project_live.id)
-    for page in new_wikiids:
-        wikipage = syn.getWiki(project_staging, page['id'])
-        wikipage.markdown = update_wikipage_string(
-            wikipage.markdown, challenge['id'], team_part_id, challenge_name,
-            project_live.id)
-        syn.store(wikipage)
+
+def createchallenge(syn, challenge_name, live_site=None):
+    '''
+    Create two project entity for challenge sites.
+    1) live (public) and 2) staging (private until launch)
+    Allow for users to set up the live site themselves
+
+    The provisioning steps run as soon as the steps they depend on are
+    done, so independent steps such as creating the teams and projects
+    run concurrently.
+
+    Args:
+        syn: Synapse object
+        challenge_name: Name of the challenge
+        live_site: If there is already a live site, specify live site Synapse
+                   id. (Default is None)
+
+    Returns:
+        Provisioning report with the created ids and per-step timings
+    '''
+    start = time.time()
+    staging = challenge_name + ' - staging'
+
+    '''Create teams for challenge sites'''
+    team_part = challenge_name + ' Participants'
+    team_admin = challenge_name + ' Admin'
+    team_preReg = challenge_name + ' Preregistrants'
+
+    admin_perms = ['DOWNLOAD', 'DELETE', 'READ', 'CHANGE_PERMISSIONS',
+                   'CHANGE_SETTINGS', 'CREATE', 'MODERATE', 'UPDATE']
+    # These steps can ask the user to confirm and exit if they decline,
+    # so nothing else is created or changed until they are done
+    confirmed = ['team_part', 'team_admin', 'team_prereg',
+                 'delete_staging_wiki']
+
+    steps = [
+        ('project_live', [],
+         lambda results: create_project(syn, challenge_name)
+         if live_site is None else syn.get(live_site)),
+        ('project_staging', [],
+         lambda results: create_project(syn, staging)),
+        ('team_part', [],
+         lambda results: create_team(
+             syn, team_part, 'Challenge Particpant Team',
+             can_public_join=True)),
+        ('team_admin', [],
+         lambda results: create_team(
+             syn, team_admin, 'Challenge Admin Team',
+             can_public_join=False)),
+        ('team_prereg', [],
+         lambda results: create_team(
+             syn, team_preReg, 'Challenge Pre-registration Team',
+             can_public_join=True)),
+        ('staging_permissions', ['project_staging'] + confirmed,
+         lambda results: syn.setPermissions(
+             results['project_staging'], results['team_admin'],
+             admin_perms)),
+        ('live_permissions', ['project_live'] + confirmed,
+         lambda results: syn.setPermissions(
+             results['project_live'], results['team_admin'], admin_perms)),
+        ('delete_staging_wiki', ['project_staging'],
+         lambda results: _delete_staging_wiki(
+             syn, results['project_staging'])),
+        ('template_pages', [],
+         lambda results: get_template_pages(syn)),
+        ('challenge_widget', ['project_live'] + confirmed,
+         lambda results: create_challenge_widget(
+             syn, results['project_live'], results['team_part'])),
+        ('writeup_queue', ['project_live'] + confirmed,
+         lambda results: create_evaluation_queue(
+             syn, '%s Final Write-Up' % challenge_name,
+             'Final Write-Up Submission', results['project_live'].id)),
+        ('staging_wiki', ['template_pages', 'challenge_widget'] + confirmed,
+         lambda results: create_wiki_from_template(
+             syn, results['template_pages'], results['project_staging'],
+             results['challenge_widget']['id'], results['team_part'],
+             challenge_name, results['project_live'].id))]
+    if live_site is None:
+        steps.append(
+            ('live_page', ['project_live'] + confirmed,
+             lambda results: create_live_page(
+                 syn, results['project_live'], results['team_prereg'])))
+
+    results, timings = _run_pipeline(steps)
+    report = {
+        'challenge_name': challenge_name,
+        'live_projectid': results['project_live'].id,
+        'staging_projectid': results['project_staging'].id,
+        'participant_teamid': results['team_part'],
+        'admin_teamid': results['team_admin'],
+        'preregistrant_teamid': results['team_prereg'],
+        'challengeid': results['challenge_widget']['id'],
+        'writeup_queueid': results['writeup_queue'].id,
+        'wiki_pages': len(results['staging_wiki']),
+        'steps': timings,
+        'seconds': round(time.time() - start, 3)}
+    return(report)
@@ -0,0 +1,204 @@
+'''
+Runtime statistics of docker challenge submissions.  Challenges, their
+queues and round windows are described in a YAML or JSON file:
+
+    challenges:
+      - name: DM
+        queues:
+          - evaluationid: 7453778
+            sc: 1
+            rounds:
+              - {round: 1, start: 0, end: 1482541490864}
+              - {round: final, start: 1490639746000, end: null}
+
+A round holds the submissions created after its start and up to its end
+(epoch milliseconds, null for no end).  Every queue is fetched once, no
+matter how many rounds or challenges use it.
+'''
+import concurrent.futures
+import json
+import logging
+import math
+import numpy as np
+import pandas as pd
+from . import timestamps
+logger = logging.getLogger(__name__)
+
+SUBMISSION_COLUMNS = ['team', 'submissionId', 'runTimeMinutes', 'sc',
+                      'round', 'status', 'challenge']
+STAT_COLUMNS = ['teams', 'round', 'sc', 'status', 'challenge',
+                'averageRunTime', 'totalRunTime', 'numberSubmissions']
+# Annotations of the start and end of a run, in order of preference
+RUNTIME_ANNOTATIONS = [('RUN_START', 'RUN_END'),
+                       ('TRAINING_STARTED', 'TRAINING_LAST_UPDATED')]
+
+
+def load_config(path):
+    '''
+    Loads a YAML (.yaml, .yml) or JSON description of challenges
+
+    Args:
+        path: Path to the config file
+
+    Returns:
+        dict with a list of challenges
+    '''
+    with open(path, 'r') as config_file:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML must be installed to read {}, "
+                                 "use a JSON config instead".format(path))
+            config = yaml.safe_load(config_file)
+        else:
+            config = json.load(config_file)
+    if not config or 'challenges' not in config:
+        raise ValueError("{} must have a list of challenges".format(path))
+    return(config)
+
+
+def _round_windows(rounds):
+    '''
+    Helper function to sort the round windows of a queue by start.
+    Windows can't overlap, so a submission is in at most one round.
+
+    Returns:
+        arrays of the starts, ends (inf for no end) and round names
+    '''
+    rounds = sorted(rounds, key=lambda window: window['start'])
+    starts = np.array([window['start'] for window in rounds], dtype=float)
+    ends = np.array([float('inf') if window.get('end') is None
+                     else window['end'] for window in rounds], dtype=float)
+    if np.any(ends[:-1] > starts[1:]):
+        raise ValueError("Round windows can't overlap: {}".format(rounds))
+    return(starts, ends, [window['round'] for window in rounds])
+
+
+def assign_rounds(created_on, rounds):
+    '''
+    Assigns a round to every submission
+
+    Args:
+        created_on: Array of the epoch milliseconds submissions were created
+        rounds: List of dicts with the round, start and end of a round
+
+    Returns:
+        Array of the rounds, None for submissions in no round
+    '''
+    starts, ends, names = _round_windows(rounds)
+    created_on = np.asarray(created_on, dtype=float)
+    # Index of the last round that starts before each submission
+    index = np.searchsorted(starts, created_on, side='left') - 1
+    in_round = (index >= 0) & (created_on <= ends[np.clip(index, 0, None)])
+    assigned = np.array(names + [None], dtype=object)
+    return(assigned[np.where(in_round, index, len(names))])
+
+
+def _annotation_values(annotations):
+    return({annotation['key']: annotation['value']
+            for annotation_type in ['stringAnnos', 'longAnnos']
+            for annotation in annotations.get(annotation_type) or []})
+
+
+def _runtime_minutes(values):
+    for start_key, end_key in RUNTIME_ANNOTATIONS:
+        if values.get(start_key) is not None and \
+                values.get(end_key) is not None:
+            return(math.ceil((values[end_key] - values[start_key]) / 60000.0))
+    return(float('nan'))
+
+
+def get_queue_submissions(syn, evaluationid):
+    '''
+    Gets the team, status, creation time and runtime of the submissions
+    of a queue that have a team annotation
+
+    Args:
+        syn: Synapse object
+        evaluationid: Evaluation queue id
+
+    Returns:
+        Data frame with the team, submissionId, status, createdOn (epoch
+        milliseconds) and runTimeMinutes of every submission
+    '''
+    rows = []
+    for sub, status in syn.getSubmissionBundles(evaluationid, limit=100):
+        values = _annotation_values(status.get('annotations') or {})
+        if values.get('team') is None:
+            continue
+        rows.append({'team': values['team'],
+                     'submissionId': status.id,
+                     'status': status.status,
+                     'createdOn': sub.createdOn,
+                     'runTimeMinutes': _runtime_minutes(values)})
+    submissionsdf = pd.DataFrame(
+        rows, columns=['team', 'submissionId', 'status', 'createdOn',
+                       'runTimeMinutes'])
+    submissionsdf['createdOn'] = timestamps.to_epoch_ms(
+        submissionsdf['createdOn'])
+    logger.info("Fetched {} submissions of {}".format(
+        len(submissionsdf), evaluationid))
+    return(submissionsdf)
+
+
+def get_docker_submission_stats(syn, config, max_workers=4):
+    '''
+    Gets the submissions of every queue of the challenges in a config
+    with their round
+
+    Args:
+        syn: Synapse object
+        config: dict with a list of challenges, see load_config
+        max_workers: Maximum number of queues fetched at once. Default is 4.
+
+    Returns:
+        Data frame with the team, submissionId, runTimeMinutes, sc, round,
+        status and challenge of every submission in a round
+    '''
+    queues = [(challenge['name'], queue)
+              for challenge in config['challenges']
+              for queue in challenge['queues']]
+    evaluationids = sorted(set(str(queue['evaluationid'])
+                               for _, queue in queues))
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers) as executor:
+        fetched = dict(zip(evaluationids, executor.map(
+            lambda evaluationid: get_queue_submissions(syn, evaluationid),
+            evaluationids)))
+    frames = []
+    for challenge, queue in queues:
+        submissionsdf = fetched[str(queue['evaluationid'])].copy()
+        submissionsdf['round'] = assign_rounds(
+            submissionsdf['createdOn'].values, queue['rounds'])
+        submissionsdf = submissionsdf[submissionsdf['round'].notnull()].assign(
+            sc=queue['sc'], challenge=challenge)
+        frames.append(submissionsdf[SUBMISSION_COLUMNS])
+    if not frames:
+        return(pd.DataFrame(columns=SUBMISSION_COLUMNS))
+    return(pd.concat(frames, ignore_index=True))
+
+
+def summarize_docker_stats(submissionsdf):
+    '''
+    Aggregates the runtime of SCORED and INVALID (every other status)
+    submissions per challenge, sub challenge and round
+
+    Args:
+        submissionsdf: Data frame from get_docker_submission_stats
+
+    Returns:
+        Data frame with the number of teams, averageRunTime (rounded up),
+        totalRunTime and numberSubmissions
+    '''
+    submissionsdf = submissionsdf.assign(status=np.where(
+        submissionsdf['status'] == 'SCORED', 'SCORED', 'INVALID'))
+    # sort=False because rounds and sub challenges mix numbers and names
+    grouped = submissionsdf.groupby(
+        ['challenge', 'sc', 'round', 'status'], sort=False)
+    statsdf = pd.DataFrame({
+        'teams': grouped['team'].nunique(),
+        'averageRunTime': np.ceil(grouped['runTimeMinutes'].mean()),
+        'totalRunTime': grouped['runTimeMinutes'].sum(),
+        'numberSubmissions': grouped.size()}).reset_index()
+    return(statsdf[STAT_COLUMNS])
@@ -1,5 +1,7 @@
+import json
 import os
 from . import utils
+from .submission_cache import SubmissionCache, SUBMISSION_CACHE_DIR
 
 
 def get_submitterid_from_submission_id(syn, submissionid, queue,
@@ -17,35 +19,247 @@ def get_submitterid_from_submission_id(syn, submissionid, queue,
     return(submitterid)
 
 
+def _get_submitterid(submission):
+    '''
+    The submitter of a team submission is the team, otherwise the user
+    '''
+    if submission.get('teamId') is not None:
+        return(str(submission['teamId']))
+    return(str(submission['userId']))
+
+
+def _lead_submission_clause(cutoff_annotation):
+    return("prediction_file_status == 'SCORED' and '" +
+           cutoff_annotation + "' == 'true'")
+
+
+def _download_lead_submission(syn, objectid, verbose=False,
+                              cache_dir=SUBMISSION_CACHE_DIR,
+                              overwrite=False):
+    '''
+    Gets the lead submission from the submission cache as
+    previous_submission.csv.  Unless overwrite is set, an existing
+    previous_submission.csv is kept and previous_submission(1).csv...
+    is used instead.
+    '''
+    if verbose:
+        print("Dowloading submissionid: " + objectid)
+    cache = SubmissionCache(cache_dir)
+    return(cache.get_submission_file(syn, objectid,
+                                     "previous_submission.csv",
+                                     overwrite=overwrite))
+
+
 def get_submitters_lead_submission(syn, submitterid, queue,
-                                   cutoff_annotation, verbose=False):
+                                   cutoff_annotation, verbose=False,
+                                   cache_dir=SUBMISSION_CACHE_DIR,
+                                   overwrite=False):
     query = ("select * from " + queue +
              " where submitterId == " + str(submitterid) +
-             " and prediction_file_status == 'SCORED' and '" +
-             cutoff_annotation + "' == 'true'" +
+             " and " + _lead_submission_clause(cutoff_annotation) +
              " order by createdOn DESC")
     generator = utils.evaluation_queue_query(syn, query)
     lst = list(generator)
     if len(lst) > 0:
         sub_dict = lst[0]
         objectid = sub_dict['objectId']
-        if verbose:
-            print("Dowloading submissionid: " + objectid)
-        sub = syn.getSubmission(objectid, downloadLocation=".")
-        os.rename(sub.filePath, "previous_submission.csv")
-        return("previous_submission.csv")
+        return(_download_lead_submission(syn, objectid, verbose,
+                                         cache_dir=cache_dir,
+                                         overwrite=overwrite))
     else:
         print("Downloading no file")
 
 
+class LeadSubmissionIndex(object):
+    '''
+    Maps each submitter of an evaluation queue to their latest SCORED
+    submission that met the cutoff.  The index is built with one query
+    and then only submissions modified since the last refresh are queried.
+
+    Args:
+        syn: Synapse object
+        evaluationid: Evaluation queue id
+        cutoff_annotation: Annotation that is 'true' when the
+                           submission met the cutoff
+        path: Json file to store the index in.  Default is None (in memory)
+    '''
+    def __init__(self, syn, evaluationid, cutoff_annotation="met_cutoff",
+                 path=None):
+        self.syn = syn
+        self.evaluationid = str(evaluationid)
+        self.cutoff_annotation = cutoff_annotation
+        self.path = path
+        self.leads = {}
+        self.last_modified = None
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as index_file:
+                stored = json.load(index_file)
+            if stored['evaluationid'] == self.evaluationid and \
+                    stored['cutoff_annotation'] == cutoff_annotation:
+                self.leads = stored['leads']
+                self.last_modified = stored['last_modified']
+
+    @property
+    def queue(self):
+        return("evaluation_" + self.evaluationid)
+
+    def _is_lead(self, row):
+        return(row.get('prediction_file_status') == 'SCORED' and
+               str(row.get(self.cutoff_annotation)).lower() == 'true')
+
+    def _update_last_modified(self, row):
+        if row.get('modifiedOn') is not None:
+            self.last_modified = max(int(row['modifiedOn']),
+                                     self.last_modified or 0)
+
+    def _set_if_later(self, row):
+        lead = self.leads.get(row['submitterId'])
+        if lead is None or int(row['createdOn']) > int(lead['createdOn']):
+            self.leads[row['submitterId']] = {
+                'objectId': row['objectId'],
+                'createdOn': row['createdOn']}
+
+    def _query_submitter_lead(self, submitterid):
+        query = ("select objectId, submitterId, createdOn from " +
+                 self.queue + " where submitterId == " + str(submitterid) +
+                 " and " + _lead_submission_clause(self.cutoff_annotation) +
+                 " order by createdOn DESC")
+        # Only the first row is read, so no further pages are requested
+        row = next(iter(utils.evaluation_queue_query(self.syn, query)), None)
+        self.leads.pop(submitterid, None)
+        if row is not None:
+            self._set_if_later(row)
+
+    def refresh(self):
+        '''
+        Builds the index or updates it with the submissions modified since
+        the last refresh
+        '''
+        columns = ("objectId, submitterId, createdOn, modifiedOn, "
+                   "prediction_file_status, " + self.cutoff_annotation)
+        if self.last_modified is None:
+            query = ("select " + columns + " from " + self.queue +
+                     " where " +
+                     _lead_submission_clause(self.cutoff_annotation))
+        else:
+            query = ("select " + columns + " from " + self.queue +
+                     " where modifiedOn >= " + str(self.last_modified))
+        requery = set()
+        for row in utils.evaluation_queue_query(self.syn, query, limit=500):
+            self._update_last_modified(row)
+            if self._is_lead(row):
+                self._set_if_later(row)
+            elif self.leads.get(row['submitterId'], {}).get('objectId') == \
+                    row['objectId']:
+                # The lead no longer met the cutoff
+                requery.add(row['submitterId'])
+        for submitterid in requery:
+            self._query_submitter_lead(submitterid)
+        if self.path is not None:
+            self.save()
+
+    def save(self):
+        '''Saves the index to its json file'''
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as index_file:
+            json.dump({'evaluationid': self.evaluationid,
+                       'cutoff_annotation': self.cutoff_annotation,
+                       'last_modified': self.last_modified,
+                       'leads': self.leads}, index_file)
+        os.replace(temp_path, self.path)
+
+    def get_lead_submissionid(self, submitterid):
+        '''
+        Gets the latest SCORED submission that met the cutoff
+
+        Args:
+            submitterid: Synapse user or team id
+
+        Returns:
+            Submission id or None
+        '''
+        lead = self.leads.get(str(submitterid))
+        return(lead['objectId'] if lead is not None else None)
+
+
 def download_current_lead_sub(syn, submissionid, status,
-                              cutoff_annotation, verbose=False):
+                              cutoff_annotation, verbose=False,
+                              index_path=None,
+                              cache_dir=SUBMISSION_CACHE_DIR,
+                              overwrite=False):
+    '''
+    Downloads the lead submission of the submitter of a validated
+    submission as previous_submission.csv
+
+    Args:
+        syn: Synapse object
+        submissionid: Id of the current submission
+        status: Status of the current submission
+        cutoff_annotation: Annotation that is 'true' when the
+                           submission met the cutoff
+        verbose: Print the submitter and downloaded submission
+        index_path: Json file of the lead submission index of the queue.
+                    Default is None (query the queue)
+        cache_dir: Directory of the submission file cache.
+                   Default is SUBMISSION_CACHE_DIR
+        overwrite: Overwrite an existing previous_submission.csv instead
+                   of writing previous_submission(1).csv... Default is False
+
+    Returns:
+        Path of the downloaded lead submission
+    '''
     if status == "VALIDATED":
         current_sub = syn.getSubmission(submissionid, downloadFile=False)
         queue_num = current_sub['evaluationId']
         queue = "evaluation_" + queue_num
-        submitterid = get_submitterid_from_submission_id(
-            syn, submissionid, queue, verbose)
-        path = get_submitters_lead_submission(
-            syn, submitterid, queue, cutoff_annotation, verbose)
+        submitterid = _get_submitterid(current_sub)
+        if verbose:
+            print("submitterid: " + submitterid)
+        if index_path is None:
+            path = get_submitters_lead_submission(
+                syn, submitterid, queue, cutoff_annotation, verbose,
+                cache_dir=cache_dir, overwrite=overwrite)
+        else:
+            index = LeadSubmissionIndex(
+                syn, queue_num, cutoff_annotation, path=index_path)
+            index.refresh()
+            objectid = index.get_lead_submissionid(submitterid)
+            if objectid is None:
+                print("Downloading no file")
+                return(None)
+            path = _download_lead_submission(syn, objectid, verbose,
+                                             cache_dir=cache_dir,
+                                             overwrite=overwrite)
         return(path)
+
+
+def get_current_lead_subs(syn, evaluationid, cutoff_annotation,
+                          status="VALIDATED", index_path=None):
+    '''
+    Resolves the lead submission of the submitter of every pending
+    submission of a queue in one pass
+
+    Args:
+        syn: Synapse object
+        evaluationid: Evaluation queue id
+        cutoff_annotation: Annotation that is 'true' when the
+                           submission met the cutoff
+        status: Status of the pending submissions. Default is VALIDATED
+        index_path: Json file of the lead submission index of the queue.
+                    Default is None (in memory)
+
+    Returns:
+        List of dicts with the submissionId, submitterId and
+        leadSubmissionId (None if there is no lead submission)
+    '''
+    index = LeadSubmissionIndex(
+        syn, evaluationid, cutoff_annotation, path=index_path)
+    index.refresh()
+    query = ("select objectId, submitterId from evaluation_{} "
+             "where status == '{}'".format(evaluationid, status))
+    pending = utils.evaluation_queue_query(syn, query, limit=500)
+    return([{'submissionId': row['objectId'],
+             'submitterId': row['submitterId'],
+             'leadSubmissionId': index.get_lead_submissionid(
+                 row['submitterId'])}
+            for row in pending])
@@ -0,0 +1,121 @@
+'''
+Participation statistics across challenges.  The team memberships of all
+challenges are fetched concurrently and the profile of every user is
+fetched once, in batches, no matter how many challenges they joined.
+'''
+import concurrent.futures
+import json
+import logging
+import pandas as pd
+logger = logging.getLogger(__name__)
+
+# Challenges, participant teams and preregistrant teams
+LANDSCAPE_TABLE = "syn10163902"
+# Maximum number of ids of one batch user profile request
+PROFILE_BATCH_SIZE = 100
+
+
+def _get_team_members(syn, teamid):
+    '''
+    Helper function to get the user id and name of the members of a team
+    '''
+    return([(str(member['member']['ownerId']), member['member']['userName'])
+            for member in syn._GET_paginated(
+                '/teamMembers/{}'.format(teamid), limit=50)])
+
+
+def get_user_profiles(syn, userids, batch_size=PROFILE_BATCH_SIZE):
+    '''
+    Gets the profiles of many users with one request per batch of users
+
+    Args:
+        syn: Synapse object
+        userids: List of Synapse user ids
+        batch_size: Number of profiles per request. Default is 100.
+
+    Returns:
+        dict mapping user id to user profile
+    '''
+    userids = list(userids)
+    profiles = {}
+    for start in range(0, len(userids), batch_size):
+        batch = userids[start:start + batch_size]
+        response = syn.restPOST('/userProfile', json.dumps({'list': batch}))
+        for profile in response['list']:
+            profiles[str(profile['ownerId'])] = profile
+    return(profiles)
+
+
+def _challenge_teams(row):
+    teams = [str(row['participants'])]
+    if not pd.isnull(row['preregistrants']):
+        teams.append(str(int(row['preregistrants'])))
+    return(teams)
+
+
+def get_landscape_stats(syn, landscapedf, max_workers=8):
+    '''
+    Gets the teams, users and user locations of challenges
+
+    Args:
+        syn: Synapse object
+        landscapedf: Data frame with the challenge, participants and
+                     preregistrants team ids and year of challenges
+        max_workers: Maximum number of teams fetched at once. Default is 8.
+
+    Returns:
+        Data frame with the challenges, teams, createdOn, users and
+        locations of every challenge
+    '''
+    landscapedf = landscapedf.drop_duplicates("challenge")
+    challenge_teams = [_challenge_teams(row)
+                       for _, row in landscapedf.iterrows()]
+    teamids = sorted(set(teamid for teams in challenge_teams
+                         for teamid in teams))
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers) as executor:
+        team_members = dict(zip(teamids, executor.map(
+            lambda teamid: _get_team_members(syn, teamid), teamids)))
+
+    usernames = dict(member for members in team_members.values()
+                     for member in members)
+    logger.info("Getting the profiles of {} users of {} teams".format(
+        len(usernames), len(teamids)))
+    profiles = get_user_profiles(syn, sorted(usernames))
+
+    users = []
+    locations = []
+    for teams in challenge_teams:
+        userids = sorted(set(userid for teamid in teams
+                             for userid, _ in team_members[teamid]))
+        users.append(",".join(usernames[userid] for userid in userids))
+        locations.append("|".join(
+            profiles[userid]['location'] for userid in userids
+            if profiles.get(userid, {}).get('location')))
+    return(pd.DataFrame({
+        'challenges': landscapedf['challenge'].values,
+        'teams': [",".join(teams) for teams in challenge_teams],
+        'createdOn': landscapedf['year'].values,
+        'users': users,
+        'locations': locations},
+        columns=['challenges', 'teams', 'createdOn', 'users', 'locations']))
+
+
+def get_landscape_table_stats(syn, tableid=LANDSCAPE_TABLE, max_workers=8):
+    '''
+    Gets the teams, users and user locations of the challenges in a table
+
+    Args:
+        syn: Synapse object
+        tableid: Synapse id of a table with the challenge, participants,
+                 preregistrants and year columns. Default is LANDSCAPE_TABLE
+        max_workers: Maximum number of teams fetched at once. Default is 8.
+
+    Returns:
+        Data frame with the challenges, teams, createdOn, users and
+        locations of every challenge
+    '''
+    landscapedf = syn.tableQuery(
+        'select challenge, participants, preregistrants, "year" '
+        'from {}'.format(tableid)).asDataFrame()
+    return(get_landscape_stats(syn, landscapedf, max_workers=max_workers))
@@ -0,0 +1,145 @@
+'''
+Cache of the Synapse credentials of the last login.  A full login checks
+the client version, resolves the Synapse endpoints and exchanges the
+username and password for an API key, which takes several requests.  The
+credentials and endpoints are cached in a file only the user can read, so
+later logins within SESSION_TTL make no requests.
+'''
+import json
+import logging
+import os
+import stat
+import time
+import synapseclient
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_PATH = os.path.join(
+    os.path.expanduser('~'), '.challengeutils', 'session.json')
+# Same lifetime as a Synapse session
+SESSION_TTL = 24 * 60 * 60
+ENDPOINTS = ['repoEndpoint', 'authEndpoint', 'fileHandleEndpoint',
+             'portalEndpoint']
+
+
+def _config_mtime(synapse_config):
+    try:
+        return(os.path.getmtime(synapse_config))
+    except OSError:
+        return(None)
+
+
+def read_session(synapse_config, path=SESSION_CACHE_PATH):
+    '''
+    Reads the cached session of a Synapse config file
+
+    Args:
+        synapse_config: Path to the Synapse config file
+        path: Path to the session cache. Default is SESSION_CACHE_PATH
+
+    Returns:
+        dict with the username, apiKey and endpoints or None if there is
+        no session, it expired, the config file changed since it was cached
+        or others can read it
+    '''
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return(None)
+    if mode & (stat.S_IRWXG | stat.S_IRWXO):
+        logger.warning("Ignoring {} because others can read it".format(path))
+        return(None)
+    try:
+        with open(path, 'r') as session_file:
+            session = json.load(session_file)
+    except ValueError:
+        return(None)
+    if session.get('expiresOn', 0) <= time.time():
+        return(None)
+    if session.get('synapseConfig') != os.path.abspath(synapse_config) or \
+            session.get('configModifiedOn') != _config_mtime(synapse_config):
+        return(None)
+    return(session)
+
+
+def write_session(syn, synapse_config, path=SESSION_CACHE_PATH,
+                  ttl=SESSION_TTL):
+    '''
+    Caches the credentials and endpoints of a logged in Synapse object.
+    The cache is only readable by the user.
+
+    Args:
+        syn: Synapse object
+        synapse_config: Path to the Synapse config file
+        path: Path to the session cache. Default is SESSION_CACHE_PATH
+        ttl: Seconds the session is reused for. Default is SESSION_TTL
+    '''
+    session_dir = os.path.dirname(path)
+    if not os.path.exists(session_dir):
+        os.makedirs(session_dir, 0o700)
+    session = {'username': syn.credentials.username,
+               'apiKey': syn.credentials.api_key,
+               'endpoints': {point: getattr(syn, point)
+                             for point in ENDPOINTS},
+               'synapseConfig': os.path.abspath(synapse_config),
+               'configModifiedOn': _config_mtime(synapse_config),
+               'expiresOn': time.time() + ttl}
+    temp_path = path + '.tmp'
+    session_fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+    # The mode of os.open doesn't apply to an existing file
+    os.chmod(temp_path, 0o600)
+    with os.fdopen(session_fd, 'w') as session_file:
+        json.dump(session, session_file)
+    os.replace(temp_path, path)
+
+
+def clear_session(path=SESSION_CACHE_PATH):
+    '''
+    Removes the cached session, so the next login is a full login
+    '''
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _full_login(synapse_config):
+    try:
+        syn = synapseclient.login(silent=True)
+    except Exception:
+        syn = synapseclient.Synapse(configPath=synapse_config)
+        syn.login(silent=True)
+    return(syn)
+
+
+def cached_login(synapse_config=None, path=SESSION_CACHE_PATH,
+                 ttl=SESSION_TTL, force=False):
+    '''
+    Logs in with the cached session or, when there is no valid one, with
+    the Synapse config file and caches the new session
+
+    Args:
+        synapse_config: Path to the Synapse config file.
+                        Default is ~/.synapseConfig
+        path: Path to the session cache. Default is SESSION_CACHE_PATH
+        ttl: Seconds a new session is reused for. Default is SESSION_TTL
+        force: Log in with the config file even if there is a cached
+               session. Default is False.
+
+    Returns:
+        tuple of the Synapse object and whether the cached session was used
+    '''
+    if synapse_config is None:
+        synapse_config = synapseclient.client.CONFIG_FILE
+    session = None if force else read_session(synapse_config, path=path)
+    if session is not None:
+        syn = synapseclient.Synapse(configPath=synapse_config,
+                                    skip_checks=True,
+                                    **session['endpoints'])
+        syn.login(email=session['username'], apiKey=session['apiKey'],
+                  silent=True)
+        return(syn, True)
+    syn = _full_login(synapse_config)
+    try:
+        write_session(syn, synapse_config, path=path, ttl=ttl)
+    except (OSError, IOError) as err:
+        logger.warning("Can't cache the session in {}: {}".format(path, err))
+    return(syn, False)
@@ -1,13 +1,260 @@
+import concurrent.futures
+import hashlib
+import json
 import logging
+import os
 import re
 import synapseutils
 from synapseclient.exceptions import SynapseHTTPError
-logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def mirrorwiki(syn, entity, destination, force_merge=False):
+def _get_wiki_state(syn, owner, wikiid):
+    '''
+    Helper function to get the etag and modifiedOn of a wiki page.
+    Only the page metadata is fetched, the markdown is not downloaded.
+
+    Args:
+        syn: Synapse object
+        owner: Synapse Entity that owns the wiki
+        wikiid: Id of the wiki page
+
+    Returns:
+        dict with id, etag and modifiedOn of the wiki page
+    '''
+    page = syn.restGET('/entity/{}/wiki2/{}'.format(owner.id, wikiid))
+    return({'id': page['id'],
+            'etag': page.get('etag'),
+            'modifiedOn': page.get('modifiedOn')})
+
+
+def _wiki_content_hash(wiki):
+    '''
+    Helper function to compute the md5 of a wiki page's markdown and
+    attachment file handles
+
+    Args:
+        wiki: Synapse Wiki
+
+    Returns:
+        md5 hex digest
+    '''
+    md5 = hashlib.md5()
+    md5.update((wiki.markdown or '').encode('utf-8'))
+    attachments = wiki.get('attachmentFileHandleIds') or []
+    md5.update(','.join(map(str, attachments)).encode('utf-8'))
+    return(md5.hexdigest())
+
+
+def _manifest_key(entity, destination):
+    return("{}->{}".format(entity.id, destination.id))
+
+
+def load_manifest(manifest_path, entity, destination):
+    '''
+    Loads the page states of the last successful mirror between
+    entity and destination
+
+    Args:
+        manifest_path: Path to the manifest json file
+        entity: Synapse Entity with the source wiki
+        destination: Synapse Entity with the destination wiki
+
+    Returns:
+        dict mapping wiki title to its recorded page state
+    '''
+    if manifest_path is None or not os.path.exists(manifest_path):
+        return({})
+    with open(manifest_path, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+    return(manifest.get(_manifest_key(entity, destination), {}))
+
+
+def save_manifest(manifest_path, entity, destination, page_states):
+    '''
+    Saves the page states of a successful mirror between entity and
+    destination.  Other mirrors recorded in the manifest are kept.
+
+    Args:
+        manifest_path: Path to the manifest json file
+        entity: Synapse Entity with the source wiki
+        destination: Synapse Entity with the destination wiki
+        page_states: dict mapping wiki title to its page state
+    '''
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+    manifest[_manifest_key(entity, destination)] = page_states
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+def _state_unchanged(recorded, current):
+    '''
+    Compares a recorded page state with the current page state.
+    The etag is used when available, otherwise modifiedOn.
+    '''
+    if recorded is None or recorded.get('id') != current['id']:
+        return(False)
+    if current.get('etag') is not None:
+        return(recorded.get('etag') == current['etag'])
+    return(current.get('modifiedOn') is not None and
+           recorded.get('modifiedOn') == current['modifiedOn'])
+
+
+def _rewrite_markdown(markdown, entity, destination, wiki_mapping):
+    '''
+    Rewrites the links to entity's wiki pages and entity's Synapse id
+    to point to the destination
+
+    Args:
+        markdown: Wiki markdown
+        entity: Synapse Entity with the source wiki
+        destination: Synapse Entity with the destination wiki
+        wiki_mapping: dict mapping entity wiki ids to destination wiki ids
+
+    Returns:
+        Rewritten markdown
+    '''
+    for entity_page_id in wiki_mapping:
+        entity_project_and_wiki_id = "{}/wiki/{}".format(
+            entity.id, entity_page_id)
+        destination_project_and_wiki_id = "{}/wiki/{}".format(
+            destination.id, wiki_mapping[entity_page_id])
+        markdown = re.sub(entity_project_and_wiki_id,
+                          destination_project_and_wiki_id,
+                          markdown)
+        # Some widgets that you fill in with synapse links are auto encoded.
+        # / -> %2F
+        encoded_entity_project_and_wiki_id = "{}%2Fwiki%2F{}".format(
+            entity.id, entity_page_id)
+        encoded_destination_project_and_wiki_id = "{}%2Fwiki%2F{}".format(
+            destination.id, wiki_mapping[entity_page_id])
+        markdown = re.sub(encoded_entity_project_and_wiki_id,
+                          encoded_destination_project_and_wiki_id,
+                          markdown)
+    markdown = re.sub(entity.id, destination.id, markdown)
+    return(markdown)
+
+
+def _copy_attachments(syn, entity_wiki):
+    '''
+    Copies the attachments of a wiki page, excluding previews
+
+    Args:
+        syn: Synapse object
+        entity_wiki: Synapse Wiki
+
+    Returns:
+        List of new attachment file handle ids
+    '''
+    if len(entity_wiki['attachmentFileHandleIds']) == 0:
+        return([])
+    attachments = [
+        syn._getFileHandleDownload(filehandleid, entity_wiki.id,
+                                   objectType='WikiAttachment')
+        for filehandleid in entity_wiki['attachmentFileHandleIds']]
+    # Remove preview attachments
+    no_previews = [
+        attachment['fileHandle'] for attachment in attachments
+        if attachment['fileHandle']['concreteType'] !=
+        "org.sagebionetworks.repo.model.file.PreviewFileHandle"]
+    content_types = [attachment['contentType'] for attachment in no_previews]
+    file_names = [attachment['fileName'] for attachment in no_previews]
+    copied_filehandles = synapseutils.copyFileHandles(
+        syn, no_previews, ["WikiAttachment"]*len(no_previews),
+        [entity_wiki.id]*len(no_previews), content_types, file_names)
+    new_attachments = [filehandle['newFileHandle']['id']
+                       for filehandle in copied_filehandles['copyResults']]
+    return(new_attachments)
+
+
+def _get_destination_headers(syn, destination):
+    '''
+    Helper function to get the wiki headers of the destination
+
+    Args:
+        syn: Synapse object
+        destination: Synapse Entity with the destination wiki
+
+    Returns:
+        Wiki headers
+    '''
+    try:
+        destination_wiki = syn.getWikiHeaders(destination)
+    except SynapseHTTPError:
+        raise ValueError("The destination Project has no Wiki. Mirroring a"
+                         " Wiki requires that the source and destination "
+                         "Projects have the same structure. You may want "
+                         "to use the copy wiki functionality provided "
+                         "by 'synapseutils.copyWiki'")
+    return(destination_wiki)
+
+
+def _get_wiki_mapping(entity_wiki_pages, destination_wiki):
+    '''
+    Helper function to map the wiki pages of the entity to the destination
+    by title
+
+    Args:
+        entity_wiki_pages: dict mapping entity wiki titles to wiki ids
+        destination_wiki: Destination wiki headers
+
+    Returns:
+        dict mapping destination wiki titles to wiki ids,
+        dict mapping entity wiki ids to destination wiki ids
+    '''
+    destination_wiki_pages = {}
+    # Mapping dictionary containing wiki page mapping between
+    # entity and destination
+    wiki_mapping = {}
+    for wiki in destination_wiki:
+        destination_wiki_pages[wiki['title']] = wiki['id']
+        # Account for pages that exist in the new page that
+        # don't exist in the old page
+        if entity_wiki_pages.get(wiki['title']) is not None:
+            wiki_mapping[entity_wiki_pages[wiki['title']]] = wiki['id']
+    return(destination_wiki_pages, wiki_mapping)
+
+
+def _store_mirrored_page(syn, title, entity, destination, entity_wiki,
+                         destination_wiki, wiki_mapping, new_attachments,
+                         force_merge=False):
+    '''
+    Helper function to update a destination wiki page with the entity
+    wiki page
+
+    Args:
+        syn: Synapse object
+        title: Wiki title
+        entity: Synapse Entity with the source wiki
+        destination: Synapse Entity with the destination wiki
+        entity_wiki: Source Synapse Wiki
+        destination_wiki: Destination Synapse Wiki
+        wiki_mapping: dict mapping entity wiki ids to destination wiki ids
+        new_attachments: Attachment file handle ids of the destination page
+        force_merge: this will update a page even if its the same
+
+    Returns:
+        Stored destination Synapse Wiki
+    '''
+    if destination_wiki.markdown == entity_wiki.markdown and not force_merge:
+        logger.info("Skipping page update: {}".format(title))
+    else:
+        logger.info("Updating: {}".format(title))
+        destination_wiki.markdown = _rewrite_markdown(
+            entity_wiki.markdown, entity, destination, wiki_mapping)
+    # All attachments must be updated
+    destination_wiki.update({'attachmentFileHandleIds': new_attachments})
+    return(syn.store(destination_wiki))
+
+
+def mirrorwiki(syn, entity, destination, force_merge=False,
+               manifest_path=None):
     """
     This script is responsible for mirroring wiki pages
     It relies on the wiki titles between two Synapse Projects to be
@@ -20,6 +267,12 @@ def mirrorwiki(syn, entity, destination, force_merge=False):
         destination: Synapse File, Project, Folder Entity or Id
                      with Wiki that matches entity
         force_merge: this will update a page even if its the same
+        manifest_path: Path to a json manifest recording the etag,
+                       modifiedOn and content md5 of each page from the
+                       last successful mirror.  Pages whose source and
+                       destination headers have not changed since are
+                       skipped without downloading their markdown.
+                       Default is None (no manifest).
 
     Returns:
         nothing
@@ -28,78 +281,187 @@ def mirrorwiki(syn, entity, destination, force_merge=False):
     destination = syn.get(destination, downloadFile=False)
     # TODO: getWikiHeaders fails when there is no wiki
     entity_wiki = syn.getWikiHeaders(entity)
-    try:
-        destination_wiki = syn.getWikiHeaders(destination)
-    except SynapseHTTPError:
-        raise ValueError("The destination Project has no Wiki. Mirroring a"
-                         " Wiki requires that the source and destination "
-                         "Projects have the same structure. You may want "
-                         "to use the copy wiki functionality provided "
-                         "by 'synapseutils.copyWiki'")
+    destination_wiki = _get_destination_headers(syn, destination)
 
     # Get mapping of wiki pages
     entity_wiki_pages = {}
     for wiki in entity_wiki:
         entity_wiki_pages[wiki['title']] = wiki['id']
-    destination_wiki_pages = {}
-    # Mapping dictionary containing wiki page mapping between
-    # entity and destination
-    wiki_mapping = {}
-    for wiki in destination_wiki:
-        destination_wiki_pages[wiki['title']] = wiki['id']
-        # Account for pages that exist in the new page that
-        # don't exist in the old page
-        if entity_wiki_pages.get(wiki['title']) is not None:
-            wiki_mapping[entity_wiki_pages[wiki['title']]] = wiki['id']
+    destination_wiki_pages, wiki_mapping = _get_wiki_mapping(
+        entity_wiki_pages, destination_wiki)
+
+    use_manifest = manifest_path is not None
+    recorded_states = load_manifest(manifest_path, entity, destination)
+    page_states = {}
     # TODO: Need to account for new pages ###
     for title in entity_wiki_pages:
-        entity_wiki = syn.getWiki(entity, entity_wiki_pages[title])
         # If destination wiki does not have the title page, do not update
-        if destination_wiki_pages.get(title) is not None:
-            destination_wiki = syn.getWiki(destination,
-                                           destination_wiki_pages[title])
-            if destination_wiki.markdown == entity_wiki.markdown and not force_merge:
-                logger.info("Skipping page update: {}".format(title))
-            else:
-                logger.info("Updating: {}".format(title))
-                destination_wiki.markdown = entity_wiki.markdown
-                for entity_page_id in wiki_mapping:
-                    entity_project_and_wiki_id = "{}/wiki/{}".format(
-                        entity.id,
-                        entity_page_id)
-                    destination_project_and_wiki_id = "{}/wiki/{}".format(
-                        destination.id,
-                        wiki_mapping[entity_page_id])
-                    destination_wiki.markdown = re.sub(entity_project_and_wiki_id,
-                                                       destination_project_and_wiki_id,
-                                                       destination_wiki.markdown)
-                    # Some widgets that you fill in with synapse links are auto encoded. / -> %2F
-                    encoded_entity_project_and_wiki_id = "{}%2Fwiki%2F{}".format(entity.id, entity_page_id)
-                    encoded_destination_project_and_wiki_id = "{}%2Fwiki%2F{}".format(destination.id, wiki_mapping[entity_page_id])
-                    destination_wiki.markdown = re.sub(encoded_entity_project_and_wiki_id,
-                                                       encoded_destination_project_and_wiki_id,
-                                                       destination_wiki.markdown)
-                destination_wiki.markdown = re.sub(entity.id,
-                                                   destination.id,
-                                                   destination_wiki.markdown)
-            # All attachments must be updated
-            if len(entity_wiki['attachmentFileHandleIds']) > 0:
-                attachments = [syn._getFileHandleDownload(filehandleid, entity_wiki.id, objectType='WikiAttachment') for filehandleid in entity_wiki['attachmentFileHandleIds']]
-                # Remove preview attachments
-                no_previews = [attachment['fileHandle'] for attachment in attachments if attachment['fileHandle']['concreteType'] != "org.sagebionetworks.repo.model.file.PreviewFileHandle"]
-                content_types = [attachment['contentType'] for attachment in no_previews]
-                file_names = [attachment['fileName'] for attachment in no_previews]
-                copied_filehandles = synapseutils.copyFileHandles(syn,
-                                                                  no_previews,
-                                                                  ["WikiAttachment"]*len(no_previews),
-                                                                  [entity_wiki.id]*len(no_previews),
-                                                                  content_types,
-                                                                  file_names)
-                new_attachments = [filehandle['newFileHandle']['id']
-                                   for filehandle in copied_filehandles['copyResults']]
-            else:
-                new_attachments = []
-            destination_wiki.update({'attachmentFileHandleIds': new_attachments})
-            destination_wiki = syn.store(destination_wiki)
-        else:
-            logger.info("{}: title not existent in destination wikis".format(title))
+        if destination_wiki_pages.get(title) is None:
+            logger.info(
+                "{}: title not existent in destination wikis".format(title))
+            continue
+        if use_manifest:
+            source_state = _get_wiki_state(
+                syn, entity, entity_wiki_pages[title])
+            destination_state = _get_wiki_state(
+                syn, destination, destination_wiki_pages[title])
+            recorded = recorded_states.get(title, {})
+            if not force_merge and \
+                    _state_unchanged(recorded.get('source'),
+                                     source_state) and \
+                    _state_unchanged(recorded.get('destination'),
+                                     destination_state):
+                logger.info("Skipping unchanged page: {}".format(title))
+                page_states[title] = recorded
+                continue
+        entity_wiki = syn.getWiki(entity, entity_wiki_pages[title])
+        destination_wiki = syn.getWiki(destination,
+                                       destination_wiki_pages[title])
+        content_md5 = _wiki_content_hash(entity_wiki)
+        if use_manifest and not force_merge and \
+                recorded.get('md5') == content_md5 and \
+                _state_unchanged(recorded.get('destination'),
+                                 destination_state):
+            # The source was saved without changing its content
+            logger.info("Skipping unchanged page: {}".format(title))
+            page_states[title] = {'source': source_state,
+                                  'destination': destination_state,
+                                  'md5': content_md5}
+            continue
+        destination_wiki = _store_mirrored_page(
+            syn, title, entity, destination, entity_wiki, destination_wiki,
+            wiki_mapping, _copy_attachments(syn, entity_wiki), force_merge)
+        if use_manifest:
+            page_states[title] = {
+                'source': source_state,
+                'destination': {
+                    'id': destination_wiki['id'],
+                    'etag': destination_wiki.get('etag'),
+                    'modifiedOn': destination_wiki.get('modifiedOn')},
+                'md5': content_md5}
+    if use_manifest:
+        save_manifest(manifest_path, entity, destination, page_states)
+
+
+def _mirror_source_pages(syn, entity, source_pages, destination,
+                         destination_headers, force_merge=False):
+    '''
+    Helper function to mirror already fetched source pages to a destination
+
+    Args:
+        syn: Synapse object
+        entity: Synapse Entity with the source wiki
+        source_pages: dict mapping wiki title to a dict with the source
+                      'wiki' and its copied 'attachments'
+        destination: Synapse Entity with Wiki that matches entity
+        destination_headers: Wiki headers of the destination
+        force_merge: this will update a page even if its the same
+
+    Returns:
+        List of updated wiki titles
+    '''
+    entity_wiki_pages = {title: source_pages[title]['wiki'].id
+                         for title in source_pages}
+    destination_wiki_pages, wiki_mapping = _get_wiki_mapping(
+        entity_wiki_pages, destination_headers)
+    updated = []
+    for title in source_pages:
+        if destination_wiki_pages.get(title) is None:
+            logger.info("{}: title not existent in {} wikis".format(
+                title, destination.id))
+            continue
+        destination_wiki = syn.getWiki(destination,
+                                       destination_wiki_pages[title])
+        # Each destination page gets its own copy of the attachment list
+        _store_mirrored_page(
+            syn, title, entity, destination, source_pages[title]['wiki'],
+            destination_wiki, wiki_mapping,
+            list(source_pages[title]['attachments']), force_merge)
+        updated.append(title)
+    return(updated)
+
+
+def _get_destination(syn, destination):
+    destination = syn.get(destination, downloadFile=False)
+    return(destination, _get_destination_headers(syn, destination))
+
+
+def mirrorwiki_to_destinations(syn, entity, destinations, force_merge=False,
+                               max_workers=None):
+    """
+    Mirrors the wiki pages of entity to many destinations.  The source
+    pages that exist in at least one destination and their attachments
+    are fetched once and the link rewrite and store are done for each
+    destination concurrently.
+
+    Args:
+        entity: Synapse File, Project, Folder Entity or Id with
+                Wiki you want to copy
+        destinations: List of Synapse File, Project, Folder Entity or Id
+                      with Wiki that matches entity.  A destination listed
+                      twice is mirrored once.
+        force_merge: this will update a page even if its the same
+        max_workers: Maximum number of destinations mirrored at once.
+                     Default is None (one per destination, up to 8).
+
+    Returns:
+        dict mapping destination to a dict with the 'status' (success or
+        failure), the 'updated' titles and the 'error' of the failure
+    """
+    entity = syn.get(entity, downloadFile=False)
+    unique_destinations = []
+    for destination in destinations:
+        if destination not in unique_destinations:
+            unique_destinations.append(destination)
+    if max_workers is None:
+        max_workers = min(len(unique_destinations), 8) or 1
+    report = {}
+
+    def report_failure(destination, ex):
+        report[destination] = {'status': 'failure', 'updated': [],
+                               'error': str(ex)}
+        logger.error("Failed to mirror {} to {}: {}".format(
+            entity.id, destination, ex))
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers) as executor:
+        futures = {executor.submit(_get_destination, syn, destination):
+                   destination for destination in unique_destinations}
+        fetched = {}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                fetched[futures[future]] = future.result()
+            except Exception as ex:
+                report_failure(futures[future], ex)
+
+        destination_titles = set(
+            header['title'] for _, headers in fetched.values()
+            for header in headers)
+        source_pages = {}
+        for wiki in syn.getWikiHeaders(entity):
+            # Pages no destination has are not mirrored
+            if wiki['title'] not in destination_titles:
+                continue
+            entity_wiki = syn.getWiki(entity, wiki['id'])
+            # The copied attachment file handles are shared by all
+            # destinations
+            source_pages[wiki['title']] = {
+                'wiki': entity_wiki,
+                'attachments': _copy_attachments(syn, entity_wiki)}
+
+        futures = {
+            executor.submit(_mirror_source_pages, syn, entity, source_pages,
+                            fetched[destination][0],
+                            fetched[destination][1], force_merge):
+            destination for destination in fetched}
+        for future in concurrent.futures.as_completed(futures):
+            destination = futures[future]
+            try:
+                report[destination] = {'status': 'success',
+                                       'updated': future.result(),
+                                       'error': None}
+                logger.info("Mirrored {} to {}".format(
+                    entity.id, destination))
+            except Exception as ex:
+                report_failure(destination, ex)
+    return(report)
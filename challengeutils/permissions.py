@@ -1,4 +1,8 @@
+import concurrent.futures
+import json
+import logging
 import synapseclient
+logger = logging.getLogger(__name__)
 VIEW = ["READ"]
 SUBMIT = ['READ', 'SUBMIT']
 DOWNLOAD = ['READ', 'DOWNLOAD']
@@ -98,3 +102,149 @@ def set_entity_permissions(syn, entity, principalid,
     entity = syn.get(entity, downloadFile=False)
     _set_permissions(
         syn, entity, principalid, permission_level)
+
+
+def _get_permission_level_mapping(objectid):
+    """
+    Helper function to get the permission level mapping of an object.
+    Synapse ids are entities, other ids are evaluation queues.
+    """
+    if synapseclient.utils.is_synapse_id(str(objectid)):
+        return(ENTITY_PERMS_MAPPINGS)
+    return(EVALUATION_PERMS_MAPPINGS)
+
+
+def _apply_acl_changes(acl, changes):
+    """
+    Applies permission changes to an ACL locally
+
+    Args:
+        acl: Access control list dict with resourceAccess
+        changes: dict mapping principal id to access types.  An empty list
+                 removes the permissions of the principal.
+
+    Returns:
+        List of changed permissions with principalId, before and after
+    """
+    resource_access = {
+        int(permissions['principalId']): permissions
+        for permissions in acl['resourceAccess']
+        if 'principalId' in permissions}
+    diff = []
+    for principalid, access_type in changes.items():
+        permissions = resource_access.get(int(principalid))
+        before = sorted(permissions['accessType']) if permissions else []
+        after = sorted(access_type)
+        if before == after:
+            continue
+        diff.append({'principalId': int(principalid),
+                     'before': before,
+                     'after': after})
+        if not access_type:
+            acl['resourceAccess'].remove(permissions)
+        elif permissions is None:
+            acl['resourceAccess'].append({'accessType': list(access_type),
+                                          'principalId': int(principalid)})
+        else:
+            permissions['accessType'] = list(access_type)
+    return(diff)
+
+
+def _update_acl(syn, objectid, changes, dry_run=False):
+    """
+    Helper function to get the ACL of an entity or evaluation once,
+    apply all the changes and store it once
+
+    Args:
+        syn: Synapse object
+        objectid: Synapse id or evaluation id
+        changes: dict mapping principal id to access types
+        dry_run: Only compute the changes, don't store the ACL
+
+    Returns:
+        List of changed permissions
+    """
+    if synapseclient.utils.is_synapse_id(str(objectid)):
+        benefactor = syn.restGET('/entity/%s/benefactor' % objectid)
+        acl = syn.restGET('/entity/%s/acl' % benefactor['id'])
+        inherits = benefactor['id'] != objectid
+    else:
+        acl = syn.restGET('/evaluation/%s/acl' % objectid)
+        inherits = False
+    diff = _apply_acl_changes(acl, changes)
+    if diff and not dry_run:
+        if not synapseclient.utils.is_synapse_id(str(objectid)):
+            syn.restPUT('/evaluation/acl', json.dumps(acl))
+        elif inherits:
+            logger.warning(
+                'Creating an ACL for entity %s, which formerly inherited '
+                'access control from a benefactor entity (%s).'
+                % (objectid, benefactor['id']))
+            syn.restPOST('/entity/%s/acl' % objectid, json.dumps(acl))
+        else:
+            syn.restPUT('/entity/%s/acl' % objectid, json.dumps(acl))
+    return(diff)
+
+
+def set_bulk_permissions(syn, object_permissions, dry_run=False,
+                         max_workers=5):
+    """
+    Sets the permissions of many users or teams on many entities and
+    evaluations.  The ACL of each object is fetched once, all its changes
+    are applied locally and it is stored once.
+
+    Args:
+        syn: Synapse object
+        object_permissions: dict mapping Synapse ids or evaluation ids to
+                            a dict of principal id or name to permission
+                            level.  A principal of None or "PUBLIC" gives
+                            anybody on the web access.
+                            {"syn123": {"3324230": "admin"},
+                             "9614112": {"3324230": "score"}}
+        dry_run: Only compute the changes, don't store the ACLs.
+                 Default is False.
+        max_workers: Maximum number of ACLs updated at once. Default is 5.
+
+    Returns:
+        dict mapping object id to a dict with the 'diff' of the
+        permissions and the 'error' of the failure
+    """
+    # Validate every permission level before any ACL is changed
+    for objectid, permissions in object_permissions.items():
+        permission_level_mapping = _get_permission_level_mapping(objectid)
+        for permission_level in permissions.values():
+            if permission_level not in permission_level_mapping.keys():
+                raise ValueError(
+                    "{0}: permission_level must be one of these: {1}".format(
+                        objectid, ', '.join(permission_level_mapping.keys())))
+
+    principalids = {}
+    for permissions in object_permissions.values():
+        for principal in permissions:
+            if principal not in principalids:
+                principalids[principal] = syn._getUserbyPrincipalIdOrName(
+                    principal)
+
+    changes = {
+        str(objectid): {
+            principalids[principal]:
+            _get_permission_level_mapping(objectid)[permission_level]
+            for principal, permission_level in permissions.items()}
+        for objectid, permissions in object_permissions.items()}
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_update_acl, syn, objectid,
+                            object_changes, dry_run): objectid
+            for objectid, object_changes in changes.items()}
+        for future in concurrent.futures.as_completed(futures):
+            objectid = futures[future]
+            try:
+                results[objectid] = {'diff': future.result(), 'error': None}
+            except Exception as ex:
+                logger.error("Failed to set ACL of {}: {}".format(
+                    objectid, ex))
+                results[objectid] = {'diff': [], 'error': str(ex)}
+    return(results)
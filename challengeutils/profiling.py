@@ -0,0 +1,173 @@
+'''
+Profiling of challengeutils commands.  RestProfiler records every HTTP
+request a Synapse object makes, per endpoint, and profile_command can
+also run cProfile and tracemalloc around a command.
+'''
+import bisect
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import pstats
+import re
+import threading
+import time
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf')]
+# Responses with these status codes are retried by the Synapse client
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+# Synapse ids, evaluation ids, submission ids and file handle ids
+ID_REGEX = re.compile(r'^(syn)?\d+(\.\d+)?$')
+
+
+def normalize_endpoint(url):
+    '''
+    Replaces the ids in the path of a url by {id}, so requests to the
+    same endpoint are counted together
+
+    Args:
+        url: Request url
+
+    Returns:
+        Path of the url with {id} for every id
+    '''
+    path = url.split('?', 1)[0].split('#', 1)[0]
+    # Remove the scheme and host
+    path = re.sub(r'^[a-z]+://[^/]+', '', path)
+    return("/".join("{id}" if ID_REGEX.match(part) else part
+                    for part in path.split("/")))
+
+
+class RestProfiler(object):
+    '''
+    Records the number of calls, latencies, bytes transferred and retried
+    responses of the HTTP requests of Synapse objects, per method and
+    endpoint
+    '''
+    def __init__(self):
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def install(self, syn):
+        '''
+        Wraps the requests session of a Synapse object so that all its
+        requests are recorded
+        '''
+        session = syn._requests_session
+        request = session.request
+
+        def profiled_request(method, url, *args, **kwargs):
+            start = time.time()
+            response = None
+            try:
+                response = request(method, url, *args, **kwargs)
+                return(response)
+            finally:
+                self.record(method, url, time.time() - start,
+                            kwargs.get('data'), response,
+                            kwargs.get('stream', False))
+        session.request = profiled_request
+        return(syn)
+
+    def record(self, method, url, seconds, data=None, response=None,
+               stream=False):
+        '''
+        Records a request.  A request without response failed to connect.
+        '''
+        sent = len(data) if isinstance(data, (bytes, str)) else 0
+        received = 0
+        if response is not None:
+            if 'Content-Length' in response.headers:
+                received = int(response.headers['Content-Length'])
+            elif not stream:
+                received = len(response.content)
+        retried = response is None or \
+            response.status_code in RETRY_STATUS_CODES
+        key = (method.upper(), normalize_endpoint(url))
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = {
+                    'calls': 0, 'retried': 0, 'seconds': 0.0,
+                    'maxSeconds': 0.0, 'bytesSent': 0, 'bytesReceived': 0,
+                    'histogram': [0] * len(LATENCY_BUCKETS)}
+            stats['calls'] += 1
+            stats['retried'] += int(retried)
+            stats['seconds'] += seconds
+            stats['maxSeconds'] = max(stats['maxSeconds'], seconds)
+            stats['bytesSent'] += sent
+            stats['bytesReceived'] += received
+            stats['histogram'][
+                bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def summary(self):
+        '''
+        Returns:
+            list of the stats of every method and endpoint, the slowest
+            first
+        '''
+        with self._lock:
+            rows = [dict(stats, method=method, endpoint=endpoint,
+                         histogram=list(stats['histogram']))
+                    for (method, endpoint), stats in self.stats.items()]
+        return(sorted(rows, key=lambda row: row['seconds'], reverse=True))
+
+    def format_table(self):
+        '''
+        Returns:
+            Text table of the calls, retried responses, total and mean
+            seconds and megabytes transferred per method and endpoint
+        '''
+        lines = ["{:<7} {:>6} {:>7} {:>9} {:>8} {:>9}  {}".format(
+            'method', 'calls', 'retried', 'seconds', 'mean', 'MB', 'endpoint')]
+        for row in self.summary():
+            lines.append(
+                "{:<7} {:>6} {:>7} {:>9.3f} {:>8.3f} {:>9.3f}  {}".format(
+                    row['method'], row['calls'], row['retried'],
+                    row['seconds'], row['seconds'] / row['calls'],
+                    (row['bytesSent'] + row['bytesReceived']) / 1024.0 ** 2,
+                    row['endpoint']))
+        return("\n".join(lines))
+
+    def write_json(self, path):
+        with open(path, 'w') as profile_file:
+            json.dump({'latencyBuckets': [str(bucket) for bucket
+                                          in LATENCY_BUCKETS],
+                       'endpoints': self.summary()},
+                      profile_file, indent=2)
+
+
+@contextlib.contextmanager
+def profile_command(cpu=False, memory=False, top=20):
+    '''
+    Logs the functions that took the most CPU time and the lines that
+    allocated the most memory in the context
+
+    Args:
+        cpu: Run cProfile. Default is False.
+        memory: Run tracemalloc. Default is False.
+        top: Number of functions and lines logged. Default is 20.
+    '''
+    profiler = cProfile.Profile() if cpu else None
+    if memory:
+        import tracemalloc
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            stats_text = io.StringIO()
+            pstats.Stats(profiler, stream=stats_text).sort_stats(
+                'cumulative').print_stats(top)
+            logger.info("CPU profile:\n{}".format(stats_text.getvalue()))
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            logger.info("Memory allocated by line:\n{}".format("\n".join(
+                str(stat) for stat in snapshot.statistics('lineno')[:top])))
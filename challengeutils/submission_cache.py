@@ -0,0 +1,164 @@
+'''
+Content addressed cache of downloaded submission files.  Files are
+keyed by their file handle id and MD5, so a submission that was already
+downloaded is served from the cache instead of being downloaded again.
+Cached files are read-only, so that a file linked to the cache can't
+change it.
+'''
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import time
+logger = logging.getLogger(__name__)
+
+SUBMISSION_CACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.challengeutils', 'submission_cache')
+# 5 GB
+SUBMISSION_CACHE_MAX_SIZE = 5 * 1024 ** 3
+
+
+def _md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as cached_file:
+        for chunk in iter(lambda: cached_file.read(1024 * 1024), b''):
+            md5.update(chunk)
+    return(md5.hexdigest())
+
+
+def unique_path(path):
+    '''
+    Appends (1), (2)... to the file name until the path doesn't exist
+
+    Args:
+        path: File path
+
+    Returns:
+        Path that doesn't exist
+    '''
+    root, ext = os.path.splitext(path)
+    count = 0
+    while os.path.exists(path):
+        count += 1
+        path = "{}({}){}".format(root, count, ext)
+    return(path)
+
+
+class SubmissionCache(object):
+    '''
+    Least recently used cache of submission files bounded by size
+
+    Args:
+        cache_dir: Directory of the cache. Default is SUBMISSION_CACHE_DIR
+        max_size: Maximum size of the cache in bytes.
+                  Default is SUBMISSION_CACHE_MAX_SIZE
+    '''
+    def __init__(self, cache_dir=SUBMISSION_CACHE_DIR,
+                 max_size=SUBMISSION_CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _cache_path(self, filehandleid, md5):
+        return(os.path.join(self.cache_dir, "{}_{}".format(filehandleid, md5)))
+
+    def _touch(self, path):
+        # The modification time records when the file was last used
+        now = time.time()
+        os.utime(path, (now, now))
+
+    def evict(self):
+        '''
+        Removes the least recently used files until the cache is smaller
+        than its maximum size
+        '''
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isfile(path):
+                file_stat = os.stat(path)
+                entries.append((file_stat.st_mtime, file_stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            logger.info("Evicting {} from the submission cache".format(path))
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+    def _download(self, syn, submissionid, filehandle):
+        '''
+        Downloads a submission file into the cache and checks its MD5
+        '''
+        download_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        try:
+            submission = syn.getSubmission(
+                submissionid, downloadLocation=download_dir)
+            md5 = filehandle.get('contentMd5')
+            if md5 is not None and _md5(submission.filePath) != md5:
+                raise ValueError(
+                    "MD5 of the downloaded submission {} does not match "
+                    "its file handle".format(submissionid))
+            cache_path = self._cache_path(filehandle['id'], md5)
+            os.chmod(submission.filePath,
+                     stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(submission.filePath, cache_path)
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+        return(cache_path)
+
+    def get_submission_file(self, syn, submissionid, path, link=False,
+                            overwrite=False):
+        '''
+        Gets the file of a submission from the cache, downloading it
+        if it is not cached.  Unless overwrite is set, an existing file at
+        path is kept and (1), (2)... is appended to the file name instead.
+
+        Args:
+            syn: Synapse object
+            submissionid: Id of a submission
+            path: Path to put the submission file at
+            link: Hardlink the cached file to path when possible instead
+                  of copying it.  A hardlinked file is read-only, like the
+                  cached file. Default is False.
+            overwrite: Replace an existing file at path. Default is False.
+
+        Returns:
+            Path of the submission file
+        '''
+        submission = syn.getSubmission(submissionid, downloadFile=False)
+        bundle = json.loads(submission['entityBundleJSON'])
+        filehandleid = bundle['entity']['dataFileHandleId']
+        filehandle = [handle for handle in bundle['fileHandles']
+                      if handle['id'] == filehandleid][0]
+        cache_path = self._cache_path(filehandleid,
+                                      filehandle.get('contentMd5'))
+        if os.path.exists(cache_path):
+            logger.info("Using cached file of submission {}".format(
+                submissionid))
+        else:
+            cache_path = self._download(syn, submissionid, filehandle)
+        self._touch(cache_path)
+
+        if not overwrite:
+            path = unique_path(path)
+        # Written next to path and renamed, so an existing file is
+        # replaced at once
+        temp_path = unique_path(path + '.tmp')
+        if link:
+            try:
+                os.link(cache_path, temp_path)
+            except OSError:
+                shutil.copyfile(cache_path, temp_path)
+        else:
+            shutil.copyfile(cache_path, temp_path)
+        os.replace(temp_path, path)
+        self.evict()
+        return(path)
@@ -0,0 +1,157 @@
+'''
+Synchronizes a Synapse table with a data frame.  Rows are matched by a
+hash of their key columns and compared by a hash of their value columns,
+so only the inserted, updated and deleted rows are uploaded.
+'''
+import logging
+import time
+import numpy as np
+import pandas as pd
+import synapseclient
+from synapseclient import Table
+from . import throttle
+logger = logging.getLogger(__name__)
+
+# Approximate memory of the rows uploaded in one request: 50 MB
+MAX_CHUNK_BYTES = 50 * 1024 ** 2
+
+
+def _hash_columns(df):
+    '''
+    Helper function to hash every value of a data frame per column.
+    Values are compared as strings and missing values as empty strings.
+    '''
+    return({column: pd.util.hash_pandas_object(
+                df[column].fillna("").astype(str), index=False).values
+            for column in df.columns})
+
+
+def _combine_hashes(column_hashes, columns):
+    '''
+    Helper function to combine the hashes of columns into a row hash
+    '''
+    row_hashes = np.zeros(len(column_hashes[columns[0]]), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for column in columns:
+            row_hashes = row_hashes * np.uint64(1000003) ^ \
+                column_hashes[column]
+    return(row_hashes)
+
+
+def _row_hashes(df, key_cols):
+    column_hashes = _hash_columns(df)
+    return(pd.DataFrame({
+        'key': _combine_hashes(column_hashes, key_cols),
+        'value': _combine_hashes(column_hashes, list(df.columns)),
+        'position': np.arange(len(df))}))
+
+
+def diff_table(database, new_dataset, key_cols, delete=False):
+    '''
+    Finds the rows to insert, update and delete so that a table matches
+    a new dataset
+
+    Args:
+        database: Data frame of the table.  The index holds the
+                  ROWID_VERSION labels of the rows.
+        new_dataset: Data frame with the columns of the table
+        key_cols: Columns that make up the unique key
+        delete: Delete the rows that are not in the new dataset.
+                Default is False.
+
+    Returns:
+        dict with the data frames of the rows to 'insert', 'update'
+        (indexed by the table row labels) and 'delete'
+    '''
+    columns = list(database.columns)
+    missing = set(columns).difference(new_dataset.columns)
+    if missing:
+        raise ValueError("new_dataset is missing these columns: {}".format(
+            ', '.join(sorted(missing))))
+    new_dataset = new_dataset[columns]
+    if new_dataset.duplicated(key_cols).any():
+        raise ValueError("key_cols must be unique in new_dataset")
+    merged = _row_hashes(new_dataset, key_cols).merge(
+        _row_hashes(database, key_cols), on='key', how='outer',
+        suffixes=('_new', '_database'), indicator=True)
+
+    inserted = merged['position_new'][merged['_merge'] == 'left_only']
+    updated = merged[(merged['_merge'] == 'both') &
+                     (merged['value_new'] != merged['value_database'])]
+    deleted = merged['position_database'][merged['_merge'] == 'right_only']
+
+    insertdf = new_dataset.iloc[inserted.astype(int).values].reset_index(
+        drop=True)
+    updatedf = new_dataset.iloc[updated['position_new'].astype(int).values]
+    updatedf.index = database.index[
+        updated['position_database'].astype(int).values]
+    if delete:
+        deletedf = database.iloc[deleted.astype(int).values]
+    else:
+        deletedf = database.iloc[[]]
+    return({'insert': insertdf, 'update': updatedf, 'delete': deletedf})
+
+
+def _chunks(df, max_chunk_bytes):
+    '''
+    Helper function to split a data frame into chunks of about
+    max_chunk_bytes, estimated from the first rows
+    '''
+    if df.empty:
+        return
+    sample = df.head(1000)
+    row_bytes = sample.memory_usage(deep=True).sum() / float(len(sample))
+    chunk_size = max(1, int(max_chunk_bytes // row_bytes))
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def _with_retries(func, retries):
+    for attempt in range(retries + 1):
+        try:
+            return(func())
+        except synapseclient.exceptions.SynapseHTTPError as ex:
+            if attempt == retries:
+                raise
+            wait = throttle.backoff_delay(attempt)
+            logger.warning("{}. Retrying in {:.1f} seconds".format(ex, wait))
+            time.sleep(wait)
+
+
+def sync_table(syn, tableid, new_dataset, key_cols, delete=False,
+               database=None, max_chunk_bytes=MAX_CHUNK_BYTES, retries=3):
+    '''
+    Updates a Synapse table by a row identifier with a new dataset that
+    has the same columns
+
+    Args:
+        syn: Synapse object
+        tableid: Synapse id of the table
+        new_dataset: Data frame with the columns of the table
+        key_cols: Columns that make up the unique key
+        delete: Delete the rows that are not in the new dataset.
+                Default is False.
+        database: Data frame of the table.  Default is None (query
+                  the whole table)
+        max_chunk_bytes: Approximate memory of the rows uploaded in one
+                         request. Default is MAX_CHUNK_BYTES
+        retries: Number of times a failed upload is retried. Default is 3.
+
+    Returns:
+        dict with the number of rows 'inserted', 'updated' and 'deleted'
+    '''
+    if database is None:
+        database = syn.tableQuery(
+            'select * from {}'.format(tableid)).asDataFrame()
+    changes = diff_table(database, new_dataset, key_cols, delete=delete)
+    schema = syn.get(tableid)
+    for change in ['update', 'insert']:
+        for chunk in _chunks(changes[change], max_chunk_bytes):
+            _with_retries(lambda: syn.store(Table(schema, chunk)), retries)
+    for chunk in _chunks(changes['delete'], max_chunk_bytes):
+        _with_retries(lambda: syn.delete(Table(schema, chunk)), retries)
+    summary = {'inserted': len(changes['insert']),
+               'updated': len(changes['update']),
+               'deleted': len(changes['delete'])}
+    logger.info("Synced {}: {}".format(tableid, summary))
+    return(summary)
@@ -0,0 +1,221 @@
+'''
+Rate limiting and retries of the REST calls of a Synapse object.  Every
+request takes a token from a token bucket, which can be kept in a file
+so that all challengeutils processes of a user share one rate, and
+throttled or failed requests are retried with jittered exponential
+backoff that honours the Retry-After header.  Use throttled to rate
+limit a Synapse object before passing it to challengeutils:
+
+    syn = throttle.throttled(synapseclient.login())
+'''
+import email.utils
+import json
+import logging
+import os
+import random
+import threading
+import time
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_FILE = os.path.join(
+    os.path.expanduser('~'), '.challengeutils', 'rate_limit.json')
+# Requests per second
+DEFAULT_RATE = 10
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+MAX_RETRIES = 6
+BACKOFF_BASE = 1
+MAX_BACKOFF = 60
+
+
+class TokenBucket(object):
+    '''
+    Token bucket that allows rate requests per second on average and
+    bursts of up to capacity requests
+
+    Args:
+        rate: Tokens added per second
+        capacity: Maximum number of tokens. Default is rate.
+        path: File the bucket is kept in, locked with flock, so processes
+              using the same file share the bucket.  Default is None, the
+              bucket is only shared by the threads of this process.
+    '''
+    def __init__(self, rate, capacity=None, path=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = {'tokens': self.capacity, 'updated': time.time()}
+        if path is not None and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+    def _take(self, state, now):
+        '''
+        Refills the bucket and takes a token
+
+        Returns:
+            tuple of the new state and the seconds to wait for a token,
+            0 if a token was taken
+        '''
+        tokens = min(self.capacity, state['tokens'] +
+                     max(0, now - state['updated']) * self.rate)
+        if tokens >= 1:
+            return({'tokens': tokens - 1, 'updated': now}, 0)
+        return({'tokens': tokens, 'updated': now}, (1 - tokens) / self.rate)
+
+    def _take_from_file(self, now):
+        import fcntl
+        bucket_fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(bucket_fd, fcntl.LOCK_EX)
+            try:
+                state = json.loads(os.read(bucket_fd, 4096).decode('utf-8'))
+            except ValueError:
+                state = {'tokens': self.capacity, 'updated': now}
+            state, wait = self._take(state, now)
+            os.lseek(bucket_fd, 0, os.SEEK_SET)
+            os.ftruncate(bucket_fd, 0)
+            os.write(bucket_fd, json.dumps(state).encode('utf-8'))
+        finally:
+            # Closing the file releases the flock
+            os.close(bucket_fd)
+        return(wait)
+
+    def acquire(self):
+        '''
+        Waits until a token is taken
+        '''
+        while True:
+            with self._lock:
+                now = time.time()
+                if self.path is None:
+                    self._state, wait = self._take(self._state, now)
+                else:
+                    wait = self._take_from_file(now)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+def retry_after(response):
+    '''
+    Seconds to wait before retrying a response according to its
+    Retry-After header, in seconds or as an HTTP date
+
+    Returns:
+        Seconds or None if the response has no valid Retry-After
+    '''
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return(None)
+    try:
+        return(max(0.0, float(value)))
+    except ValueError:
+        pass
+    retry_date = email.utils.parsedate_tz(value)
+    if retry_date is None:
+        return(None)
+    return(max(0.0, email.utils.mktime_tz(retry_date) - time.time()))
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, max_wait=MAX_BACKOFF):
+    '''
+    Exponential backoff with full jitter, so that clients throttled at the
+    same time don't retry at the same time
+
+    Args:
+        attempt: Number of the failed attempt, starting at 0
+
+    Returns:
+        Random seconds between 0 and base * 2 ** attempt, at most max_wait
+    '''
+    return(random.uniform(0, min(max_wait, base * 2 ** attempt)))
+
+
+def _retried(kwargs):
+    # Uploads of open files can't be sent again and streamed downloads are
+    # retried and resumed by the Synapse client
+    data = kwargs.get('data')
+    return(not kwargs.get('stream', False) and
+           (data is None or isinstance(data, (bytes, str, dict))))
+
+
+def install(syn, bucket=None, retries=MAX_RETRIES):
+    '''
+    Wraps the requests session of a Synapse object so that all its
+    requests are rate limited and retried.  The retries of the REST calls
+    by the Synapse client are turned off, so a call is retried only here.
+
+    Args:
+        syn: Synapse object
+        bucket: TokenBucket every request takes a token from.
+                Default is None, requests are not rate limited.
+        retries: Number of times a request that got a 429 or 5xx response
+                 or failed to connect is retried. Default is MAX_RETRIES.
+
+    Returns:
+        The Synapse object
+    '''
+    # Imported here so that challengeutils starts without requests
+    import requests
+    session = syn._requests_session
+    request = session.request
+    build_retry_policy = syn._build_retry_policy
+
+    def build_single_try_policy(retryPolicy={}):
+        return(dict(build_retry_policy(retryPolicy), retries=0))
+
+    def throttled_request(method, url, *args, **kwargs):
+        attempts = retries + 1 if _retried(kwargs) else 1
+        for attempt in range(attempts):
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                response = request(method, url, *args, **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as ex:
+                if attempt + 1 == attempts:
+                    raise
+                wait = backoff_delay(attempt)
+                logger.warning("{} {}: {}. Retrying in {:.1f} seconds".format(
+                    method, url, ex, wait))
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or \
+                        attempt + 1 == attempts:
+                    return(response)
+                wait = retry_after(response)
+                if wait is None:
+                    wait = backoff_delay(attempt)
+                logger.warning("{} {}: {}. Retrying in {:.1f} seconds".format(
+                    method, url, response.status_code, wait))
+                # Returns the connection to the pool
+                response.close()
+            time.sleep(wait)
+    syn._build_retry_policy = build_single_try_policy
+    session.request = throttled_request
+    session.throttled = True
+    return(syn)
+
+
+def throttled(syn, rate=DEFAULT_RATE, path=RATE_LIMIT_FILE,
+              retries=MAX_RETRIES):
+    '''
+    Rate limits and retries the requests of a Synapse object, once
+
+    Args:
+        syn: Synapse object
+        rate: Requests per second, shared by all processes that use the
+              same path. 0 for no limit. Default is DEFAULT_RATE.
+        path: File the token bucket is kept in. Default is RATE_LIMIT_FILE.
+              None to share the rate only within this process.
+        retries: Number of times a request is retried. Default is
+                 MAX_RETRIES.
+
+    Returns:
+        The Synapse object
+    '''
+    if getattr(syn._requests_session, 'throttled', False):
+        return(syn)
+    bucket = TokenBucket(rate, path=path) if rate > 0 else None
+    return(install(syn, bucket=bucket, retries=retries))
@@ -0,0 +1,67 @@
+'''
+Vectorized conversion of Synapse timestamps.  Submissions and entities
+have ISO 8601 timestamps (2017-10-11T07:00:00.000Z) while evaluation
+queue queries and annotations have epoch milliseconds, often as strings.
+Whole columns of either are converted in one call.
+'''
+import pandas as pd
+
+# Format of the timestamps Synapse returns
+SYNAPSE_ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+EPOCH = pd.Timestamp(0, tz='UTC')
+
+
+def to_datetime(values):
+    '''
+    Converts Synapse ISO timestamps and epoch milliseconds to datetimes
+
+    Args:
+        values: List, array or Series of ISO timestamps, epoch milliseconds
+                or strings of epoch milliseconds.  They can be mixed.
+
+    Returns:
+        Series of UTC datetime64, NaT for missing values
+    '''
+    values = pd.Series(values)
+    index = values.index
+    values = values.reset_index(drop=True)
+    if pd.api.types.is_numeric_dtype(values):
+        datetimes = pd.to_datetime(values, unit='ms', utc=True)
+        datetimes.index = index
+        return(datetimes)
+    # Most values are Synapse ISO timestamps, which are parsed the fastest
+    datetimes = pd.to_datetime(values, format=SYNAPSE_ISO_FORMAT, utc=True,
+                               errors='coerce')
+    other = datetimes.isnull() & values.notnull()
+    if other.any():
+        epoch_ms = pd.to_numeric(values[other], errors='coerce')
+        is_epoch = epoch_ms.notnull()
+        if is_epoch.any():
+            datetimes[epoch_ms.index[is_epoch]] = pd.to_datetime(
+                epoch_ms[is_epoch].astype('int64'), unit='ms', utc=True)
+        # Timestamps without milliseconds or with another time zone
+        is_iso = epoch_ms.index[~is_epoch]
+        if len(is_iso):
+            datetimes[is_iso] = pd.to_datetime(
+                values[is_iso].astype(str).tolist(), utc=True)
+    datetimes.index = index
+    return(datetimes)
+
+
+def to_epoch_ms(values):
+    '''
+    Converts Synapse ISO timestamps and epoch milliseconds to epoch
+    milliseconds
+
+    Args:
+        values: List, array or Series of ISO timestamps, epoch milliseconds
+                or strings of epoch milliseconds.  They can be mixed.
+
+    Returns:
+        Series of int64 epoch milliseconds
+    '''
+    datetimes = to_datetime(values)
+    if datetimes.isnull().any():
+        raise ValueError("Timestamps can't be missing")
+    # The resolution of datetimes depends on the pandas version
+    return((datetimes - EPOCH) // pd.Timedelta(milliseconds=1))
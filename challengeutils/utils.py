@@ -345,6 +345,60 @@ def change_all_submission_status(syn, evaluationid, submission_status='SCORED',
         syn.store(status)
 
 
+def get_submission_statuses(syn, evaluationid, status=None, limit=100):
+    '''
+    Gets the submission statuses of an evaluation queue a page at a time
+
+    Args:
+        syn: Synapse object
+        evaluationid: Id of an Evaluation queue
+        status: Only get submission statuses with this status.
+                Default is None (all)
+        limit: Number of submission statuses per request. Default is 100.
+
+    Yields:
+        Submission status
+    '''
+    uri = "/evaluation/{}/submission/status/all".format(evaluationid)
+    if status is not None:
+        uri += "?status={}&".format(status)
+    else:
+        uri += "?"
+    offset = 0
+    while True:
+        page = syn.restGET("{}limit={}&offset={}".format(uri, limit, offset))
+        for sub_status in page['results']:
+            yield synapseclient.evaluation.SubmissionStatus(**sub_status)
+        offset += len(page['results'])
+        if not page['results'] or offset >= page['totalNumberOfResults']:
+            break
+
+
+def update_submission_statuses(syn, evaluationid, statuses, batch_size=500):
+    '''
+    Stores submission statuses of an evaluation queue in batches
+    instead of one request per submission status
+
+    Args:
+        syn: Synapse object
+        evaluationid: Id of an Evaluation queue
+        statuses: List of submission statuses
+        batch_size: Number of submission statuses per batch. Synapse
+                    accepts at most 500. Default is 500.
+    '''
+    batch_token = None
+    for start in range(0, len(statuses), batch_size):
+        batch = {'statuses': statuses[start:start + batch_size],
+                 'isFirstBatch': start == 0,
+                 'isLastBatch': start + batch_size >= len(statuses)}
+        if batch_token is not None:
+            batch['batchToken'] = batch_token
+        response = syn.restPUT(
+            "/evaluation/{}/statusBatch".format(evaluationid),
+            json.dumps(batch))
+        batch_token = response.get('nextUploadToken')
+
+
 class NewUserProfile(synapseclient.team.UserProfile):
     '''
     Create new user profile that makes Userprofiles hashable
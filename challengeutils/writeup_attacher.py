@@ -1,52 +1,75 @@
+import concurrent.futures
 import pandas as pd
 from synapseclient.annotations import to_submission_status_annotations
 from . import utils
 
 
-def append_writeup_to_main_submission(row, syn):
+def attach_writeup(syn, writeup_queueid, submission_queueid, max_workers=8):
     '''
-    Helper function that appends the write up synapse id and archived
-    write up synapse id on the main submission
-
-    Args:
-        row: Dictionary row['team'], row['objectId'], row['archived'],
-             row['entityId']
-        syn: synapse object
-    '''
-    if pd.isnull(row['archived']):
-        print("NO WRITEUP: " + row['team'])
-    else:
-        status = syn.getSubmissionStatus(row['objectId'])
-        add_writeup_dict = {
-            'writeUp': row['entityId'], 'archivedWriteUp': row['archived']}
-
-        add_writeup = to_submission_status_annotations(
-            add_writeup_dict, is_private=False)
-        new_status = utils.update_single_submission_status(
-            status, add_writeup)
-        syn.store(new_status)
-
-
-def attach_writeup(syn, writeup_queueid, submission_queueid):
-    '''
-    Attach the write up to the submission queue
+    Attach the write up to the submission queue.  Only submissions whose
+    writeUp and archivedWriteUp annotations differ from their write up
+    are updated, in batches.  A team with several write ups gets its
+    latest one.  Only the statuses of the updated submissions are fetched.
 
     Args:
         writeup_queueid:   Write up evaluation queue id
         submission_queueid: Submission queue id
+        max_workers: Maximum number of statuses fetched at once. Default is 8.
+
+    Returns:
+        dict with the objectIds of the submissions 'attached' and
+        'unchanged' and the teams with 'no_writeup'
     '''
     writeups = list(utils.evaluation_queue_query(
         syn,
-        "select team, entityId, archived from evaluation_{} "
+        "select team, entityId, archived, createdOn from evaluation_{} "
         "where status == 'VALIDATED'".format(writeup_queueid)))
     submissions = list(utils.evaluation_queue_query(
         syn,
-        "select objectId, team from evaluation_{} "
+        "select objectId, team, writeUp, archivedWriteUp from evaluation_{} "
         "where status == 'SCORED'".format(submission_queueid)))
-    writeupsdf = pd.DataFrame(writeups)
-    submissionsdf = pd.DataFrame(submissions)
+    writeupsdf = pd.DataFrame(
+        writeups, columns=['team', 'entityId', 'archived', 'createdOn'])
+    # One write up per team, so every submission is merged with one row
+    writeupsdf['createdOn'] = pd.to_numeric(writeupsdf['createdOn'])
+    writeupsdf = writeupsdf.sort_values('createdOn', kind='mergesort')\
+        .drop_duplicates('team', keep='last')
+    submissionsdf = pd.DataFrame(
+        submissions,
+        columns=['objectId', 'team', 'writeUp', 'archivedWriteUp'])
     submissions_with_writeupsdf = \
         submissionsdf.merge(writeupsdf, on="team", how="left")
 
-    submissions_with_writeupsdf.apply(
-        lambda row: append_writeup_to_main_submission(row, syn), axis=1)
+    no_writeup = pd.isnull(submissions_with_writeupsdf['archived'])
+    for team in submissions_with_writeupsdf['team'][no_writeup]:
+        print("NO WRITEUP: " + team)
+    with_writeupdf = submissions_with_writeupsdf[~no_writeup]
+    # Query values are strings, missing annotations are null
+    changed = (
+        (with_writeupdf['writeUp'].astype(str) !=
+         with_writeupdf['entityId'].astype(str)) |
+        (with_writeupdf['archivedWriteUp'].astype(str) !=
+         with_writeupdf['archived'].astype(str)))
+    to_attach = with_writeupdf[changed].set_index('objectId')
+
+    new_statuses = []
+    if not to_attach.empty:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers) as executor:
+            statuses = executor.map(syn.getSubmissionStatus,
+                                    list(to_attach.index))
+            for status in statuses:
+                row = to_attach.loc[status.id]
+                add_writeup = to_submission_status_annotations(
+                    {'writeUp': row['entityId'],
+                     'archivedWriteUp': row['archived']},
+                    is_private=False)
+                new_statuses.append(utils.update_single_submission_status(
+                    status, add_writeup))
+        utils.update_submission_statuses(
+            syn, submission_queueid, new_statuses)
+
+    return({'attached': [status.id for status in new_statuses],
+            'unchanged': list(with_writeupdf['objectId'][~changed]),
+            'no_writeup': list(
+                submissions_with_writeupsdf['team'][no_writeup])})
@@ -0,0 +1,105 @@
+import mock
+import pytest
+import synapseclient
+import challengeutils.acl_snapshot
+from challengeutils.acl_snapshot import AclSnapshot
+
+syn = mock.create_autospec(synapseclient.Synapse)
+PUBLIC = str(synapseclient.PUBLIC)
+
+snapshot = AclSnapshot(
+    objects={'syn1': {'type': 'project', 'name': 'live',
+                      'benefactor': 'syn1'},
+             'syn2': {'type': 'folder', 'name': 'data',
+                      'benefactor': 'syn2'},
+             'syn3': {'type': 'folder', 'name': 'inherits',
+                      'benefactor': 'syn1'},
+             '9': {'type': 'evaluation', 'name': 'queue',
+                   'benefactor': '9'}},
+    acls={'syn1': {PUBLIC: ['READ']},
+          'syn2': {'100': ['DOWNLOAD', 'READ'], '1': ['READ']},
+          '9': {'100': ['READ', 'SUBMIT']}},
+    principals={'100': {'name': 'Participants', 'isIndividual': False},
+                '1': {'name': 'user1', 'isIndividual': True}},
+    teams={'100': ['2', '3']})
+
+
+def test_effective_permissions():
+    '''
+    Test permissions through public access, teams and directly
+    '''
+    assert snapshot.effective_permissions('4', 'syn3') == ['READ']
+    assert snapshot.effective_permissions('2', 'syn2') == ['DOWNLOAD', 'READ']
+    assert snapshot.effective_permissions(1, 'syn2') == ['READ']
+    assert snapshot.effective_permissions('4', 'syn2') == []
+
+
+def test_check_permissions():
+    assert snapshot.check_permissions(['1', '2'], ['syn2'], 'DOWNLOAD') == \
+        {'syn2': {'1': False, '2': True}}
+
+
+def test_has_permission_level():
+    assert snapshot.has_permission_level('2', '9', 'submit')
+    assert not snapshot.has_permission_level('1', '9', 'view')
+    with pytest.raises(ValueError,
+                       match=r'permission_level must be one of these:.*'):
+        snapshot.has_permission_level('2', '9', 'download')
+
+
+def test_users_with_access():
+    assert snapshot.users_with_access('syn2', 'DOWNLOAD') == set(['2', '3'])
+    assert snapshot.users_with_access('syn3', 'READ') is True
+
+
+def test_missing_object():
+    with pytest.raises(ValueError, match="syn5 is not in the ACL snapshot"):
+        snapshot.effective_permissions('1', 'syn5')
+
+
+def test_roundtrip_save_load(tmpdir):
+    path = str(tmpdir.join("snapshot.json"))
+    snapshot.save(path)
+    loaded = AclSnapshot.load(path)
+    assert loaded.audit() == snapshot.audit()
+    assert loaded.user_teams == {'2': set(['100']), '3': set(['100'])}
+
+
+def test_export_acl_snapshot():
+    '''
+    Test that only benefactor ACLs are fetched and team members exported
+    '''
+    project = synapseclient.Project(name="live", id="syn1")
+    evaluation = synapseclient.Evaluation(
+        name="queue", id="9", contentSource="syn1")
+    rest_responses = {
+        '/entity/syn1/benefactor': {'id': 'syn1'},
+        '/entity/syn1/acl': {'resourceAccess': [
+            {'principalId': 100, 'accessType': ['READ']}]},
+        '/evaluation/9/acl': {'resourceAccess': [
+            {'principalId': 1, 'accessType': ['SUBMIT', 'READ']}]}}
+
+    def rest_get(uri):
+        if uri.startswith('/userGroupHeaders/batch'):
+            return({'children': [
+                {'ownerId': '100', 'userName': 'team', 'isIndividual': False},
+                {'ownerId': '1', 'userName': 'user', 'isIndividual': True}]})
+        return(rest_responses[uri])
+
+    with mock.patch.object(syn, "get", return_value=project),\
+        mock.patch.object(syn, "getChildren",
+                          side_effect=lambda parent, includeTypes:
+                          [{'id': 'syn2', 'name': 'data',
+                            'benefactorId': 1}] if parent == 'syn1'
+                          else []),\
+        mock.patch.object(syn, "getEvaluationByContentSource",
+                          return_value=[evaluation]),\
+        mock.patch.object(syn, "restGET", side_effect=rest_get),\
+        mock.patch.object(syn, "getTeamMembers",
+                          return_value=[{'member': {'ownerId': '2'}}]):
+        exported = challengeutils.acl_snapshot.export_acl_snapshot(
+            syn, ['syn1'])
+    assert exported.objects['syn2']['benefactor'] == 'syn1'
+    assert sorted(exported.acls) == ['9', 'syn1']
+    assert exported.teams == {'100': ['2']}
+    assert exported.effective_permissions('2', 'syn2') == ['READ']
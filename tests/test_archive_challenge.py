@@ -0,0 +1,167 @@
+import json
+import os
+import sys
+import mock
+import pytest
+import synapseclient
+from synapseclient import SubmissionStatus
+from synapseclient.exceptions import SynapseHTTPError
+
+ARCHIVE_TOOL_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'archive-challenge-project-tool')
+sys.path.insert(0, ARCHIVE_TOOL_DIR)
+import challenge  # noqa: E402
+
+SUBMISSION = synapseclient.Submission(
+    id='1', name='sub', entityId='syn100', evaluationId='9',
+    versionNumber=1, userId='111')
+
+
+@pytest.fixture
+def syn(monkeypatch):
+    syn = mock.create_autospec(synapseclient.Synapse)
+    monkeypatch.setattr(challenge, "syn", syn)
+    return(syn)
+
+
+def _statuses(body):
+    '''Statuses of a statusBatch request body'''
+    return(json.loads(body)['statuses'])
+
+
+def test_resume_archive(tmpdir, syn):
+    '''
+    Test that an interrupted copy is resumed into its recorded project
+    '''
+    path = str(tmpdir.join("progress.json"))
+    with open(path, "w") as progress_file:
+        json.dump({'1': {'project': 'syn200', 'copied': False,
+                         'fingerprint': None}}, progress_file)
+    progress = challenge.ArchiveProgress(path)
+    status = SubmissionStatus(id='1', status='VALIDATED', annotations={})
+    with mock.patch.object(challenge, "get_entity_tree",
+                           return_value={}) as patch_tree,\
+         mock.patch.object(challenge, "get_tree_fingerprint",
+                           return_value="abc"),\
+         mock.patch.object(challenge.synu, "copy") as patch_copy:
+        archived = challenge.archive_submission(SUBMISSION, status, progress)
+    assert archived == ('syn200', 'abc')
+    patch_tree.assert_called_once_with('syn100')
+    patch_copy.assert_called_once_with(syn, 'syn100', 'syn200',
+                                       updateExisting=True)
+    syn.store.assert_not_called()
+    with open(path) as progress_file:
+        assert json.load(progress_file) == {
+            '1': {'project': 'syn200', 'copied': True, 'fingerprint': 'abc'}}
+
+
+def test_resume_copied_archive(tmpdir, syn):
+    '''
+    Test that a submission whose copy is done isn't fetched or copied again
+    '''
+    path = str(tmpdir.join("progress.json"))
+    with open(path, "w") as progress_file:
+        json.dump({'1': {'project': 'syn200', 'copied': True,
+                         'fingerprint': 'abc'}}, progress_file)
+    progress = challenge.ArchiveProgress(path)
+    status = SubmissionStatus(id='1', status='VALIDATED', annotations={})
+    with mock.patch.object(challenge, "get_entity_tree") as patch_tree,\
+         mock.patch.object(challenge.synu, "copy") as patch_copy:
+        archived = challenge.archive_submission(SUBMISSION, status, progress)
+    assert archived == ('syn200', 'abc')
+    patch_tree.assert_not_called()
+    patch_copy.assert_not_called()
+    syn.store.assert_not_called()
+
+
+def test_progress_atomic_rewrite(tmpdir):
+    '''
+    Test that the progress file is replaced only once it is fully written
+    '''
+    path = str(tmpdir.join("progress.json"))
+    progress = challenge.ArchiveProgress(path)
+    progress.record('1', 'syn200', copied=False)
+    assert os.listdir(str(tmpdir)) == ["progress.json"]
+    with mock.patch.object(challenge.json, "dump",
+                           side_effect=KeyboardInterrupt),\
+         pytest.raises(KeyboardInterrupt):
+        progress.record('1', 'syn200', copied=True, fingerprint='abc')
+    assert challenge.ArchiveProgress(path).submissions == {
+        '1': {'project': 'syn200', 'copied': False, 'fingerprint': None}}
+    progress.record('2', 'syn300', copied=False)
+    assert os.listdir(str(tmpdir)) == ["progress.json"]
+    progress.remove(['1', '2'])
+    assert not os.path.exists(path)
+
+
+def test_status_batch_conflict(syn):
+    '''
+    Test that the statuses are fetched again and the batch retried on a 412
+    '''
+    old = SubmissionStatus(id='1', etag='old', status='RECEIVED',
+                           annotations={})
+    fresh = SubmissionStatus(id='1', etag='new', status='RECEIVED',
+                             annotations={})
+    conflict = SynapseHTTPError("conflict",
+                                response=mock.Mock(status_code=412))
+    syn.restPUT.side_effect = [conflict, {}]
+    syn.getSubmissionStatus.return_value = fresh
+    annotations = synapseclient.annotations.to_submission_status_annotations(
+        {'archived': 'syn2'})
+    with mock.patch.object(challenge.time, "sleep"):
+        challenge.update_submissions_status_batch(
+            mock.Mock(id='9'), [(old, annotations, "VALIDATED")])
+    syn.getSubmissionStatus.assert_called_once_with('1')
+    first, retried = [_statuses(call[0][1])[0]
+                      for call in syn.restPUT.call_args_list]
+    assert first['etag'] == 'old'
+    assert retried['etag'] == 'new'
+    assert retried['status'] == 'VALIDATED'
+    assert retried['annotations']['stringAnnos'][0]['key'] == 'archived'
+    assert retried['annotations']['stringAnnos'][0]['value'] == 'syn2'
+
+
+def test_validate_batches(syn):
+    '''
+    Test that validated submissions are stored in one status batch and
+    that submitter names are looked up once per team or user
+    '''
+    evaluation = synapseclient.Evaluation(name='queue', contentSource='syn1',
+                                          id='9')
+    bundles = []
+    for submissionid, userid, teamid in [('1', '111', 't1'),
+                                         ('2', '222', 't1'),
+                                         ('3', '111', None),
+                                         ('4', '222', 't2'),
+                                         ('5', '111', None)]:
+        submission = synapseclient.Submission(
+            id=submissionid, name='sub', entityId='syn10' + submissionid,
+            evaluationId='9', versionNumber=1, userId=userid)
+        if teamid is not None:
+            submission['teamId'] = teamid
+        bundles.append((submission, SubmissionStatus(
+            id=submissionid, status='RECEIVED', annotations={}, etag='e')))
+    syn.getSubmissionBundles.return_value = bundles
+    syn.restGET.side_effect = lambda uri: {'name': 'team' + uri[-2:]}
+    syn.getUserProfile.side_effect = lambda userid: {'userName': 'user'}
+    syn.restPUT.return_value = {}
+
+    def validate_submission(syn, evaluation, submission, public, admin):
+        return(submission.id != '3', 'message')
+
+    with mock.patch.object(challenge.conf, "validate_submission",
+                           side_effect=validate_submission),\
+         mock.patch.object(challenge.messages, "validation_passed"),\
+         mock.patch.object(challenge.messages, "validation_failed"):
+        challenge.validate(evaluation, workers=3)
+    syn.restPUT.assert_called_once()
+    uri, body = syn.restPUT.call_args[0]
+    assert uri == "/evaluation/9/statusBatch"
+    statuses = {status['id']: status['status'] for status in _statuses(body)}
+    assert statuses == {'1': 'VALIDATED', '2': 'VALIDATED', '3': 'INVALID',
+                        '4': 'VALIDATED', '5': 'VALIDATED'}
+    assert sorted(call[0][0] for call in syn.restGET.call_args_list) == [
+        '/team/t1', '/team/t2']
+    assert sorted(call[0][0] for call in
+                  syn.getUserProfile.call_args_list) == ['111', '222']
@@ -0,0 +1,154 @@
+import os
+import subprocess
+import sys
+import time
+from datetime import timedelta
+import mock
+import pytest
+
+ARCHIVE_TOOL_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'archive-challenge-project-tool')
+sys.path.insert(0, ARCHIVE_TOOL_DIR)
+import lock  # noqa: E402
+
+# Holds the lock queue in a directory until its stdin is closed
+HOLDER = '''
+import sys
+from datetime import timedelta
+sys.path.insert(0, sys.argv[1])
+import lock
+held = lock.Lock('queue', dir=sys.argv[2], max_age=timedelta(hours=1))
+assert held.acquire()
+print("locked")
+sys.stdout.flush()
+sys.stdin.read()
+'''
+
+
+@pytest.fixture
+def holder(tmpdir):
+    process = subprocess.Popen(
+        [sys.executable, '-c', HOLDER, ARCHIVE_TOOL_DIR, str(tmpdir)],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert process.stdout.readline().strip() == b"locked"
+    yield process
+    process.kill()
+    process.wait()
+    process.stdin.close()
+    process.stdout.close()
+
+
+def test_acquire_release(tmpdir):
+    '''
+    Test that a held lock can't be acquired again and records its pid
+    '''
+    first = lock.Lock('queue', dir=str(tmpdir))
+    second = lock.Lock('queue', dir=str(tmpdir))
+    with first:
+        assert first.acquire()
+        assert first.get_pid() == os.getpid()
+        assert not second.acquire()
+    assert not os.path.exists(first.lock_file_path)
+    assert second.acquire()
+    second.release()
+
+
+def test_held_by_other_process(tmpdir, holder):
+    '''
+    Test that a lock held by a live process isn't broken and that it is
+    released by the kernel when its holder dies
+    '''
+    queue_lock = lock.Lock('queue', dir=str(tmpdir))
+    assert queue_lock.get_pid() == holder.pid
+    assert not queue_lock.is_stale()
+    assert not queue_lock.acquire()
+    holder.kill()
+    holder.wait()
+    assert queue_lock.is_stale()
+    assert queue_lock.acquire()
+    assert queue_lock.get_pid() == os.getpid()
+    queue_lock.release()
+
+
+def test_break_hung_holder(tmpdir, holder):
+    '''
+    Test that the lock of a live holder whose heartbeat is older than
+    max_age is broken
+    '''
+    queue_lock = lock.Lock('queue', dir=str(tmpdir),
+                           max_age=timedelta(minutes=30))
+    old = time.time() - 3600
+    os.utime(queue_lock.lock_file_path, (old, old))
+    assert queue_lock.is_stale()
+    assert queue_lock.acquire()
+    assert queue_lock.get_pid() == os.getpid()
+    queue_lock.release()
+
+
+def test_break_dead_holder(tmpdir):
+    '''
+    Test that a lock file left by a dead pid is stale and broken
+    '''
+    queue_lock = lock.Lock('queue', dir=str(tmpdir))
+    with open(queue_lock.lock_file_path, 'w') as lock_file:
+        lock_file.write("999999999")
+    assert queue_lock.get_age() < queue_lock.max_age
+    assert queue_lock.is_stale()
+    queue_lock._break()
+    assert not os.path.exists(queue_lock.lock_file_path)
+
+
+def test_guarded_break(tmpdir):
+    '''
+    Test that a stale lock isn't broken while another process breaks it
+    '''
+    queue_lock = lock.Lock('queue', dir=str(tmpdir),
+                           max_age=timedelta(minutes=30))
+    with open(queue_lock.lock_file_path, 'w') as lock_file:
+        lock_file.write("999999999")
+    guard = lock.Lock('queue.break', dir=str(tmpdir))
+    assert guard.acquire()
+    queue_lock._break()
+    assert os.path.exists(queue_lock.lock_file_path)
+    guard.release()
+    queue_lock._break()
+    assert not os.path.exists(queue_lock.lock_file_path)
+
+
+def test_heartbeat(tmpdir):
+    '''
+    Test that a held lock is touched every heartbeat interval
+    '''
+    queue_lock = lock.Lock('queue', dir=str(tmpdir),
+                           max_age=timedelta(seconds=0.4))
+    assert queue_lock.heartbeat_interval == 0.1
+    with queue_lock:
+        assert queue_lock.acquire()
+        old = time.time() - 3600
+        os.utime(queue_lock.lock_file_path, (old, old))
+        time.sleep(0.3)
+        assert queue_lock.get_age() < timedelta(seconds=0.3)
+        assert not queue_lock.is_stale()
+
+
+def test_run_locked():
+    '''
+    Test that locked queues are skipped with exit code 75
+    '''
+    import challenge
+    locked = []
+
+    def lock_queue(evaluation):
+        if evaluation == '2':
+            raise lock.LockedException("held")
+        queue_lock = mock.MagicMock()
+        queue_lock.__enter__.side_effect = lambda: locked.append(evaluation)
+        return(queue_lock)
+
+    processed = []
+    with mock.patch.object(challenge, "lock_queue", side_effect=lock_queue):
+        assert challenge.run_locked(['1', '2', '3'], processed.append) == 75
+        assert challenge.run_locked(['1'], processed.append) is None
+    assert processed == ['1', '3', '1']
+    assert locked == processed
@@ -0,0 +1,79 @@
+import io
+import json
+import logging
+import threading
+import mock
+import synapseclient
+from challengeutils import __main__ as cli
+from challengeutils import batch
+from challengeutils import utils
+
+syn = mock.create_autospec(synapseclient.Synapse)
+
+
+def test_load_manifest(tmpdir):
+    '''
+    Test that commands are lists of arguments, strings or dicts with args
+    '''
+    path = str(tmpdir.join("manifest.jsonl"))
+    with open(path, 'w') as manifest_file:
+        manifest_file.write('["changestatus", 1, "SCORED"]\n\n'
+                            '"setentityacl syn1 \'my team\' view"\n'
+                            '{"args": ["changestatus", "2", "INVALID"]}\n')
+    assert batch.load_manifest(path) == [
+        ['changestatus', '1', 'SCORED'],
+        ['setentityacl', 'syn1', 'my team', 'view'],
+        ['changestatus', '2', 'INVALID']]
+
+
+def test_independent_groups():
+    '''
+    Test that commands on the same object are in one group in order
+    '''
+    commands = [['changestatus', '1', 'SCORED'],
+                ['changestatus', '2', 'SCORED'],
+                ['changestatus', '1', 'INVALID']]
+    assert batch.independent_groups(commands) == [
+        [(0, commands[0]), (2, commands[2])],
+        [(1, commands[1])]]
+
+
+def test_run_batch():
+    '''
+    Test that the output and errors of every command are streamed and
+    commands on the same object run in order
+    '''
+    commands = [['changestatus', '1', 'SCORED'],
+                ['changestatus', '2', 'SCORED'],
+                ['changestatus', '1', 'INVALID'],
+                ['changestatus', '3'],
+                ['batch', 'manifest.jsonl']]
+    changed = []
+
+    def change_status(syn, submissionid, status):
+        if submissionid == '2':
+            raise ValueError("no access")
+        if status == 'INVALID':
+            logging.getLogger("challengeutils").warning("invalidated")
+            thread = threading.Thread(target=print, args=("in thread",))
+            thread.start()
+            thread.join()
+        changed.append((submissionid, status))
+        return(status)
+
+    output = io.StringIO()
+    with mock.patch.object(utils, "change_submission_status",
+                           side_effect=change_status):
+        results = batch.run_batch(syn, commands, cli.build_parser(),
+                                  max_workers=3, output=output)
+    assert [result['status'] for result in results] == [
+        'success', 'failure', 'success', 'failure', 'failure']
+    assert results[0]['output'] == "SCORED\n"
+    assert results[1]['error'] == "no access"
+    assert results[2]['output'] == \
+        "WARNING:challengeutils:invalidated\nin thread\nINVALID\n"
+    assert "the following arguments are required: status" in \
+        results[3]['error']
+    assert changed.index(('1', 'SCORED')) < changed.index(('1', 'INVALID'))
+    streamed = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert sorted(result['line'] for result in streamed) == [1, 2, 3, 4, 5]
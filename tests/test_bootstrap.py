@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+from challengeutils import bootstrap
+
+
+def test_chunks_bootstrap_scores():
+    '''
+    Test that the scores don't depend on the chunk size
+    '''
+    gold = np.arange(20, dtype=float)
+    pred = gold + np.linspace(-1, 1, 20)
+    scores = bootstrap.bootstrap_scores(gold, [pred, gold], bootstrap.rmse,
+                                        num_bootstraps=50, seed=1)
+    chunked = bootstrap.bootstrap_scores(gold, [pred, gold], bootstrap.rmse,
+                                         num_bootstraps=50, seed=1,
+                                         max_chunk_bytes=1)
+    assert scores.shape == (50, 2)
+    assert np.allclose(scores, chunked)
+    assert np.all(scores[:, 1] == 0)
+
+
+def test_spearman_ties():
+    '''
+    Test that tied values get their average rank
+    '''
+    gold = np.array([[1.0, 1.0, 2.0, 3.0]])
+    pred = np.array([[1.0, 2.0, 3.0, 4.0]])
+    ranks = pd.Series([1.5, 1.5, 3, 4])
+    assert np.isclose(bootstrap.spearman(gold, pred)[0],
+                      ranks.corr(pd.Series([1, 2, 3, 4])))
+
+
+def test_compute_bayes_factor():
+    '''
+    Test that the score direction is taken into account
+    '''
+    current = np.array([1, 2, 3, 4])
+    previous = np.array([0, 0, 0, 5])
+    assert bootstrap.compute_bayes_factor(current, previous) == 3
+    assert bootstrap.compute_bayes_factor(current, previous,
+                                          larger_is_better=False) == 1 / 3.0
+    assert bootstrap.compute_bayes_factor(current, current - 1) == \
+        float('inf')
+
+
+def _write(tmpdir, name, ids, values, column):
+    path = str(tmpdir.join(name))
+    pd.DataFrame({'id': ids, column: values}).to_csv(path, index=False)
+    return(path)
+
+
+def test_compare_to_lead_submission(tmpdir):
+    '''
+    Test that a better submission meets the cutoff and a worse does not
+    '''
+    ids = list(range(30))
+    truth = np.arange(30, dtype=float)
+    gold = _write(tmpdir, "gold.csv", ids, truth, 'value')
+    good = _write(tmpdir, "good.csv", ids[::-1], truth[::-1], 'pred')
+    noise = np.random.RandomState(0).normal(0, 10, 30)
+    bad = _write(tmpdir, "bad.csv", ids, truth + noise, 'pred')
+    result = bootstrap.compare_to_lead_submission(
+        good, bad, gold, 'id', 'pred', 'value', metric='rmse', seed=1)
+    assert result['current_score'] == 0
+    assert result['met_cutoff']
+    result = bootstrap.compare_to_lead_submission(
+        bad, good, gold, 'id', 'pred', 'value', metric='rmse', seed=1)
+    assert not result['met_cutoff']
+    result = bootstrap.compare_to_lead_submission(
+        bad, None, gold, 'id', 'pred', 'value')
+    assert result['met_cutoff'] and result['bayes_factor'] is None
+
+
+def test_missing_compare_to_lead_submission(tmpdir):
+    '''
+    Test that every row of the gold standard needs a prediction
+    '''
+    gold = _write(tmpdir, "gold.csv", [1, 2], [1, 2], 'value')
+    current = _write(tmpdir, "current.csv", [1], [1], 'pred')
+    with pytest.raises(ValueError, match="must have a prediction"):
+        bootstrap.compare_to_lead_submission(
+            current, None, gold, 'id', 'pred', 'value')
@@ -0,0 +1,131 @@
+import mock
+import pytest
+import synapseclient
+import challengeutils.createchallenge
+
+syn = mock.create_autospec(synapseclient.Synapse)
+template = synapseclient.Project(name="template", id="syn1", etag="a")
+project = synapseclient.Project(name="staging", id="syn2")
+
+
+def test_dependencies__run_pipeline():
+    '''
+    Test that steps get the results of the steps they depend on
+    '''
+    steps = [
+        ('sum', ['a', 'b'], lambda results: results['a'] + results['b']),
+        ('a', [], lambda results: 1),
+        ('b', [], lambda results: 2)]
+    results, timings = challengeutils.createchallenge._run_pipeline(steps)
+    assert results == {'a': 1, 'b': 2, 'sum': 3}
+    assert set(timing['step'] for timing in timings) == set(['a', 'b', 'sum'])
+    assert timings[-1]['dependencies'] == ['a', 'b']
+
+
+def test_failure__run_pipeline():
+    '''
+    Test that a failing step stops the pipeline
+    '''
+    def fail(results):
+        raise ValueError("failed step")
+
+    steps = [('a', [], fail),
+             ('b', ['a'], lambda results: 1)]
+    with pytest.raises(ValueError, match="failed step"):
+        challengeutils.createchallenge._run_pipeline(steps)
+
+
+def test_unresolvable__run_pipeline():
+    '''
+    Test that missing dependencies raise an error
+    '''
+    steps = [('a', ['missing'], lambda results: 1)]
+    with pytest.raises(ValueError, match="Unresolvable step dependencies: a"):
+        challengeutils.createchallenge._run_pipeline(steps)
+
+
+def test_cached_get_template_pages(tmpdir):
+    '''
+    Test that unchanged template pages are read from the cache
+    '''
+    cache_dir = str(tmpdir)
+    wiki = synapseclient.Wiki(owner=template, title='Home', markdown='foo',
+                              id='10', attachmentFileHandleIds=[])
+    with mock.patch.object(syn, "get", return_value=template),\
+        mock.patch.object(syn, "getWikiHeaders",
+                          return_value=[{'id': '10', 'title': 'Home'}]),\
+        mock.patch.object(syn, "restGET",
+                          return_value={'id': '10', 'etag': 'b'}),\
+            mock.patch.object(syn, "getWiki",
+                              return_value=wiki) as patch_get_wiki:
+        pages = challengeutils.createchallenge.get_template_pages(
+            syn, "syn1", cache_dir=cache_dir)
+        cached_pages = challengeutils.createchallenge.get_template_pages(
+            syn, "syn1", cache_dir=cache_dir)
+        patch_get_wiki.assert_called_once_with(template, '10')
+    assert pages == cached_pages
+    assert pages[0]['markdown'] == 'foo'
+
+
+def test_create_wiki_from_template():
+    '''
+    Test that parents are created before their children, placeholders are
+    filled in before upload and only pages linking to pages created after
+    them are stored twice
+    '''
+    pages = [
+        {'id': '11', 'title': 'Sub', 'parentWikiId': '10', 'etag': 'b',
+         'markdown': 'syn1/wiki/10 {challengeName}', 'attachments': []},
+        {'id': '10', 'title': '', 'parentWikiId': None, 'etag': 'a',
+         'markdown': 'syn1/wiki/11 challengeId=0', 'attachments': []}]
+    new_ids = iter(['20', '21'])
+
+    def store(wiki):
+        if 'id' not in wiki:
+            wiki['id'] = next(new_ids)
+        return(wiki)
+
+    with mock.patch.object(syn, "store", side_effect=store) as patch_store:
+        wikis = challengeutils.createchallenge.create_wiki_from_template(
+            syn, pages, project, '5', '6', 'Foo', 'syn3', templateid='syn1')
+        assert patch_store.call_count == 3
+    assert wikis[0].markdown == 'syn2/wiki/21 challengeId=5'
+    assert wikis[1].markdown == 'syn2/wiki/20 Foo'
+    assert wikis[1].parentWikiId == '20'
+
+
+def test_missing_parent__sort_parents_first():
+    '''
+    Test that a page whose parent is not in the template raises an error
+    '''
+    pages = [{'id': '10', 'parentWikiId': None},
+             {'id': '11', 'parentWikiId': '12'}]
+    with pytest.raises(ValueError, match="Parent wiki 12 of wiki page 11"):
+        challengeutils.createchallenge._sort_parents_first(pages)
+
+
+def test_declined_createchallenge():
+    '''
+    Test that nothing is created when the user declines to delete the
+    staging wiki
+    '''
+    module = challengeutils.createchallenge
+    with mock.patch.object(module, "create_project", return_value=project),\
+        mock.patch.object(module, "create_team", return_value='3'),\
+        mock.patch.object(module, "get_template_pages", return_value=[]),\
+        mock.patch.object(syn, "getWiki",
+                          return_value=synapseclient.Wiki(
+                              owner=project, markdown='', id='4')),\
+        mock.patch("builtins.input", return_value='n'),\
+        mock.patch.object(module, "create_challenge_widget") \
+            as patch_widget,\
+        mock.patch.object(module, "create_evaluation_queue") \
+            as patch_queue,\
+        mock.patch.object(module, "create_live_page") as patch_live,\
+            mock.patch.object(syn, "setPermissions") as patch_permissions:
+        with pytest.raises(SystemExit):
+            module.createchallenge(syn, "Foo")
+        patch_widget.assert_not_called()
+        patch_queue.assert_not_called()
+        patch_live.assert_not_called()
+        patch_permissions.assert_not_called()
@@ -0,0 +1,81 @@
+import json
+import mock
+import pytest
+import synapseclient
+from challengeutils import docker_stats
+
+syn = mock.create_autospec(synapseclient.Synapse)
+ROUNDS = [{'round': 2, 'start': 100, 'end': 200},
+          {'round': 1, 'start': 0, 'end': 50},
+          {'round': 'final', 'start': 300, 'end': None}]
+
+
+def test_assign_rounds():
+    '''
+    Test that the start of a round is exclusive, the end inclusive and
+    submissions between rounds are in no round
+    '''
+    rounds = docker_stats.assign_rounds(
+        [0, 1, 50, 75, 100, 200, 250, 10 ** 13], ROUNDS)
+    assert list(rounds) == [None, 1, 1, None, None, 2, None, 'final']
+
+
+def test_overlap_assign_rounds():
+    '''
+    Test that round windows can't overlap
+    '''
+    with pytest.raises(ValueError, match="can't overlap"):
+        docker_stats.assign_rounds(
+            [1], [{'round': 1, 'start': 0, 'end': 100},
+                  {'round': 2, 'start': 50, 'end': None}])
+
+
+def _bundle(objectid, created_on, status, team=None, runtime=None):
+    annotations = {'stringAnnos': [], 'longAnnos': []}
+    if team is not None:
+        annotations['stringAnnos'].append({'key': 'team', 'value': team})
+    if runtime is not None:
+        annotations['longAnnos'].extend([
+            {'key': 'RUN_START', 'value': 0},
+            {'key': 'RUN_END', 'value': runtime * 60000}])
+    sub = synapseclient.Submission(
+        id=objectid, evaluationId='1', entityId='syn1', versionNumber=1,
+        createdOn=created_on)
+    return(sub, synapseclient.evaluation.SubmissionStatus(
+        id=objectid, status=status, annotations=annotations))
+
+
+def test_docker_stats(tmpdir):
+    '''
+    Test that a queue shared by sub challenges is fetched once and
+    stats are aggregated per round
+    '''
+    config_path = str(tmpdir.join("config.json"))
+    rounds = [{'round': 1, 'start': 0, 'end': 1480000000000},
+              {'round': 'final', 'start': 1480000000000, 'end': None}]
+    with open(config_path, 'w') as config_file:
+        json.dump({'challenges': [
+            {'name': 'DM', 'queues': [
+                {'evaluationid': 1, 'sc': 1, 'rounds': rounds},
+                {'evaluationid': 1, 'sc': 2, 'rounds': rounds[1:]}]}]},
+            config_file)
+    bundles = [_bundle('1', '2017-01-01T00:00:00.000Z', 'SCORED', 'a', 10),
+               _bundle('2', '2017-01-02T00:00:00.000Z', 'SCORED', 'b', 21),
+               _bundle('3', '2017-01-03T00:00:00.000Z', 'INVALID', 'a'),
+               _bundle('4', '2017-01-03T00:00:00.000Z', 'SCORED'),
+               _bundle('5', '2016-01-03T00:00:00.000Z', 'SCORED', 'a', 5)]
+    config = docker_stats.load_config(config_path)
+    with mock.patch.object(syn, "getSubmissionBundles",
+                           return_value=bundles) as patch_bundles:
+        submissionsdf = docker_stats.get_docker_submission_stats(syn, config)
+        patch_bundles.assert_called_once_with('1', limit=100)
+    assert len(submissionsdf) == 7
+    statsdf = docker_stats.summarize_docker_stats(submissionsdf)
+    final = statsdf[(statsdf['sc'] == 1) & (statsdf['round'] == 'final')]
+    scored = final[final['status'] == 'SCORED'].iloc[0]
+    assert scored['teams'] == 2
+    assert scored['totalRunTime'] == 31
+    assert scored['averageRunTime'] == 16
+    assert scored['numberSubmissions'] == 2
+    invalid = final[final['status'] == 'INVALID'].iloc[0]
+    assert invalid['numberSubmissions'] == 1
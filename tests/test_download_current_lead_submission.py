@@ -0,0 +1,75 @@
+import mock
+import synapseclient
+import challengeutils.download_current_lead_submission as dl_cur
+
+syn = mock.create_autospec(synapseclient.Synapse)
+
+
+def _row(objectid, submitterid, created, modified, status='SCORED',
+         met_cutoff='true'):
+    return({'objectId': objectid, 'submitterId': submitterid,
+            'createdOn': created, 'modifiedOn': modified,
+            'prediction_file_status': status, 'met_cutoff': met_cutoff})
+
+
+def test_build_refresh():
+    '''
+    Test that the latest submission that met the cutoff is the lead
+    '''
+    rows = [_row('1', '10', '100', '150'), _row('2', '10', '200', '250'),
+            _row('3', '20', '50', '60')]
+    index = dl_cur.LeadSubmissionIndex(syn, 9)
+    with mock.patch.object(dl_cur.utils, "evaluation_queue_query",
+                           return_value=iter(rows)) as patch_query:
+        index.refresh()
+        assert "where prediction_file_status == 'SCORED'" in \
+            patch_query.call_args[0][1]
+    assert index.get_lead_submissionid('10') == '2'
+    assert index.get_lead_submissionid(20) == '3'
+    assert index.get_lead_submissionid('30') is None
+    assert index.last_modified == 250
+
+
+def test_incremental_refresh(tmpdir):
+    '''
+    Test that only modified submissions are queried and that a lead that
+    no longer met the cutoff is replaced by the first row of a query
+    '''
+    path = str(tmpdir.join("index.json"))
+    index = dl_cur.LeadSubmissionIndex(syn, 9, path=path)
+    index.leads = {'10': {'objectId': '2', 'createdOn': '200'}}
+    index.last_modified = 250
+    index.save()
+
+    index = dl_cur.LeadSubmissionIndex(syn, 9, path=path)
+    modified = [_row('2', '10', '200', '300', met_cutoff='false')]
+
+    def requeried():
+        yield _row('1', '10', '100', '150')
+        raise AssertionError("Only the lead submission is read")
+    with mock.patch.object(dl_cur.utils, "evaluation_queue_query",
+                           side_effect=[iter(modified),
+                                        requeried()]) as patch_query:
+        index.refresh()
+        assert "where modifiedOn >= 250" in \
+            patch_query.call_args_list[0][0][1]
+        assert "order by createdOn DESC" in \
+            patch_query.call_args_list[1][0][1]
+    assert index.get_lead_submissionid('10') == '1'
+    assert dl_cur.LeadSubmissionIndex(syn, 9, path=path).leads == \
+        index.leads
+
+
+def test_get_current_lead_subs():
+    '''
+    Test that all pending submissions are resolved in one pass
+    '''
+    rows = [_row('2', '10', '200', '250')]
+    pending = [{'objectId': '5', 'submitterId': '10'},
+               {'objectId': '6', 'submitterId': '20'}]
+    with mock.patch.object(dl_cur.utils, "evaluation_queue_query",
+                           side_effect=[iter(rows), iter(pending)]):
+        leads = dl_cur.get_current_lead_subs(syn, 9, "met_cutoff")
+    assert leads == [
+        {'submissionId': '5', 'submitterId': '10', 'leadSubmissionId': '2'},
+        {'submissionId': '6', 'submitterId': '20', 'leadSubmissionId': None}]
@@ -0,0 +1,48 @@
+import json
+import mock
+import pandas as pd
+import synapseclient
+from challengeutils import landscape_stats
+
+syn = mock.create_autospec(synapseclient.Synapse)
+
+
+def _members(*users):
+    return([{'member': {'ownerId': userid, 'userName': username}}
+            for userid, username in users])
+
+
+def test_get_landscape_stats():
+    '''
+    Test that users in many teams and challenges are looked up once
+    '''
+    landscapedf = pd.DataFrame({
+        'challenge': ['a', 'b', 'b'],
+        'participants': [1, 2, 2],
+        'preregistrants': [3.0, float('nan'), float('nan')],
+        'year': [2017, 2018, 2018]})
+    team_members = {'/teamMembers/1': _members((10, 'x'), (11, 'y')),
+                    '/teamMembers/2': _members((11, 'y')),
+                    '/teamMembers/3': _members((10, 'x'), (12, 'z'))}
+    profiles = {'10': {'ownerId': '10', 'location': 'Seattle'},
+                '11': {'ownerId': '11', 'location': ''},
+                '12': {'ownerId': '12'}}
+
+    def get_profiles(uri, body):
+        return({'list': [profiles[userid]
+                         for userid in json.loads(body)['list']]})
+
+    with mock.patch.object(syn, "_GET_paginated",
+                           side_effect=lambda uri, limit:
+                           iter(team_members[uri])) as patch_members,\
+        mock.patch.object(syn, "restPOST",
+                          side_effect=get_profiles) as patch_profiles:
+        statsdf = landscape_stats.get_landscape_stats(syn, landscapedf)
+        assert patch_members.call_count == 3
+        patch_profiles.assert_called_once_with(
+            '/userProfile', json.dumps({'list': ['10', '11', '12']}))
+    assert statsdf.to_dict('records') == [
+        {'challenges': 'a', 'teams': '1,3', 'createdOn': 2017,
+         'users': 'x,y,z', 'locations': 'Seattle'},
+        {'challenges': 'b', 'teams': '2', 'createdOn': 2018,
+         'users': 'y', 'locations': ''}]
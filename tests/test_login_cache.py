@@ -0,0 +1,82 @@
+import os
+import stat
+import time
+import mock
+import synapseclient
+from challengeutils import login_cache
+
+ENDPOINTS = {'repoEndpoint': 'https://repo/v1',
+             'authEndpoint': 'https://auth/v1',
+             'fileHandleEndpoint': 'https://file/v1',
+             'portalEndpoint': 'https://portal/'}
+
+
+def _logged_in():
+    syn = mock.create_autospec(synapseclient.Synapse)
+    syn.credentials = synapseclient.credentials.cred_data.SynapseCredentials(
+        'me', 'a2V5')
+    for point, endpoint in ENDPOINTS.items():
+        setattr(syn, point, endpoint)
+    return(syn)
+
+
+def _config(tmpdir):
+    config_path = str(tmpdir.join("synapseConfig"))
+    with open(config_path, 'w') as config_file:
+        config_file.write("[authentication]\n")
+    return(config_path)
+
+
+def test_write_read_session(tmpdir):
+    '''
+    Test that the session is only readable by the user and is read back
+    '''
+    config_path = _config(tmpdir)
+    path = str(tmpdir.join("cache", "session.json"))
+    login_cache.write_session(_logged_in(), config_path, path=path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    session = login_cache.read_session(config_path, path=path)
+    assert session['username'] == 'me'
+    assert session['apiKey'] == 'a2V5'
+    assert session['endpoints'] == ENDPOINTS
+
+
+def test_invalid_read_session(tmpdir):
+    '''
+    Test that expired sessions, sessions of a changed config and
+    sessions others can read are not used
+    '''
+    config_path = _config(tmpdir)
+    path = str(tmpdir.join("session.json"))
+    login_cache.write_session(_logged_in(), config_path, path=path, ttl=-1)
+    assert login_cache.read_session(config_path, path=path) is None
+    login_cache.write_session(_logged_in(), config_path, path=path)
+    os.chmod(path, 0o644)
+    assert login_cache.read_session(config_path, path=path) is None
+    login_cache.write_session(_logged_in(), config_path, path=path)
+    os.utime(config_path, (time.time() + 10, time.time() + 10))
+    assert login_cache.read_session(config_path, path=path) is None
+
+
+def test_cached_login(tmpdir):
+    '''
+    Test that a full login is cached and the next login uses the cache
+    without endpoint and version checks
+    '''
+    config_path = _config(tmpdir)
+    path = str(tmpdir.join("session.json"))
+    with mock.patch.object(login_cache.synapseclient, "login",
+                           return_value=_logged_in()) as patch_login,\
+            mock.patch.object(synapseclient.Synapse,
+                              "setEndpoints") as patch_endpoints:
+        syn, cached = login_cache.cached_login(config_path, path=path)
+        assert not cached
+        syn, cached = login_cache.cached_login(config_path, path=path)
+        assert cached
+        patch_login.assert_called_once_with(silent=True)
+        patch_endpoints.assert_called_once_with(
+            ENDPOINTS['repoEndpoint'], ENDPOINTS['authEndpoint'],
+            ENDPOINTS['fileHandleEndpoint'], ENDPOINTS['portalEndpoint'],
+            True)
+    assert syn.credentials.username == 'me'
+    assert syn.skip_checks
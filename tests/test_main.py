@@ -0,0 +1,75 @@
+import json
+import subprocess
+import sys
+import mock
+from challengeutils import __main__ as cli
+from challengeutils import bootstrap
+
+# Imports __main__, parses a command and prints the imported modules
+STARTUP_MODULES = '''
+import json
+import sys
+from challengeutils import __main__
+__main__.build_parser().parse_args(['changestatus', '1', 'SCORED'])
+print(json.dumps(sorted(sys.modules)))
+'''
+
+
+def _startup_modules():
+    output = subprocess.check_output([sys.executable, '-c', STARTUP_MODULES])
+    return(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+
+
+def test_lazy_imports():
+    '''
+    Test that parsing a command doesn't import heavy dependencies or
+    command modules
+    '''
+    modules = _startup_modules()
+    for module in ['pandas', 'numpy', 'synapseclient', 'synapseutils',
+                   'challengeutils.mirrorwiki', 'challengeutils.bootstrap']:
+        assert module not in modules
+
+
+def test_bootstrap_metrics():
+    '''
+    Test that the metric choices of the parser are the bootstrap metrics
+    '''
+    assert cli.BOOTSTRAP_METRICS == sorted(bootstrap.METRICS)
+
+
+def test_compare_lead_sub(capsys):
+    '''
+    Test that an infinite Bayes factor is printed as valid json
+    '''
+    args = cli.build_parser().parse_args(
+        ['compare_lead_submission', 'current.csv', 'gold.csv',
+         '--id_col', 'id', '--pred_col', 'pred', '--gold_col', 'value'])
+    result = {'current_score': 1.0, 'previous_score': float('nan'),
+              'bayes_factor': float('inf'), 'met_cutoff': True}
+    with mock.patch.object(bootstrap, "compare_to_lead_submission",
+                           return_value=result):
+        cli.command_compare_lead_sub(None, args)
+
+    def reject_constant(constant):
+        raise ValueError("{} is not valid json".format(constant))
+    assert json.loads(capsys.readouterr().out,
+                      parse_constant=reject_constant) == {
+        'current_score': 1.0, 'previous_score': 'nan',
+        'bayes_factor': 'inf', 'met_cutoff': True}
+
+
+def test_dl_cur_lead_sub(capsys):
+    '''
+    Test that the path of the downloaded lead submission is printed
+    '''
+    from challengeutils import download_current_lead_submission as dl_cur
+    args = cli.build_parser().parse_args(
+        ['download_current_lead_submission', '-i', '5', '-s', 'VALIDATED',
+         '--overwrite'])
+    with mock.patch.object(dl_cur, "download_current_lead_sub",
+                           return_value="previous_submission(1).csv") \
+            as patch_download:
+        cli.command_dl_cur_lead_sub(None, args)
+    assert patch_download.call_args[1]['overwrite']
+    assert capsys.readouterr().out == "previous_submission(1).csv\n"
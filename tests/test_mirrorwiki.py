@@ -0,0 +1,163 @@
+import mock
+import synapseclient
+import challengeutils.mirrorwiki
+
+syn = mock.create_autospec(synapseclient.Synapse)
+entity = synapseclient.Project(name="foo", id="syn123")
+destination = synapseclient.Project(name="bar", id="syn456")
+
+
+def test__rewrite_markdown():
+    '''
+    Test that wiki links and synapse ids are rewritten to the destination
+    '''
+    markdown = ("[link](#!Synapse:syn123/wiki/1) "
+                "${widget?id=syn123%2Fwiki%2F1} syn123")
+    rewritten = challengeutils.mirrorwiki._rewrite_markdown(
+        markdown, entity, destination, {'1': '2'})
+    assert rewritten == ("[link](#!Synapse:syn456/wiki/2) "
+                         "${widget?id=syn456%2Fwiki%2F2} syn456")
+
+
+def test_etag__state_unchanged():
+    '''
+    Test that the etag is compared when available
+    '''
+    recorded = {'id': '1', 'etag': 'a', 'modifiedOn': 'x'}
+    assert challengeutils.mirrorwiki._state_unchanged(
+        recorded, {'id': '1', 'etag': 'a', 'modifiedOn': 'y'})
+    assert not challengeutils.mirrorwiki._state_unchanged(
+        recorded, {'id': '1', 'etag': 'b', 'modifiedOn': 'x'})
+    assert not challengeutils.mirrorwiki._state_unchanged(
+        None, {'id': '1', 'etag': 'a', 'modifiedOn': 'x'})
+
+
+def test_modifiedon__state_unchanged():
+    '''
+    Test that modifiedOn is compared when there is no etag
+    '''
+    recorded = {'id': '1', 'etag': None, 'modifiedOn': 'x'}
+    assert challengeutils.mirrorwiki._state_unchanged(
+        recorded, {'id': '1', 'etag': None, 'modifiedOn': 'x'})
+    assert not challengeutils.mirrorwiki._state_unchanged(
+        recorded, {'id': '1', 'etag': None, 'modifiedOn': 'y'})
+
+
+def test_roundtrip_manifest(tmpdir):
+    '''
+    Test that mirrors between different projects are kept separately
+    '''
+    manifest_path = str(tmpdir.join("manifest.json"))
+    states = {'Home': {'md5': 'abc'}}
+    challengeutils.mirrorwiki.save_manifest(
+        manifest_path, entity, destination, states)
+    challengeutils.mirrorwiki.save_manifest(
+        manifest_path, destination, entity, {})
+    assert challengeutils.mirrorwiki.load_manifest(
+        manifest_path, entity, destination) == states
+    assert challengeutils.mirrorwiki.load_manifest(
+        manifest_path, destination, entity) == {}
+
+
+def test_unchanged_mirrorwiki(tmpdir):
+    '''
+    Test that pages whose headers are unchanged are not downloaded
+    '''
+    manifest_path = str(tmpdir.join("manifest.json"))
+    source_state = {'id': '1', 'etag': 'a', 'modifiedOn': 'x'}
+    destination_state = {'id': '2', 'etag': 'b', 'modifiedOn': 'y'}
+    challengeutils.mirrorwiki.save_manifest(
+        manifest_path, entity, destination,
+        {'Home': {'source': source_state,
+                  'destination': destination_state,
+                  'md5': 'abc'}})
+    wiki_states = {'/entity/syn123/wiki2/1': source_state,
+                   '/entity/syn456/wiki2/2': destination_state}
+    with mock.patch.object(syn, "get", side_effect=[entity, destination]),\
+        mock.patch.object(syn, "getWikiHeaders",
+                          side_effect=[[{'title': 'Home', 'id': '1'}],
+                                       [{'title': 'Home', 'id': '2'}]]),\
+        mock.patch.object(syn, "restGET",
+                          side_effect=lambda uri: wiki_states[uri]),\
+            mock.patch.object(syn, "getWiki") as patch_get_wiki:
+        challengeutils.mirrorwiki.mirrorwiki(
+            syn, "syn123", "syn456", manifest_path=manifest_path)
+        patch_get_wiki.assert_not_called()
+
+
+def test_report_mirrorwiki_to_destinations():
+    '''
+    Test that a failing destination does not stop the other destinations
+    '''
+    source_wiki = synapseclient.Wiki(
+        owner=entity, title='Home', markdown='syn123', id='1',
+        attachmentFileHandleIds=[])
+    destination_wiki = synapseclient.Wiki(
+        owner=destination, title='Home', markdown='', id='2',
+        attachmentFileHandleIds=[])
+    missing = synapseclient.Project(name="baz", id="syn789")
+    projects = {'syn123': entity, 'syn456': destination, 'syn789': missing}
+
+    def get_wiki_headers(owner):
+        if owner.id == 'syn789':
+            raise synapseclient.exceptions.SynapseHTTPError("no wiki")
+        wikiid = '1' if owner.id == 'syn123' else '2'
+        return([{'title': 'Home', 'id': wikiid}])
+
+    def get_wiki(owner, wikiid):
+        return(source_wiki if owner.id == 'syn123' else destination_wiki)
+
+    with mock.patch.object(syn, "get",
+                           side_effect=lambda synid, **kwargs:
+                           projects[synid]),\
+        mock.patch.object(syn, "getWikiHeaders",
+                          side_effect=get_wiki_headers),\
+        mock.patch.object(syn, "getWiki", side_effect=get_wiki),\
+            mock.patch.object(syn, "store",
+                              side_effect=lambda wiki: wiki) as patch_store:
+        report = challengeutils.mirrorwiki.mirrorwiki_to_destinations(
+            syn, "syn123", ["syn456", "syn789"])
+        patch_store.assert_called_once_with(destination_wiki)
+    assert destination_wiki.markdown == 'syn456'
+    assert report['syn456'] == {'status': 'success', 'updated': ['Home'],
+                                'error': None}
+    assert report['syn789']['status'] == 'failure'
+
+
+def test_unique_mirrorwiki_to_destinations():
+    '''
+    Test that a destination listed twice is mirrored once and that pages
+    no destination has are not fetched
+    '''
+    source_wiki = synapseclient.Wiki(
+        owner=entity, title='Home', markdown='', id='1',
+        attachmentFileHandleIds=[])
+    destination_wiki = synapseclient.Wiki(
+        owner=destination, title='Home', markdown='', id='2',
+        attachmentFileHandleIds=[])
+    projects = {'syn123': entity, 'syn456': destination}
+
+    def get_wiki_headers(owner):
+        if owner.id == 'syn123':
+            return([{'title': 'Home', 'id': '1'},
+                    {'title': 'Extra', 'id': '3'}])
+        return([{'title': 'Home', 'id': '2'}])
+
+    def get_wiki(owner, wikiid):
+        return(source_wiki if owner.id == 'syn123' else destination_wiki)
+
+    with mock.patch.object(syn, "get",
+                           side_effect=lambda synid, **kwargs:
+                           projects[synid]),\
+        mock.patch.object(syn, "getWikiHeaders",
+                          side_effect=get_wiki_headers),\
+        mock.patch.object(syn, "getWiki", side_effect=get_wiki) \
+            as patch_get_wiki,\
+            mock.patch.object(syn, "store",
+                              side_effect=lambda wiki: wiki) as patch_store:
+        report = challengeutils.mirrorwiki.mirrorwiki_to_destinations(
+            syn, "syn123", ["syn456", "syn456"], force_merge=True)
+        patch_store.assert_called_once_with(destination_wiki)
+        assert mock.call(entity, '3') not in patch_get_wiki.call_args_list
+    assert report == {'syn456': {'status': 'success', 'updated': ['Home'],
+                                 'error': None}}
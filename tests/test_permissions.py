@@ -54,3 +54,55 @@ def test_wrong_permission_level():
         challengeutils.permissions._set_permissions(
             syn, synapseclient.Entity(), principalid="3",
             permission_level="foo")
+
+
+def test__apply_acl_changes():
+    '''
+    Test adding, changing and removing permissions of an ACL
+    '''
+    acl = {'resourceAccess': [
+        {'principalId': 1, 'accessType': ['READ']},
+        {'principalId': 2, 'accessType': ['READ']},
+        {'principalId': 3, 'accessType': ['READ']}]}
+    diff = challengeutils.permissions._apply_acl_changes(
+        acl, {1: ['READ'], 2: ['DOWNLOAD', 'READ'], 3: [], 4: ['READ']})
+    assert diff == [
+        {'principalId': 2, 'before': ['READ'], 'after': ['DOWNLOAD', 'READ']},
+        {'principalId': 3, 'before': ['READ'], 'after': []},
+        {'principalId': 4, 'before': [], 'after': ['READ']}]
+    assert acl == {'resourceAccess': [
+        {'principalId': 1, 'accessType': ['READ']},
+        {'principalId': 2, 'accessType': ['DOWNLOAD', 'READ']},
+        {'principalId': 4, 'accessType': ['READ']}]}
+
+
+def test_dryrun_set_bulk_permissions():
+    '''
+    Test that each ACL is fetched once and nothing is stored on a dry run
+    '''
+    def rest_get(uri):
+        if uri.endswith('/benefactor'):
+            return({'id': 'syn123'})
+        return({'resourceAccess': []})
+
+    with patch.object(syn, "restGET", side_effect=rest_get) as patch_get,\
+            patch.object(syn, "restPUT") as patch_put:
+        results = challengeutils.permissions.set_bulk_permissions(
+            syn, {'syn123': {'3': 'view', '4': 'download'},
+                  '9614112': {'3': 'score'}},
+            dry_run=True)
+        assert patch_get.call_count == 3
+        patch_put.assert_not_called()
+    assert results['syn123']['diff'] == [
+        {'principalId': 3, 'before': [], 'after': ['READ']},
+        {'principalId': 4, 'before': [], 'after': ['DOWNLOAD', 'READ']}]
+    assert results['9614112']['diff'] == [
+        {'principalId': 3, 'before': [],
+         'after': sorted(challengeutils.permissions.SCORE)}]
+
+
+def test_wrong_permission_level_set_bulk_permissions():
+    with pytest.raises(ValueError,
+                       match=r'9614112: permission_level must be one of.*'):
+        challengeutils.permissions.set_bulk_permissions(
+            syn, {'9614112': {'3': 'download'}})
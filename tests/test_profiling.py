@@ -0,0 +1,66 @@
+import json
+import logging
+import mock
+import requests
+from challengeutils import profiling
+
+
+def test_normalize_endpoint():
+    '''
+    Test that ids and the query are removed from urls
+    '''
+    assert profiling.normalize_endpoint(
+        "https://repo-prod.prod.sagebase.org/repo/v1/entity/syn123/"
+        "version/2?limit=10") == "/repo/v1/entity/{id}/version/{id}"
+    assert profiling.normalize_endpoint(
+        "/evaluation/9614112/submission/bundle/all") == \
+        "/evaluation/{id}/submission/bundle/all"
+
+
+def _response(status_code, content=b'{}'):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    return(response)
+
+
+def test_rest_profiler(tmpdir):
+    '''
+    Test that the requests of a Synapse object are recorded per endpoint
+    '''
+    syn = mock.Mock()
+    syn._requests_session = requests.Session()
+    responses = [_response(503), _response(200, b'{"a": 1}'),
+                 _response(200)]
+    profiler = profiling.RestProfiler()
+    with mock.patch.object(syn._requests_session, "request",
+                           side_effect=responses):
+        profiler.install(syn)
+        syn._requests_session.get("https://repo/v1/entity/syn1")
+        syn._requests_session.get("https://repo/v1/entity/syn2")
+        syn._requests_session.post("https://repo/v1/userProfile",
+                                   data='{"list": []}')
+    summary = {row['endpoint']: row for row in profiler.summary()}
+    entity = summary['/v1/entity/{id}']
+    assert entity['method'] == 'GET'
+    assert entity['calls'] == 2
+    assert entity['retried'] == 1
+    assert entity['bytesReceived'] == 10
+    assert sum(entity['histogram']) == 2
+    assert summary['/v1/userProfile']['bytesSent'] == 12
+    assert '/v1/entity/{id}' in profiler.format_table()
+    path = str(tmpdir.join("profile.json"))
+    profiler.write_json(path)
+    with open(path) as profile_file:
+        assert len(json.load(profile_file)['endpoints']) == 2
+
+
+def test_profile_command(caplog):
+    '''
+    Test that the CPU and memory profiles are logged
+    '''
+    caplog.set_level(logging.INFO)
+    with profiling.profile_command(cpu=True, memory=True):
+        sorted(range(1000), reverse=True)
+    assert "CPU profile" in caplog.text
+    assert "Memory allocated by line" in caplog.text
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import stat
+import mock
+import synapseclient
+from challengeutils.submission_cache import SubmissionCache, unique_path
+
+syn = mock.create_autospec(synapseclient.Synapse)
+CONTENT = b"id,value\n1,2\n"
+MD5 = hashlib.md5(CONTENT).hexdigest()
+
+
+def _get_submission(submissionid, downloadFile=True, downloadLocation=None):
+    bundle = {'entity': {'dataFileHandleId': '55'},
+              'fileHandles': [{'id': '55', 'contentMd5': MD5}]}
+    submission = synapseclient.Submission(
+        id=submissionid, evaluationId='1', entityId='syn1', versionNumber=1,
+        entityBundleJSON=json.dumps(bundle))
+    if downloadFile:
+        path = os.path.join(downloadLocation, "prediction.csv")
+        with open(path, 'wb') as prediction_file:
+            prediction_file.write(CONTENT)
+        submission.filePath = path
+    return(submission)
+
+
+def test_unique_path(tmpdir):
+    '''
+    Test that existing files are not overwritten
+    '''
+    path = str(tmpdir.join("previous_submission.csv"))
+    assert unique_path(path) == path
+    tmpdir.join("previous_submission.csv").write("")
+    assert unique_path(path) == str(tmpdir.join("previous_submission(1).csv"))
+
+
+def test_hit_get_submission_file(tmpdir):
+    '''
+    Test that a cached submission file is not downloaded again and
+    an existing file is kept
+    '''
+    cache = SubmissionCache(str(tmpdir.join("cache")))
+    path = str(tmpdir.join("previous_submission.csv"))
+    with mock.patch.object(syn, "getSubmission",
+                           side_effect=_get_submission) as patch_get:
+        first = cache.get_submission_file(syn, '2', path)
+        second = cache.get_submission_file(syn, '2', path)
+        downloads = [call for call in patch_get.call_args_list
+                     if 'downloadLocation' in call[1]]
+        assert len(downloads) == 1
+    assert first == path
+    assert second == str(tmpdir.join("previous_submission(1).csv"))
+    assert open(second, 'rb').read() == CONTENT
+    assert os.listdir(cache.cache_dir) == ["55_" + MD5]
+    # A copy can be modified without changing the cached file
+    with open(second, 'ab') as copied_file:
+        copied_file.write(b"changed")
+    cached_path = os.path.join(cache.cache_dir, "55_" + MD5)
+    assert open(cached_path, 'rb').read() == CONTENT
+    assert not os.stat(cached_path).st_mode & stat.S_IWUSR
+
+
+def test_overwrite_get_submission_file(tmpdir):
+    '''
+    Test that an existing file is replaced with overwrite
+    '''
+    cache = SubmissionCache(str(tmpdir.join("cache")))
+    tmpdir.join("previous_submission.csv").write("stale")
+    path = str(tmpdir.join("previous_submission.csv"))
+    with mock.patch.object(syn, "getSubmission", side_effect=_get_submission):
+        assert cache.get_submission_file(syn, '2', path, link=True,
+                                         overwrite=True) == path
+    assert open(path, 'rb').read() == CONTENT
+    assert sorted(os.listdir(str(tmpdir))) == [
+        "cache", "previous_submission.csv"]
+
+
+def test_evict(tmpdir):
+    '''
+    Test that the least recently used files are removed first
+    '''
+    cache = SubmissionCache(str(tmpdir.join("cache")), max_size=10)
+    for age, name in enumerate(["new", "old"]):
+        path = os.path.join(cache.cache_dir, name)
+        with open(path, 'w') as cached_file:
+            cached_file.write("12345678")
+        os.utime(path, (1000 - age, 1000 - age))
+    cache.evict()
+    assert os.listdir(cache.cache_dir) == ["new"]
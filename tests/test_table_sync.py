@@ -0,0 +1,83 @@
+import mock
+import pandas as pd
+import pytest
+import synapseclient
+from challengeutils import table_sync
+
+syn = mock.create_autospec(synapseclient.Synapse)
+
+
+def _database():
+    return(pd.DataFrame({'submissionId': [1, 2, 3],
+                         'team': ['a', 'b', None]},
+                        index=['1_1', '2_1', '3_1']))
+
+
+def test_diff_table():
+    '''
+    Test that rows are classified as insert, update or delete
+    '''
+    new_dataset = pd.DataFrame({'team': ['a', 'c', 'd'],
+                                'submissionId': ['1', '2', '4']})
+    changes = table_sync.diff_table(_database(), new_dataset,
+                                    ['submissionId'], delete=True)
+    assert changes['insert'].to_dict('records') == [
+        {'submissionId': '4', 'team': 'd'}]
+    assert list(changes['update'].index) == ['2_1']
+    assert changes['update'].to_dict('records') == [
+        {'submissionId': '2', 'team': 'c'}]
+    assert list(changes['delete'].index) == ['3_1']
+
+
+def test_nodelete_diff_table():
+    '''
+    Test that missing values are equal and rows are only deleted
+    when asked to
+    '''
+    new_dataset = pd.DataFrame({'submissionId': [3], 'team': [None]})
+    changes = table_sync.diff_table(_database(), new_dataset,
+                                    ['submissionId'])
+    assert all(changes[change].empty for change in changes)
+
+
+def test_duplicated_diff_table():
+    '''
+    Test that the key must be unique
+    '''
+    new_dataset = pd.DataFrame({'submissionId': [1, 1], 'team': ['a', 'b']})
+    with pytest.raises(ValueError, match="must be unique"):
+        table_sync.diff_table(_database(), new_dataset, ['submissionId'])
+
+
+def test_chunks_sync_table():
+    '''
+    Test that the changes are uploaded in chunks and failed chunks
+    are retried
+    '''
+    new_dataset = pd.DataFrame({'submissionId': range(1, 11),
+                                'team': ['a'] * 10})
+    error = synapseclient.exceptions.SynapseHTTPError("503")
+    with mock.patch.object(syn, "get"),\
+        mock.patch.object(table_sync, "Table"),\
+        mock.patch.object(syn, "store",
+                          side_effect=[error] + [None] * 10) as patch_store,\
+            mock.patch.object(table_sync.time, "sleep"):
+        summary = table_sync.sync_table(
+            syn, "syn1", new_dataset, ['submissionId'],
+            database=_database(), max_chunk_bytes=1)
+    assert summary == {'inserted': 7, 'updated': 2, 'deleted': 0}
+    assert patch_store.call_count == 10
+
+
+def test_large_diff_table():
+    '''
+    Test that a 1M row table is diffed
+    '''
+    size = 1000000
+    database = pd.DataFrame({'submissionId': range(size),
+                             'team': ['a'] * size})
+    new_dataset = database.copy()
+    new_dataset.loc[5, 'team'] = 'b'
+    changes = table_sync.diff_table(database, new_dataset, ['submissionId'])
+    assert len(changes['update']) == 1
+    assert changes['insert'].empty
@@ -0,0 +1,151 @@
+import email.utils
+import io
+import time
+import mock
+import pytest
+import requests
+from challengeutils import throttle
+
+
+def _response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response.raw = io.BytesIO()
+    return(response)
+
+
+def _syn():
+    syn = mock.Mock()
+    syn._requests_session = requests.Session()
+    return(syn)
+
+
+def test_token_bucket():
+    '''
+    Test that a bucket allows a burst of capacity tokens and then waits
+    '''
+    bucket = throttle.TokenBucket(2)
+    with mock.patch.object(throttle.time, "sleep") as patch_sleep:
+        bucket.acquire()
+        bucket.acquire()
+        patch_sleep.assert_not_called()
+        with mock.patch.object(throttle.time, "time",
+                               side_effect=[bucket._state['updated'],
+                                            bucket._state['updated'] + 1]):
+            bucket.acquire()
+        assert patch_sleep.call_count == 1
+        assert patch_sleep.call_args[0][0] == pytest.approx(0.5, abs=0.01)
+
+
+def test_shared_token_bucket(tmpdir):
+    '''
+    Test that buckets kept in the same file share their tokens
+    '''
+    path = str(tmpdir.join("bucket", "rate_limit.json"))
+    first = throttle.TokenBucket(1, capacity=2, path=path)
+    second = throttle.TokenBucket(1, capacity=2, path=path)
+    with mock.patch.object(throttle.time, "sleep") as patch_sleep,\
+            mock.patch.object(throttle.time, "time", return_value=100):
+        first.acquire()
+        second.acquire()
+        patch_sleep.side_effect = ValueError("waited")
+        with pytest.raises(ValueError, match="waited"):
+            first.acquire()
+
+
+def test_invalid_token_bucket():
+    '''
+    Test that the rate must be positive
+    '''
+    with pytest.raises(ValueError, match="must be positive"):
+        throttle.TokenBucket(0)
+
+
+def test_retry_after():
+    '''
+    Test that Retry-After is read in seconds and as an HTTP date
+    '''
+    assert throttle.retry_after(_response(429, {'Retry-After': '3'})) == 3
+    date = email.utils.formatdate(time.time() + 100, usegmt=True)
+    wait = throttle.retry_after(_response(503, {'Retry-After': date}))
+    assert 95 < wait <= 100
+    assert throttle.retry_after(_response(503)) is None
+    assert throttle.retry_after(_response(503, {'Retry-After': 'x'})) is None
+
+
+def test_backoff_delay():
+    '''
+    Test that the backoff is jittered and bounded
+    '''
+    delays = [throttle.backoff_delay(10, base=1, max_wait=5)
+              for _ in range(100)]
+    assert all(0 <= delay <= 5 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_install():
+    '''
+    Test that throttled requests are retried after Retry-After and
+    connection errors after a backoff
+    '''
+    syn = _syn()
+    responses = [_response(429, {'Retry-After': '7'}),
+                 requests.exceptions.ConnectionError("reset"),
+                 _response(200)]
+    with mock.patch.object(syn._requests_session, "request",
+                           side_effect=responses) as patch_request,\
+            mock.patch.object(throttle.time, "sleep") as patch_sleep,\
+            mock.patch.object(throttle, "backoff_delay", return_value=2):
+        throttle.install(syn)
+        response = syn._requests_session.get("https://repo/v1/entity/syn1")
+    assert response.status_code == 200
+    assert patch_request.call_count == 3
+    assert [call[0][0] for call in patch_sleep.call_args_list] == [7, 2]
+    assert responses[0].raw.closed
+    assert not responses[2].raw.closed
+
+
+def test_install_single_retry_loop():
+    '''
+    Test that the retries of the Synapse client are turned off
+    '''
+    syn = _syn()
+    syn._build_retry_policy.return_value = {'retries': 60, 'wait': 1}
+    throttle.install(syn)
+    assert syn._build_retry_policy({'wait': 2}) == {'retries': 0,
+                                                    'wait': 1}
+
+
+def test_giveup_install():
+    '''
+    Test that the last response is returned after all retries and that
+    uploads of open files are not retried
+    '''
+    syn = _syn()
+    with mock.patch.object(syn._requests_session, "request",
+                           return_value=_response(503)) as patch_request,\
+            mock.patch.object(throttle.time, "sleep"):
+        throttle.install(syn, retries=2)
+        response = syn._requests_session.get("https://repo/v1/entity/syn1")
+        assert response.status_code == 503
+        assert patch_request.call_count == 3
+        syn._requests_session.put("https://file/upload",
+                                  data=io.BytesIO(b"content"))
+        assert patch_request.call_count == 4
+        syn._requests_session.get("https://file/download", stream=True)
+        assert patch_request.call_count == 5
+
+
+def test_throttled():
+    '''
+    Test that the requests of a Synapse object are throttled once
+    '''
+    syn = _syn()
+    with mock.patch.object(throttle, "install",
+                           wraps=throttle.install) as patch_install:
+        throttle.throttled(syn, rate=5, path=None)
+        throttle.throttled(syn, rate=5, path=None)
+    patch_install.assert_called_once()
+    assert patch_install.call_args[1]['bucket'].rate == 5
+    assert throttle.throttled(_syn(), rate=0) is not None
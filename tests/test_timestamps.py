@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+from challengeutils import timestamps
+
+
+def test_mixed_to_epoch_ms():
+    '''
+    Test that ISO timestamps and epoch milliseconds are converted together
+    '''
+    values = ['2017-01-01T00:00:00.123Z', '1483228800000', 1483228800001,
+              '2017-01-01T00:00:01Z', '2017-01-01T01:00:00+01:00']
+    assert timestamps.to_epoch_ms(values).tolist() == [
+        1483228800123, 1483228800000, 1483228800001, 1483228801000,
+        1483228800000]
+
+
+def test_index_to_epoch_ms():
+    '''
+    Test that the index of a Series is kept
+    '''
+    values = pd.Series([1483228800000, 1483228800001], index=[5, 3])
+    epoch_ms = timestamps.to_epoch_ms(values)
+    assert epoch_ms.dtype == 'int64'
+    assert epoch_ms.to_dict() == {5: 1483228800000, 3: 1483228800001}
+
+
+def test_missing_to_epoch_ms():
+    '''
+    Test that missing values are NaT as datetimes and can't be epoch
+    milliseconds
+    '''
+    values = ['2017-01-01T00:00:00.000Z', None]
+    datetimes = timestamps.to_datetime(values)
+    assert datetimes[0] == pd.Timestamp('2017-01-01', tz='UTC')
+    assert pd.isnull(datetimes[1])
+    with pytest.raises(ValueError, match="can't be missing"):
+        timestamps.to_epoch_ms(values)
@@ -1,3 +1,4 @@
+import json
 import mock
 import pytest
 import re
@@ -108,3 +109,24 @@ def test_topublic_update_single_submission_status():
         add_annotations, is_private=False)
     expected_status = {'annotations': expected_annot}
     assert new_status == expected_status
+
+
+def test_batches_update_submission_statuses():
+    '''
+    Test that the statuses are stored in batches chained by batch token
+    '''
+    statuses = [{'id': str(objectid)} for objectid in range(5)]
+    with mock.patch.object(syn, "restPUT",
+                           side_effect=[{'nextUploadToken': 'a'},
+                                        {'nextUploadToken': 'b'},
+                                        {}]) as patch_put:
+        challengeutils.utils.update_submission_statuses(
+            syn, 9, statuses, batch_size=2)
+    batches = [json.loads(call[0][1]) for call in patch_put.call_args_list]
+    assert [len(batch['statuses']) for batch in batches] == [2, 2, 1]
+    assert [batch['isFirstBatch'] for batch in batches] == \
+        [True, False, False]
+    assert [batch['isLastBatch'] for batch in batches] == \
+        [False, False, True]
+    assert [batch.get('batchToken') for batch in batches] == \
+        [None, 'a', 'b']
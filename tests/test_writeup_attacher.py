@@ -0,0 +1,59 @@
+import mock
+import synapseclient
+from challengeutils import utils, writeup_attacher
+
+
+def test_attach_writeup():
+    '''
+    Test that only the submissions whose write up changed are fetched and
+    stored, with the latest write up of their team
+    '''
+    writeups = [{'team': 'a', 'entityId': 'syn1', 'archived': 'syn11',
+                 'createdOn': '100'},
+                {'team': 'b', 'entityId': 'syn2', 'archived': 'syn22',
+                 'createdOn': '300'},
+                {'team': 'b', 'entityId': 'syn0', 'archived': 'syn00',
+                 'createdOn': '200'}]
+    submissions = [
+        {'objectId': '1', 'team': 'a', 'writeUp': 'syn1',
+         'archivedWriteUp': 'syn11'},
+        {'objectId': '2', 'team': 'b', 'writeUp': None,
+         'archivedWriteUp': None},
+        {'objectId': '3', 'team': 'c', 'writeUp': None,
+         'archivedWriteUp': None}]
+    syn = mock.create_autospec(synapseclient.Synapse)
+    syn.getSubmissionStatus.side_effect = \
+        lambda objectid: synapseclient.evaluation.SubmissionStatus(
+            id=objectid, status='SCORED', annotations={})
+    with mock.patch.object(utils, "evaluation_queue_query",
+                           side_effect=[iter(writeups), iter(submissions)]),\
+        mock.patch.object(utils, "update_submission_statuses") \
+            as patch_update:
+        summary = writeup_attacher.attach_writeup(syn, 9, 8)
+        stored = patch_update.call_args[0][2]
+    syn.getSubmissionStatus.assert_called_once_with('2')
+    assert summary == {'attached': ['2'], 'unchanged': ['1'],
+                       'no_writeup': ['c']}
+    assert [status.id for status in stored] == ['2']
+    assert stored[0]['annotations']['stringAnnos'] == [
+        {'key': 'writeUp', 'value': 'syn2', 'isPrivate': False},
+        {'key': 'archivedWriteUp', 'value': 'syn22', 'isPrivate': False}]
+
+
+def test_unchanged_attach_writeup():
+    '''
+    Test that no submission status is fetched when nothing changed
+    '''
+    writeups = [{'team': 'a', 'entityId': 'syn1', 'archived': 'syn11',
+                 'createdOn': '100'}]
+    submissions = [{'objectId': '1', 'team': 'a', 'writeUp': 'syn1',
+                    'archivedWriteUp': 'syn11'}]
+    syn = mock.create_autospec(synapseclient.Synapse)
+    with mock.patch.object(utils, "evaluation_queue_query",
+                           side_effect=[iter(writeups), iter(submissions)]),\
+        mock.patch.object(utils, "update_submission_statuses") \
+            as patch_update:
+        summary = writeup_attacher.attach_writeup(syn, 9, 8)
+        patch_update.assert_not_called()
+    syn.getSubmissionStatus.assert_not_called()
+    assert summary['unchanged'] == ['1']